@@ -0,0 +1,256 @@
+"""
+Benchmark jalur data dashboard_k3 dengan data sintetis (tanpa browser / Streamlit server).
+
+Contoh:
+    python bench_k3.py                          # ukuran 1k, 100k, 1M
+    python bench_k3.py --sizes 1000 100000 --output hasil.json
+    python bench_k3.py --sizes 1000 --compare bench_results.json
+
+Setiap ukuran dijalankan di folder sementara berisi CSV sintetis (manhours, accident,
+patrol + foto dummy, manpower). Tiap tahap dicatat wall time dan peak memory
+(tracemalloc), lalu ditulis sebagai JSON agar bisa dibandingkan antar run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import dashboard_k3 as k3
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+PROYEK = ["PT. GEA", "PT. Glico", "PT. Ciomas", "PT. Asahi", "PT. Lain"]
+
+
+# =========================
+# Stub Streamlit
+# =========================
+class StubStreamlit:
+    """Pengganti modul st: widget mengembalikan nilai default, output diabaikan."""
+
+    def __init__(self, values=None):
+        self.session_state = {"logged_in": False}
+        self.sidebar = self
+        self.values = values or {}
+
+    def __getattr__(self, name):
+        def widget(*args, **kwargs):
+            label = args[0] if args else kwargs.get("label")
+            if isinstance(label, str) and label in self.values:
+                return self.values[label]
+            if name in ("selectbox", "radio"):
+                options = args[1] if len(args) > 1 else kwargs.get("options", [])
+                return options[0] if options else None
+            if name in ("button", "checkbox", "toggle"):
+                return False
+            if name == "columns":
+                spec = args[0]
+                return [contextlib.nullcontext()] * (spec if isinstance(spec, int) else len(spec))
+            if name == "tabs":
+                return [contextlib.nullcontext() for _ in args[0]]
+            if name in ("expander", "container", "spinner", "empty", "form"):
+                return contextlib.nullcontext(self)
+            return None
+        return widget
+
+
+# =========================
+# Data sintetis
+# =========================
+def _dates(rng, n, years=3):
+    start = np.datetime64("2023-01-01")
+    return pd.to_datetime(start + rng.integers(0, 365 * years, n).astype("timedelta64[D]"))
+
+def make_photos(folder, count):
+    from PIL import Image
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"dummy_{i:04d}.jpg")
+        Image.new("RGB", (1600, 1200), (i * 37 % 255, 120, 90)).save(path, "JPEG", quality=80)
+        paths.append(path)
+    return paths
+
+def generate(size, workdir, photos=50, seed=0):
+    """Tulis empat CSV sintetis berukuran `size` baris ke workdir."""
+    rng = np.random.default_rng(seed)
+    manpower = rng.integers(5, 200, size)
+    jam = rng.integers(4, 12, size)
+    pd.DataFrame({
+        "Tanggal": _dates(rng, size), "Manpower": manpower,
+        "Jam Kerja": jam, "Total Manhours": manpower * jam,
+    }).to_csv(os.path.join(workdir, k3.FILE_MANHOURS), index=False, date_format="%Y-%m-%d")
+
+    pd.DataFrame({
+        "Tanggal": _dates(rng, size),
+        "Jenis": rng.choice(k3.JENIS_ACCIDENT, size),
+        "Kronologi": rng.choice(["Pekerja terpeleset di area basah",
+                                 "Percikan las mengenai material mudah terbakar",
+                                 "Tangan tergores saat memotong pipa"], size),
+    }).to_csv(os.path.join(workdir, k3.FILE_ACCIDENT), index=False, date_format="%Y-%m-%d")
+
+    foto_paths = make_photos(os.path.join(workdir, "uploads", "bench"), photos)
+    tanggal = _dates(rng, size)
+    status = rng.choice(k3.STATUS_PATROL, size)
+    close = tanggal + pd.to_timedelta(rng.integers(0, 30, size), unit="D")
+    pd.DataFrame({
+        "Kode Temuan": [f"SP-BENCH-{i:07d}" for i in range(size)],
+        "Tanggal": tanggal,
+        "Jenis Temuan": rng.choice(k3.JENIS_TEMUAN, size),
+        "Ditemukan Oleh": rng.choice([f"Petugas {i}" for i in range(20)], size),
+        "Status": status,
+        "Deskripsi": rng.choice(["APAR terhalang material", "Pekerja tanpa helm",
+                                 "Scaffolding tanpa tag"], size),
+        "Foto": rng.choice(foto_paths, size) if foto_paths else "",
+        "Tanggal Close": np.where(status == "Close", close.strftime("%Y-%m-%d"), ""),
+        "Catatan Progress": "",
+    }).to_csv(os.path.join(workdir, k3.FILE_PATROL), index=False, date_format="%Y-%m-%d")
+
+    pd.DataFrame({
+        "Tanggal": _dates(rng, size),
+        "Proyek": rng.choice(PROYEK, size),
+        "Jumlah Pekerja": rng.integers(1, 80, size),
+        "Nama Pekerja": "",
+    }).to_csv(os.path.join(workdir, k3.FILE_MANPOWER), index=False, date_format="%Y-%m-%d")
+
+
+# =========================
+# Pengukuran
+# =========================
+def measure(results, size, stage, func, rows=None):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({
+        "size": size, "stage": stage, "rows": rows if rows is not None else size,
+        "wall_s": round(wall, 4), "peak_mb": round(peak / 2**20, 2),
+    })
+    print(f"{size:>9} {stage:<28} {wall:9.3f} s {peak / 2**20:9.1f} MB")
+
+def upload_photos(paths):
+    """Kirim foto ke antrian upload lalu tunggu sampai semua selesai ditulis."""
+    for path in paths:
+        with open(path, "rb") as f:
+            k3.submit_upload("photo", f.read(), os.path.basename(path))
+    if not k3.wait_uploads(timeout=600):
+        raise RuntimeError("upload foto belum selesai setelah 600 detik")
+
+def reset_state():
+    """Kosongkan cache/rollup proses agar tiap ukuran mulai dingin."""
+    k3._LOCAL_RESOURCES.clear()
+
+def run_size(size, results, export_rows, photos):
+    workdir = tempfile.mkdtemp(prefix=f"k3bench_{size}_")
+    cwd = os.getcwd()
+    real_st = k3.st
+    try:
+        os.chdir(workdir)
+        generate(size, workdir, photos=photos)
+        reset_state()
+        if k3.STORAGE_BACKEND == "sqlite":
+            measure(results, size, "impor CSV -> SQLite", k3.import_csv_to_sqlite)
+        stub = StubStreamlit()
+        k3.st = stub
+        filters = {"year": 2024, "month": 6}
+
+        measure(results, size, "load_data (dingin)", lambda: [k3.load_data(f) for f in k3.DATASETS])
+        measure(results, size, "load_data (cache)", lambda: [k3.load_data(f) for f in k3.DATASETS])
+        measure(results, size, "filter tahun/bulan", lambda: [k3.load_data(f, filters=filters) for f in k3.DATASETS])
+        measure(results, size, "dashboard (dingin)", k3.dashboard)
+        measure(results, size, "dashboard (hangat)", k3.dashboard)
+        stub.values = {"Filter Tahun": "2024", "Filter Bulan": "Jun"}
+        measure(results, size, "dashboard (filter)", k3.dashboard)
+        stub.values = {}
+        measure(results, size, "dashboard_manpower", k3.dashboard_manpower)
+        stub.values = {"Filter Proyek / Lokasi": "PT. GEA", "Filter Tahun": "2024", "Filter Bulan": "Jun"}
+        measure(results, size, "dashboard_manpower (filter)", k3.dashboard_manpower)
+        stub.values = {}
+
+        row = {"Tanggal": "2025-01-01", "Manpower": 10, "Jam Kerja": 8, "Total Manhours": 80}
+        measure(results, size, "append_rows (1 baris)",
+                lambda: k3.append_rows(k3.FILE_MANHOURS, [row], k3.COLUMNS_MANHOURS), rows=1)
+        df_man = k3.load_data(k3.FILE_MANHOURS)
+        measure(results, size, "save_data (tulis ulang)", lambda: k3.save_data(k3.FILE_MANHOURS, df_man))
+
+        df_patrol = k3.load_data(k3.FILE_PATROL).head(export_rows)
+        if k3.HAS_IMG_TO_EXCEL:
+            measure(results, size, "export patrol (dingin)",
+                    lambda: k3.build_patrol_excel(df_patrol), rows=len(df_patrol))
+            measure(results, size, "export patrol (thumb cache)",
+                    lambda: k3.build_patrol_excel(df_patrol), rows=len(df_patrol))
+
+        photo_dir = os.path.join(workdir, "uploads", "bench")
+        uploads = [os.path.join(photo_dir, name) for name in sorted(os.listdir(photo_dir))]
+        measure(results, size, "upload foto (antrian)", lambda: upload_photos(uploads), rows=len(uploads))
+    finally:
+        k3.st = real_st
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(current, baseline_path, threshold):
+    """Bandingkan wall time dengan run sebelumnya; True jika ada regresi di atas threshold."""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["stage"]): r for r in json.load(f)["results"]}
+    regressed = False
+    print(f"\nPerbandingan dengan {baseline_path}:")
+    for r in current:
+        base = baseline.get((r["size"], r["stage"]))
+        if not base or not base["wall_s"]:
+            continue
+        ratio = r["wall_s"] / base["wall_s"]
+        flag = ""
+        if ratio > threshold and r["wall_s"] - base["wall_s"] > 0.01:
+            flag = "  <-- REGRESI"
+            regressed = True
+        print(f"{r['size']:>9} {r['stage']:<28} x{ratio:5.2f}{flag}")
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark jalur data dashboard_k3")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--export-rows", type=int, default=2000,
+                        help="jumlah baris patrol maksimum untuk benchmark export Excel")
+    parser.add_argument("--photos", type=int, default=50, help="jumlah foto dummy berbeda")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="file JSON hasil run sebelumnya")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="rasio wall time yang dianggap regresi (default 1.5x)")
+    args = parser.parse_args(argv)
+    k3.enable_copy_on_write()  # sama seperti aplikasi (diaktifkan di __main__ dashboard)
+
+    results = []
+    for size in args.sizes:
+        run_size(size, results, args.export_rows, args.photos)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "storage": k3.STORAGE_BACKEND,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nHasil ditulis ke {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,50 @@
 import streamlit as st
+from streamlit import runtime as st_runtime
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
 import os
 import io
+import csv
+import hashlib
+import json
+import mmap
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: cukup lock antar-thread dalam satu proses
+    fcntl = None
 
 # Optional libs for embedding images into Excel
 try:
     from openpyxl import Workbook
     from openpyxl.drawing.image import Image as XLImage
     from PIL import Image as PILImage
+    from PIL import ImageOps
     HAS_IMG_TO_EXCEL = True
 except Exception:
     HAS_IMG_TO_EXCEL = False
 
+# Optional: snapshot Parquet (K3_STORAGE=parquet)
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except Exception:
+    HAS_PARQUET = False
+
 # =========================
 # File CSV
 # =========================
@@ -22,28 +53,2264 @@ FILE_ACCIDENT = "data_accident.csv"
 FILE_PATROL = "data_patrol.csv"
 FILE_MANPOWER = "data_manpower.csv"
 
+COLUMNS_MANHOURS = ["Tanggal","Manpower","Jam Kerja","Total Manhours"]
+COLUMNS_ACCIDENT = ["Tanggal","Jenis","Kronologi"]
+COLUMNS_PATROL = ["Tanggal","Jenis Temuan","Ditemukan Oleh","Status","Deskripsi","Foto"]
+COLUMNS_MANPOWER = ["Tanggal","Proyek","Jumlah Pekerja","Nama Pekerja"]
+# Kolom lengkap Safety Patrol (termasuk kolom yang ditambahkan form update)
+COLUMNS_PATROL_FULL = ["Kode Temuan", "Tanggal", "Jenis Temuan", "Ditemukan Oleh",
+                       "Status", "Deskripsi", "Foto", "Tanggal Close", "Catatan Progress"]
+# Pilihan di form input (sekaligus nilai yang valid untuk kolomnya)
+JENIS_ACCIDENT = ["Fatality", "LTI", "MTC", "FAC", "Near Miss", "Property Damage", "PAK"]
+JENIS_TEMUAN = ["Cara Kerja", "Environment", "Manpower"]
+STATUS_PATROL = ["Open", "Progress", "Close"]
+
+# =========================
+# Profiling (opsional)
+# =========================
+# Aktif jika admin mencentang "Profil performa" di sidebar atau K3_PROFILE=1.
+# Mencatat durasi tiap tahap per rerun, jumlah baris, dan byte baca/tulis.
+PROFILE_ENV = os.environ.get("K3_PROFILE", "") == "1"
+METRICS_LOG = os.environ.get("K3_METRICS_LOG", "")
+_profile_local = threading.local()
+
+def profile_begin(label):
+    _profile_local.run = {
+        "label": label,
+        "start": time.perf_counter(),
+        "depth": 0,
+        "stages": [],
+        "counters": {"rows": 0, "bytes_read": 0, "bytes_written": 0},
+    }
+
+def profile_end():
+    """Tutup profil rerun saat ini dan kembalikan hasilnya (None jika tidak aktif)."""
+    run = getattr(_profile_local, "run", None)
+    _profile_local.run = None
+    if run is not None:
+        run["total"] = time.perf_counter() - run.pop("start")
+        run.pop("depth")
+    return run
+
+@contextmanager
+def profile_stage(name):
+    run = getattr(_profile_local, "run", None)
+    if run is None:
+        yield
+        return
+    entry = {"stage": name, "depth": run["depth"], "seconds": 0.0}
+    run["stages"].append(entry)
+    run["depth"] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["seconds"] = time.perf_counter() - start
+        run["depth"] -= 1
+
+def profile_count(counter, n):
+    run = getattr(_profile_local, "run", None)
+    if run is not None:
+        run["counters"][counter] = run["counters"].get(counter, 0) + int(n)
+
+def write_metrics_log(run, path=None):
+    """Tambahkan satu baris JSON per rerun ke K3_METRICS_LOG (jika diset)."""
+    path = path or METRICS_LOG
+    if not path or run is None:
+        return
+    record = dict(run, timestamp=datetime.now().isoformat(timespec="seconds"))
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def profile_panel(run):
+    """Panel sidebar (khusus admin) berisi hasil profil rerun terakhir."""
+    with st.sidebar.expander("⏱️ Profil Rerun", expanded=True):
+        st.caption(f"{run['label']}: total {run['total'] * 1000:.0f} ms")
+        lines = [f"{'  ' * s['depth']}{s['stage']}: {s['seconds'] * 1000:.1f} ms" for s in run["stages"]]
+        st.text("\n".join(lines) if lines else "(tidak ada tahap tercatat)")
+        c = run["counters"]
+        st.caption(f"Baris: {c['rows']:,} | Baca: {c['bytes_read'] / 1024:,.0f} KB | "
+                   f"Tulis: {c['bytes_written'] / 1024:,.0f} KB")
+
 # =========================
 # Utility Functions
 # =========================
-def load_data(file, columns=None):
+# Kolom yang di-parse sekali saat CSV dibaca (disimpan di cache dalam bentuk bertipe)
+DATE_COLUMNS = ["Tanggal"]
+NUMERIC_COLUMNS = ["Manpower", "Jam Kerja", "Total Manhours", "Jumlah Pekerja"]
+# Kolom teks berkardinalitas rendah -> dtype category (kode integer kecil + kamus nilai).
+# list = nilai yang valid (pilihan form), None = bebas (kategori mengikuti isi data)
+CATEGORY_COLUMNS = {
+    "Jenis": JENIS_ACCIDENT,
+    "Jenis Temuan": JENIS_TEMUAN,
+    "Status": STATUS_PATROL,
+    "Ditemukan Oleh": None,
+    "Proyek": None,
+}
+# Kolom turunan dari Tanggal (int, 0 jika tanggal tidak valid); tidak pernah ditulis ke file
+DERIVED_COLUMNS = ["_year", "_month"]
+
+_LOCAL_RESOURCES = {}
+
+def process_resource(func):
+    """
+    Seperti st.cache_resource (satu objek untuk seluruh proses), tetapi tetap
+    bekerja saat modul dipakai tanpa runtime Streamlit (CLI / benchmark).
+    """
+    cached = st.cache_resource(func)
+
+    def wrapper(*args):
+        if st_runtime.exists():
+            return cached(*args)
+        key = (func.__name__,) + args
+        if key not in _LOCAL_RESOURCES:
+            _LOCAL_RESOURCES[key] = func(*args)
+        return _LOCAL_RESOURCES[key]
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+@process_resource
+def get_data_cache():
+    """
+    Cache data bersama untuk seluruh proses (semua sesi Streamlit).
+    entries: path absolut -> (mtime_ns, size, DataFrame bertipe)
+    views: (path dataset, versi, filter, kolom) -> frame hasil filter/proyeksi (LRU)
+    """
+    return {
+        "entries": {},
+        "views": OrderedDict(),
+        "lock": threading.Lock(),
+        "hits": 0,
+        "misses": 0,
+        "parse_time": 0.0,
+    }
+
+def cache_stats():
+    """Ringkasan cache data: hit, miss, hit rate, dan total waktu parsing (detik)."""
+    cache = get_data_cache()
+    with cache["lock"]:
+        total = cache["hits"] + cache["misses"]
+        return {
+            "hits": cache["hits"],
+            "misses": cache["misses"],
+            "hit_rate": cache["hits"] / total if total else 0.0,
+            "parse_time": cache["parse_time"],
+            "entries": len(cache["entries"]),
+        }
+
+def invalidate_cache(file):
+    cache = get_data_cache()
+    with cache["lock"]:
+        cache["entries"].pop(os.path.abspath(file), None)
+    drop_views(file)
+
+# Jumlah frame hasil filter/proyeksi yang disimpan bersama
+VIEW_CACHE_ENTRIES = 32
+
+def drop_views(file):
+    """Buang view dataset ini (dipanggil penulis setelah menerbitkan versi baru)."""
+    cache = get_data_cache()
+    path = os.path.abspath(file)
+    with cache["lock"]:
+        for key in [k for k in cache["views"] if k[0] == path]:
+            del cache["views"][key]
+
+def enable_copy_on_write():
+    """
+    Copy-on-write pandas untuk SELURUH proses (mode.copy_on_write): frame data bersama
+    (cache proses) dibagikan ke semua sesi lewat salinan dangkal; data baru benar-benar
+    disalin saat salah satu sesi mengubahnya. Diaktifkan aplikasi di __main__ (proses server
+    Streamlit hanya menjalankan dashboard ini), bukan saat modul di-import sebagai library.
+    """
+    pd.set_option("mode.copy_on_write", True)
+
+def _share(df):
+    """Salinan frame bersama untuk pemanggil: dangkal jika copy-on-write aktif, penuh jika tidak."""
+    return df.copy(deep=not pd.get_option("mode.copy_on_write"))
+
+def shared_view(file, version, filters, select, build):
+    """
+    Frame untuk (dataset, versi, filter, kolom) dibangun sekali lalu dipakai bersama
+    semua sesi. Yang dikembalikan salinan (_share): dengan copy-on-write tanpa perubahan
+    tidak ada data yang disalin, dan perubahan di halaman tidak mengotori data bersama.
+    """
+    key = (os.path.abspath(file), json.dumps(version),
+           tuple(sorted((filters or {}).items())), tuple(select) if select is not None else None)
+    cache = get_data_cache()
+    with cache["lock"]:
+        view = cache["views"].get(key)
+        if view is not None:
+            cache["views"].move_to_end(key)
+            return _share(view)
+    view = build()
+    with cache["lock"]:
+        cache["views"][key] = view
+        while len(cache["views"]) > VIEW_CACHE_ENTRIES:
+            cache["views"].popitem(last=False)
+    return _share(view)
+
+def _parse_csv(file):
+    # kolom kategori langsung dibaca sebagai category (tanpa tahap string object)
+    header = _read_header(file)
+    dtype = {c: "category" for c in CATEGORY_COLUMNS if c in header}
+    return _compact_dtypes(_coerce_types(pd.read_csv(file, dtype=dtype)))
+
+def _coerce_types(df):
+    for c in DATE_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+    for c in NUMERIC_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    if "Tanggal" in df.columns:
+        df["_year"], df["_month"] = _date_parts(df["Tanggal"])
+    return df
+
+def _compact_dtypes(df):
+    """
+    Kolom kategori -> category; angka bulat tanpa nilai kosong -> int32 (bukan float64/int64);
+    _year/_month -> int16/int8; kolom teks yang kosong semua -> object (bukan float64).
+    """
+    for c, dtype in (("_year", "int16"), ("_month", "int8")):
+        if c in df.columns and df[c].dtype != dtype:
+            df[c] = df[c].fillna(0).astype(dtype)
+    for c in df.columns:
+        if (c not in NUMERIC_COLUMNS and c not in DATE_COLUMNS and c not in DERIVED_COLUMNS
+                and df[c].dtype == "float64" and df[c].isna().all()):
+            df[c] = df[c].astype(object)
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    for c in NUMERIC_COLUMNS:
+        if c in df.columns and df[c].dtype.kind in "iuf" and df[c].dtype != "int32":
+            values = df[c]
+            if len(values) and values.notna().all() and (values % 1 == 0).all() and values.abs().max() < 2**31:
+                df[c] = values.astype("int32")
+    return df
+
+def _plain(df, columns=None):
+    """Kolom category -> object, sebelum frame diubah per sel atau diisi nilai baru."""
+    cols = [c for c in (columns or df.columns)
+            if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.assign(**{c: df[c].astype(object) for c in cols}) if cols else df
+
+def _concat_typed(frames):
+    """pd.concat yang tetap menghasilkan category (kategori digabung, bukan jatuh ke object)."""
+    frames = list(frames)
+    for c in CATEGORY_COLUMNS:
+        parts = [f[c] for f in frames if c in f.columns]
+        if not any(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            continue
+        values = []
+        for p in parts:
+            values.extend(p.cat.categories if isinstance(p.dtype, pd.CategoricalDtype) else p.dropna().unique())
+        dtype = pd.CategoricalDtype(pd.Index(values, dtype=object).unique())
+        frames = [f.assign(**{c: f[c].astype(dtype)}) if c in f.columns else f for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+def schema_problems(file, df, optional=()):
+    """
+    Alasan penolakan per baris menurut skema dataset ("" = valid): Tanggal tidak valid,
+    kolom angka wajib kosong/bukan angka, atau nilai kategori di luar pilihan form.
+    """
+    reason = pd.Series("", index=df.index)
+    columns = DATASETS[file]["columns"]
+    if "Tanggal" in columns:
+        reason[pd.to_datetime(df["Tanggal"], errors="coerce").isna()] = "Tanggal tidak valid"
+    for c in columns:
+        if c in NUMERIC_COLUMNS and c not in optional:
+            bad = pd.to_numeric(df[c], errors="coerce").isna() & (reason == "")
+            reason[bad] = f"{c} bukan angka"
+        elif CATEGORY_COLUMNS.get(c):
+            values = df[c].astype(object).where(df[c].notna(), "").astype(str).str.strip()
+            bad = (values != "") & ~values.isin(CATEGORY_COLUMNS[c]) & (reason == "")
+            reason[bad] = f"{c} tidak dikenal"
+    return reason
+
+def memory_report():
+    """Memori frame yang dimuat per dataset: baris, total byte, dan dtype + byte per kolom."""
+    report = []
+    for file, meta in DATASETS.items():
+        df = load_data(file)
+        usage = df.memory_usage(deep=True, index=False)
+        report.append({
+            "dataset": meta["table"], "rows": len(df), "bytes": int(usage.sum()),
+            "columns": {c: (str(df[c].dtype), int(usage[c])) for c in df.columns},
+        })
+    return report
+
+def _date_parts(tanggal):
+    """Tahun & bulan sebagai integer (0 untuk tanggal kosong/tidak valid)."""
+    if not pd.api.types.is_datetime64_any_dtype(tanggal):
+        tanggal = pd.to_datetime(tanggal, errors="coerce")
+    year = tanggal.dt.year.fillna(0).astype("int16")
+    month = tanggal.dt.month.fillna(0).astype("int8")
+    return year, month
+
+def _project(df, select):
+    """Hanya kolom select (+ kolom turunan _year/_month); select None = semua kolom."""
+    if select is None:
+        return df
+    cols = [c for c in dict.fromkeys(select) if c in df.columns]
+    return df[cols + [c for c in DERIVED_COLUMNS if c in df.columns and c not in cols]]
+
+def _year_month(df):
+    """Kolom _year/_month dari frame yang sudah di-load, atau dihitung untuk baris baru."""
+    if "_year" in df.columns and "_month" in df.columns:
+        return df["_year"], df["_month"]
+    return _date_parts(df["Tanggal"])
+
+def _csv_load(file, columns=None):
+    """
+    Jika file ada dan tidak kosong -> load CSV (lewat cache, key: path + mtime + size),
+    termasuk log update-nya. Jika tidak ada atau kosong -> DataFrame dengan kolom (jika diberikan).
     """
-    Jika file ada dan tidak kosong -> load CSV.
-    Jika tidak ada atau kosong -> kembalikan DataFrame dengan kolom (jika diberikan).
+    # salinan: perubahan pemanggil tidak mengotori cache
+    return _share(_csv_current(file, columns))
+
+def _csv_updates_path(file):
+    """data_x.csv -> log update data_x.updates.csv (baris utuh hasil update per key)."""
+    return os.path.splitext(file)[0] + ".updates.csv"
+
+def _csv_current(file, columns=None):
+    """
+    Isi dataset CSV terkini: file utama + log update (jika ada) digabung per key dataset.
+    Hasil gabungan disimpan di cache (key: stat kedua file); tidak boleh dimodifikasi.
+    """
+    log_path = _csv_updates_path(file)
+    try:
+        signature = [os.stat(p) for p in (file, log_path)]
+    except OSError:
+        return _csv_frame(file, columns)
+    signature = [(st.st_mtime_ns, st.st_size) for st in signature]
+    cache = get_data_cache()
+    key = os.path.abspath(log_path) + "+base"
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is not None and [entry[0], entry[1]] == signature:
+            return entry[2]
+    with profile_stage(f"merge {os.path.basename(log_path)}"):
+        df = _merge_log(_csv_frame(file, columns), _csv_frame(log_path), DATASETS.get(file, {}).get("key"))
+        df = _compact_dtypes(df)
+    with cache["lock"]:
+        cache["entries"][key] = (signature[0], signature[1], df)
+    return df
+
+def _csv_frame(file, columns=None):
+    """Seperti _csv_load, tetapi mengembalikan frame di cache (tidak boleh dimodifikasi)."""
+    empty = pd.DataFrame(columns=columns if columns else [])
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return empty
+    if stat.st_size == 0:
+        return empty
+
+    cache = get_data_cache()
+    key = os.path.abspath(file)
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            cache["hits"] += 1
+            return entry[2]
+
+    start = time.perf_counter()
+    try:
+        with profile_stage(f"parse {os.path.basename(file)}"):
+            df = _parse_csv(file)
+    except pd.errors.EmptyDataError:
+        return empty
+    elapsed = time.perf_counter() - start
+    profile_count("bytes_read", stat.st_size)
+
+    with cache["lock"]:
+        cache["misses"] += 1
+        cache["parse_time"] += elapsed
+        cache["entries"][key] = (stat.st_mtime_ns, stat.st_size, df)
+    return df
+
+@process_resource
+def _thread_locks():
+    return {"guard": threading.Lock(), "locks": {}, "depth": {}}
+
+@contextmanager
+def file_lock(file):
+    """
+    Lock eksklusif per file data (antar-thread dan antar-proses lewat file .lock),
+    supaya beberapa sesi admin yang menyimpan bersamaan tidak saling menimpa.
     """
-    if os.path.exists(file) and os.path.getsize(file) > 0:
+    registry = _thread_locks()
+    key = os.path.abspath(file)
+    with registry["guard"]:
+        lock = registry["locks"].setdefault(key, threading.RLock())
+    with lock:
+        # reentrant: hanya level terluar yang mengambil flock
+        depth = registry["depth"].get(key, 0)
+        registry["depth"][key] = depth + 1
         try:
-            return pd.read_csv(file)
-        except pd.errors.EmptyDataError:
-            return pd.DataFrame(columns=columns if columns else [])
-    else:
-        return pd.DataFrame(columns=columns if columns else [])
+            if fcntl is None or depth:
+                yield
+                return
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            with open(key + ".lock", "a") as lf:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+        finally:
+            registry["depth"][key] = depth
+
+def _storage_frame(df):
+    # Kolom tanggal bisa campuran Timestamp (dari cache) dan date/string (baris baru)
+    date_cols = {c: pd.to_datetime(df[c], errors="coerce") for c in DATE_COLUMNS if c in df.columns}
+    return _plain(df.drop(columns=DERIVED_COLUMNS, errors="ignore")).assign(**date_cols)
+
+def _write_csv_atomic(file, df):
+    dirname = os.path.dirname(os.path.abspath(file))
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".csv", dir=dirname)
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            _storage_frame(df).to_csv(f, index=False, date_format="%Y-%m-%d")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    profile_count("bytes_written", os.path.getsize(file))
+    invalidate_cache(file)
+
+def _csv_save(file, df):
+    """Tulis ulang seluruh file secara atomik (file sementara + rename); log update dibuang."""
+    with file_lock(file):
+        _write_csv_atomic(file, df)
+        _remove_csv_updates(file)
+
+def _remove_csv_updates(file):
+    log_path = _csv_updates_path(file)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+        invalidate_cache(log_path)
+
+def _csv_compact(file):
+    """Lipat log update ke file utama (isi data tidak berubah)."""
+    with file_lock(file):
+        if os.path.exists(_csv_updates_path(file)):
+            _write_csv_atomic(file, _csv_current(file))
+            _remove_csv_updates(file)
+
+def _read_header(file):
+    with open(file, newline="") as f:
+        return next(csv.reader(f), [])
+
+def _csv_append(file, rows, columns):
+    """
+    Tambahkan baris baru ke akhir CSV tanpa menulis ulang isi file.
+    rows: list of dict. Jika header file belum memuat semua kolom baris baru,
+    file ditulis ulang sekali (atomik) dengan header lengkap, lalu di-append.
+    """
+    new = pd.DataFrame(rows, columns=columns)
+    with file_lock(file):
+        if not os.path.exists(file) or os.path.getsize(file) == 0:
+            _write_csv_atomic(file, new)
+            return
+
+        header = _read_header(file)
+        if not set(columns) <= set(header):
+            header = list(dict.fromkeys(header + list(columns)))
+            _write_csv_atomic(file, _csv_frame(file).reindex(columns=header))
+
+        before = os.stat(file)
+        with open(file, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+        with open(file, "a", newline="") as f:
+            if needs_newline:
+                f.write("\n")
+            _storage_frame(new.reindex(columns=header)).to_csv(
+                f, header=False, index=False, date_format="%Y-%m-%d"
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        after = os.stat(file)
+        profile_count("bytes_written", after.st_size - before.st_size)
+
+        # Perbarui cache secara inkremental jika isinya masih versi sebelum append
+        cache = get_data_cache()
+        key = os.path.abspath(file)
+        with cache["lock"]:
+            entry = cache["entries"].get(key)
+            if entry is not None and (entry[0], entry[1]) == (before.st_mtime_ns, before.st_size):
+                typed = _coerce_types(new.reindex(columns=header))
+                merged = _compact_dtypes(_concat_typed([entry[2], typed]))
+                cache["entries"][key] = (after.st_mtime_ns, after.st_size, merged)
+            else:
+                cache["entries"].pop(key, None)
+
+def _merge_log(base, log, key):
+    """
+    base + log baris utuh: baris log dengan key yang sudah ada menggantikan baris lama di
+    posisinya (entri terakhir menang), sisanya ditambahkan di akhir. Dipakai snapshot Parquet
+    dan log update CSV.
+    """
+    if log.empty:
+        return base
+    if base.empty:
+        return log.copy()
+    base, log = _plain(base), _plain(log)
+    if key and key in log.columns:
+        if key not in base.columns:
+            base[key] = None
+        # log kecil (dipadatkan berkala): cukup diproses per baris
+        positions = {}
+        for i, k in enumerate(base[key].tolist()):
+            positions.setdefault(k, i)
+        updates, extra, extra_pos = {}, [], {}
+        for rec in log.to_dict("records"):
+            k = rec.get(key)
+            if not isinstance(k, str) or not k:
+                extra.append(rec)
+            elif k in positions:
+                updates[positions[k]] = rec
+            elif k in extra_pos:
+                extra[extra_pos[k]] = rec
+            else:
+                extra_pos[k] = len(extra)
+                extra.append(rec)
+        if updates:
+            base = base.copy()  # base bisa frame di cache: jangan diubah di tempat
+        col_pos = {c: base.columns.get_loc(c) for c in log.columns if c in base.columns}
+        for c in col_pos:
+            if updates and log[c].dtype == object and base[c].dtype != object:
+                base[c] = base[c].astype(object)  # kolom kosong di base (float64) diisi teks dari log
+        for i, rec in updates.items():
+            for c, j in col_pos.items():
+                base.iat[i, j] = rec[c]
+        log = pd.DataFrame(extra, columns=log.columns)
+        if log.empty:
+            return base
+    return pd.concat([base, log], ignore_index=True)
+
+def locate_row(df, key_col, key, position=None):
+    """
+    Posisi baris dengan key_col == key. position (dari indeks patrol) dicek dulu
+    sehingga O(1); jika tidak cocok, fallback ke pencarian linear. None jika tidak ada.
+    """
+    if position is not None and 0 <= position < len(df) and df[key_col].iat[position] == key:
+        return position
+    match = (df[key_col] == key).to_numpy().nonzero()[0]
+    return int(match[0]) if len(match) else None
+
+def _csv_upsert(file, key_col, row, columns, position=None):
+    """
+    Update baris dengan key_col yang sama atau tambahkan baris baru, dibaca ulang
+    dari disk di dalam lock agar perubahan sesi lain tidak hilang. Baris baru di-append
+    ke file utama; update ditulis sebagai baris utuh ke log update (file utama tidak
+    ditulis ulang) dan dilipat ke file utama setelah CSV_UPDATE_LOG_MAX_ROWS baris.
+    Mengembalikan (baris lama sebagai dict atau None jika baru, posisi baris sesudah ditulis).
+    """
+    with file_lock(file):
+        df = _csv_current(file, columns)
+        pos = locate_row(df, key_col, row[key_col], position) if key_col in df.columns else None
+        if pos is None:
+            _csv_append(file, [row], list(dict.fromkeys(list(columns) + list(row))))
+            return None, len(df)
+        old = df.iloc[pos].drop(DERIVED_COLUMNS, errors="ignore").to_dict()
+        full = dict(old, **row)
+        if key_col != DATASETS.get(file, {}).get("key"):
+            # log digabung per key dataset; key lain -> tulis ulang penuh
+            _write_csv_atomic(file, _merge_log(df, pd.DataFrame([full]), key_col))
+            return old, pos
+        log_path = _csv_updates_path(file)
+        _csv_append(log_path, [full], list(full))
+        if len(_csv_frame(log_path)) > CSV_UPDATE_LOG_MAX_ROWS:
+            _csv_compact(file)
+    return old, pos
+
+# =========================
+# Storage Backend (CSV / SQLite)
+# =========================
+# Pilih backend lewat environment: K3_STORAGE=csv (default), sqlite, parquet, atau partitioned
+STORAGE_BACKEND = os.environ.get("K3_STORAGE", "csv").lower()
+SQLITE_PATH = os.environ.get("K3_SQLITE_PATH", "data_k3.db")
+# partitioned: data/<dataset>/<tahun>/<bulan>.csv + manifest.json per dataset
+PARTITION_DIR = os.environ.get("K3_PARTITION_DIR", "data")
+# parquet: log CSV dipadatkan ke snapshot setelah sekian baris
+PARQUET_LOG_MAX_ROWS = int(os.environ.get("K3_PARQUET_LOG_ROWS", "5000"))
+# csv: log update (data_x.updates.csv) dilipat ke file utama setelah sekian baris
+CSV_UPDATE_LOG_MAX_ROWS = int(os.environ.get("K3_CSV_UPDATE_ROWS", "500"))
+
+# Metadata dataset: file CSV -> tabel SQLite, kolom, dan kolom yang diindeks
+DATASETS = {
+    FILE_MANHOURS: {"table": "manhours", "columns": COLUMNS_MANHOURS, "indexes": []},
+    FILE_ACCIDENT: {"table": "accident", "columns": COLUMNS_ACCIDENT, "indexes": []},
+    FILE_PATROL: {"table": "patrol", "columns": COLUMNS_PATROL_FULL, "indexes": [], "key": "Kode Temuan"},
+    FILE_MANPOWER: {"table": "manpower", "columns": COLUMNS_MANPOWER, "indexes": ["Proyek"]},
+}
+
+BULAN_NUM = {b: i for i, b in enumerate(
+    ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"], start=1)}
+BULAN_NAMA = {i: b for b, i in BULAN_NUM.items()}
+
+def _filter_frame(df, filters):
+    """filters: dict opsional berisi year (int), month (int), proyek (str)."""
+    if not filters or df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    if "Tanggal" in df.columns:
+        year, month = _year_month(df)
+        if filters.get("year"):
+            mask &= year == int(filters["year"])
+        if filters.get("month"):
+            mask &= month == int(filters["month"])
+    if filters.get("proyek") and "Proyek" in df.columns:
+        mask &= df["Proyek"] == filters["proyek"]
+    return df[mask]
+
+class CsvStorage:
+    """
+    Backend default: satu file CSV per dataset (dengan cache + append); update baris
+    patrol masuk ke log update kecil yang dipadatkan berkala.
+    """
+    name = "csv"
+
+    def load(self, file, columns=None, filters=None, select=None):
+        version = self.version(file)  # sebelum membaca, agar view tidak tercatat di versi yang lebih baru
+        df = _csv_current(file, columns)
+        if not filters and select is None:
+            return _share(df)
+        return shared_view(file, version, filters, select,
+                           lambda: _project(_filter_frame(df, filters), select))
+
+    def save(self, file, df):
+        _csv_save(file, df)
+
+    def append(self, file, rows, columns):
+        _csv_append(file, rows, columns)
+
+    def upsert(self, file, key_col, row, columns, position=None):
+        return _csv_upsert(file, key_col, row, columns, position)
+
+    def compact(self, file):
+        _csv_compact(file)
+
+    def version(self, file):
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        parts = [self.name, stat.st_mtime_ns, stat.st_size]
+        try:
+            stat = os.stat(_csv_updates_path(file))
+            parts += [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            pass
+        return parts
+
+    def years(self, file):
+        df = _csv_current(file)
+        if df.empty or "Tanggal" not in df.columns:
+            return []
+        year, _ = _year_month(df)
+        return sorted(int(y) for y in year.unique() if y)
+
+    def distinct(self, file, column):
+        df = _csv_current(file)
+        if df.empty or column not in df.columns:
+            return []
+        return sorted(df[column].dropna().unique().tolist())
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _sql_value(column, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if column in DATE_COLUMNS:
+        ts = pd.to_datetime(value, errors="coerce")
+        return ts.strftime("%Y-%m-%d") if pd.notna(ts) else None
+    if column in NUMERIC_COLUMNS:
+        try:
+            num = float(value)
+        except (TypeError, ValueError):
+            return None
+        return int(num) if num.is_integer() else num
+    return str(value)
+
+class SqliteStorage:
+    """
+    Backend SQLite tertanam: indeks pada Tanggal, (tahun, bulan), Kode Temuan dan Proyek;
+    filter bulan/tahun/proyek dijalankan di SQL, update patrol berupa UPSERT satu baris.
+    """
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS _versions (tbl TEXT PRIMARY KEY, v INTEGER)")
+            for meta in DATASETS.values():
+                self._create_table(conn, meta)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Koneksi per thread dipakai ulang (journal_mode=WAL cukup diset sekali per koneksi);
+        tiap pemakaian tetap satu transaksi.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        with conn:
+            yield conn
+
+    def _bump_version(self, conn, table):
+        conn.execute("INSERT INTO _versions (tbl, v) VALUES (?, 1) "
+                     "ON CONFLICT(tbl) DO UPDATE SET v = v + 1", (table,))
+
+    def version(self, file):
+        table = self._meta(file)["table"]
+        with self._connect() as conn:
+            row = conn.execute("SELECT v FROM _versions WHERE tbl = ?", (table,)).fetchone()
+        return [self.name, row[0] if row else 0]
+
+    def _create_table(self, conn, meta):
+        table = meta["table"]
+        cols = []
+        for c in meta["columns"]:
+            sql_type = "REAL" if c in NUMERIC_COLUMNS else "TEXT"
+            cols.append(f"{_quote(c)} {sql_type}")
+        # kolom turunan untuk filter tahun/bulan tanpa parsing string di Python
+        cols.append('"_year" INTEGER GENERATED ALWAYS AS (CAST(substr("Tanggal", 1, 4) AS INTEGER)) VIRTUAL')
+        cols.append('"_month" INTEGER GENERATED ALWAYS AS (CAST(substr("Tanggal", 6, 2) AS INTEGER)) VIRTUAL')
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(cols)})")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_tanggal ON {table}("Tanggal")')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_ym ON {table}("_year", "_month")')
+        for c in meta["indexes"]:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{c.lower().replace(' ', '_')} "
+                         f"ON {table}({_quote(c)}, \"Tanggal\")")
+        if meta.get("key"):
+            key = meta["key"]
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_key ON {table}({_quote(key)})")
+
+    def _meta(self, file):
+        return DATASETS[file]
+
+    def load(self, file, columns=None, filters=None, select=None):
+        return shared_view(file, self.version(file), filters, select,
+                           lambda: self._query(file, columns, filters, select))
+
+    def _query(self, file, columns=None, filters=None, select=None):
+        meta = self._meta(file)
+        where, params = [], []
+        filters = filters or {}
+        if filters.get("year"):
+            where.append('"_year" = ?')
+            params.append(int(filters["year"]))
+        if filters.get("month"):
+            where.append('"_month" = ?')
+            params.append(int(filters["month"]))
+        if filters.get("proyek") and "Proyek" in meta["columns"]:
+            where.append('"Proyek" = ?')
+            params.append(filters["proyek"])
+        cols = meta["columns"] if select is None else [c for c in dict.fromkeys(select) if c in meta["columns"]]
+        sql = f"SELECT {', '.join(_quote(c) for c in cols + DERIVED_COLUMNS)} FROM {meta['table']}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY rowid"
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        if df.empty:
+            return pd.DataFrame(columns=select or columns or meta["columns"])
+        df["_year"] = df["_year"].fillna(0).astype("int16")
+        df["_month"] = df["_month"].fillna(0).astype("int8")
+        return _compact_dtypes(_coerce_types(df))
+
+    def _insert_sql(self, table, columns):
+        placeholders = ", ".join("?" for _ in columns)
+        return f"INSERT INTO {table} ({', '.join(_quote(c) for c in columns)}) VALUES ({placeholders})"
+
+    def _rows(self, df, columns):
+        return [tuple(_sql_value(c, v) for c, v in zip(columns, rec))
+                for rec in df[columns].itertuples(index=False, name=None)]
+
+    def save(self, file, df):
+        meta = self._meta(file)
+        columns = [c for c in meta["columns"] if c in df.columns]
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {meta['table']}")
+            conn.executemany(self._insert_sql(meta["table"], columns), self._rows(df, columns))
+            self._bump_version(conn, meta["table"])
+
+    def append(self, file, rows, columns):
+        meta = self._meta(file)
+        df = pd.DataFrame(rows, columns=columns)
+        with self._connect() as conn:
+            conn.executemany(self._insert_sql(meta["table"], columns), self._rows(df, columns))
+            self._bump_version(conn, meta["table"])
+
+    def upsert(self, file, key_col, row, columns, position=None):
+        # position tidak dipakai: lookup lewat UNIQUE index key_col
+        meta = self._meta(file)
+        table = meta["table"]
+        cols = [c for c in row if c in meta["columns"]]
+        values = [_sql_value(c, row[c]) for c in cols]
+        updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in cols if c != key_col)
+        all_cols = ", ".join(_quote(c) for c in meta["columns"])
+        with self._connect() as conn:
+            found = conn.execute(f"SELECT {all_cols} FROM {table} WHERE {_quote(key_col)} = ?",
+                                 (row[key_col],)).fetchone()
+            conn.execute(self._insert_sql(table, cols) +
+                         f" ON CONFLICT({_quote(key_col)}) DO UPDATE SET {updates}", values)
+            # urutan load = ORDER BY rowid; UPDATE tidak mengubah rowid, baris baru di akhir
+            pos = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid < "
+                               f"(SELECT rowid FROM {table} WHERE {_quote(key_col)} = ?)",
+                               (row[key_col],)).fetchone()[0]
+            self._bump_version(conn, table)
+        old = dict(zip(meta["columns"], found)) if found else None
+        return old, pos
+
+    def years(self, file):
+        meta = self._meta(file)
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT DISTINCT "_year" FROM {meta["table"]} '
+                                f'WHERE "_year" > 0 ORDER BY 1').fetchall()  # Tanggal kosong/tidak valid -> 0
+        return [r[0] for r in rows]
+
+    def distinct(self, file, column):
+        meta = self._meta(file)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT DISTINCT {_quote(column)} FROM {meta['table']} "
+                                f"WHERE {_quote(column)} IS NOT NULL ORDER BY 1").fetchall()
+        return [r[0] for r in rows]
+
+def _parquet_paths(file):
+    """data_x.csv -> (snapshot data_x.parquet, log data_x.log.csv)."""
+    base = os.path.splitext(file)[0]
+    return base + ".parquet", base + ".log.csv"
+
+def _snapshot_table(path):
+    """Tabel Arrow snapshot; disimpan di cache proses (hot tier), key: path + mtime + size."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cache = get_data_cache()
+    key = os.path.abspath(path)
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            cache["hits"] += 1
+            return entry[2]
+    start = time.perf_counter()
+    with profile_stage(f"parse {os.path.basename(path)}"):
+        table = pq.read_table(path)
+    elapsed = time.perf_counter() - start
+    profile_count("bytes_read", stat.st_size)
+    with cache["lock"]:
+        cache["misses"] += 1
+        cache["parse_time"] += elapsed
+        cache["entries"][key] = (stat.st_mtime_ns, stat.st_size, table)
+    return table
+
+def _arrow_frame(table, filters, select, keep=None):
+    """
+    Filter tahun/bulan/proyek dan proyeksi kolom di Arrow, baru dikonversi ke pandas.
+    keep: (kolom, nilai) baris yang tetap ikut walau tidak lolos filter (key yang diganti log).
+    """
+    filters = filters or {}
+    mask = None
+    for col, value in (("_year", filters.get("year")), ("_month", filters.get("month")),
+                       ("Proyek", filters.get("proyek"))):
+        if value and col in table.column_names:
+            cond = pc.equal(table[col], int(value) if col != "Proyek" else value)
+            mask = cond if mask is None else pc.and_(mask, cond)
+    if mask is not None and keep is not None and keep[0] in table.column_names:
+        values = pa.array([v for v in keep[1] if isinstance(v, str)], type=pa.string())
+        mask = pc.or_(mask, pc.is_in(table[keep[0]].cast(pa.string()), value_set=values))
+    if mask is not None:
+        table = table.filter(mask)
+    if select is not None:
+        cols = [c for c in dict.fromkeys(select) if c in table.column_names]
+        table = table.select(cols + [c for c in DERIVED_COLUMNS if c in table.column_names and c not in cols])
+    return table.to_pandas()
+
+def _write_snapshot(path, df):
+    frame = _storage_frame(df)
+    for c in frame.columns:
+        if c not in DATE_COLUMNS and c not in NUMERIC_COLUMNS:
+            # teks murni (tanpa campuran angka/str) agar skema Arrow konsisten
+            frame[c] = frame[c].where(frame[c].isna(), frame[c].astype(str))
+        elif c in NUMERIC_COLUMNS:
+            frame[c] = pd.to_numeric(frame[c], errors="coerce")
+    if "Tanggal" in frame.columns:
+        frame["_year"], frame["_month"] = _date_parts(frame["Tanggal"])
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".parquet", dir=dirname)
+    os.close(fd)
+    try:
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    profile_count("bytes_written", os.path.getsize(path))
+    invalidate_cache(path)
+
+class ParquetStorage:
+    """
+    Snapshot Parquet (kolom bertipe, dibaca per kolom) + log CSV kecil untuk baris baru.
+    Keduanya digabung saat load; compact() melipat log ke snapshot. Update baris patrol
+    ditulis ke log dan menggantikan baris snapshot dengan Kode Temuan yang sama.
+    """
+    name = "parquet"
+
+    def _ensure(self, file):
+        """Migrasi sekali jalan dari CSV lama jika snapshot & log belum ada."""
+        snap, log = _parquet_paths(file)
+        if os.path.exists(snap) or os.path.exists(log):
+            return
+        with file_lock(file):
+            if not os.path.exists(snap) and os.path.exists(file) and os.path.getsize(file) > 0:
+                self.save(file, _csv_current(file))
+
+    def _merged(self, file):
+        """Snapshot + log lengkap; baris log dengan key yang sudah ada menggantikan baris lama."""
+        snap_path, log_path = _parquet_paths(file)
+        table = _snapshot_table(snap_path)
+        snap = table.to_pandas() if table is not None else pd.DataFrame()
+        log = _csv_frame(log_path)
+        return _merge_log(snap, log, DATASETS[file].get("key"))
+
+    def load(self, file, columns=None, filters=None, select=None):
+        self._ensure(file)
+        return shared_view(file, self.version(file), filters, select,
+                           lambda: self._read(file, columns, filters, select))
+
+    def _read(self, file, columns=None, filters=None, select=None):
+        snap_path, log_path = _parquet_paths(file)
+        key = DATASETS[file].get("key")
+        log_frame = _csv_frame(log_path)
+        if key and not log_frame.empty and key in log_frame.columns:
+            # update di log bisa mengubah tanggal/proyek: snapshot hanya dipangkas untuk key yang
+            # tidak ada di log, kolom dipangkas sesuai select (+ key & kolom filter); filter final
+            # dijalankan sesudah digabung
+            cols = None if select is None else list(dict.fromkeys(list(select) + [key, "Tanggal", "Proyek"]))
+            table = _snapshot_table(snap_path)
+            snap = pd.DataFrame() if table is None else _arrow_frame(
+                table, filters, cols, keep=(key, log_frame[key].unique().tolist()))
+            merged = _merge_log(snap, _project(log_frame, cols), key)
+            df = _project(_filter_frame(merged, filters), select)
+        else:
+            table = _snapshot_table(snap_path)
+            parts = [] if table is None else [_arrow_frame(table, filters, select)]
+            log = _project(_filter_frame(log_frame, filters), select)
+            parts = [p for p in parts + [log] if not p.empty]
+            df = _concat_typed(parts) if len(parts) > 1 else (parts[0] if parts else None)
+        if df is None or df.empty:
+            return pd.DataFrame(columns=select or columns or [])
+        return _compact_dtypes(df)
+
+    def save(self, file, df):
+        snap_path, log_path = _parquet_paths(file)
+        with file_lock(file):
+            _write_snapshot(snap_path, df)
+            if os.path.exists(log_path):
+                os.remove(log_path)
+                invalidate_cache(log_path)
+
+    def compact(self, file):
+        """Lipat log CSV ke snapshot Parquet (isi data tidak berubah)."""
+        with file_lock(file):
+            if os.path.exists(_parquet_paths(file)[1]):
+                self.save(file, self._merged(file))
+
+    def _maybe_compact(self, file):
+        if len(_csv_frame(_parquet_paths(file)[1])) > PARQUET_LOG_MAX_ROWS:
+            self.compact(file)
+
+    def append(self, file, rows, columns):
+        self._ensure(file)
+        with file_lock(file):
+            _csv_append(_parquet_paths(file)[1], rows, columns)
+            self._maybe_compact(file)
+
+    def upsert(self, file, key_col, row, columns, position=None):
+        self._ensure(file)
+        with file_lock(file):
+            df = _plain(self.load(file))
+            for c in columns:
+                if c not in df.columns:
+                    df[c] = ""
+                elif c not in NUMERIC_COLUMNS and c not in DATE_COLUMNS and df[c].dtype != object:
+                    df[c] = df[c].astype(object)  # kolom teks yang kosong semua terbaca float
+            pos = locate_row(df, key_col, row[key_col], position)
+            if pos is not None:
+                old = df.iloc[pos].drop(DERIVED_COLUMNS, errors="ignore").to_dict()
+                full = dict(old, **row)
+                for k, v in row.items():
+                    df.at[df.index[pos], k] = v
+            else:
+                old, full = None, row
+                df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+            _csv_append(_parquet_paths(file)[1], [full], columns)
+            self._maybe_compact(file)
+        return old, len(df) - 1 if pos is None else pos
+
+    def version(self, file):
+        self._ensure(file)  # versi sebelum migrasi dari CSV tidak boleh tertukar dengan versi snapshot
+        parts = [self.name]
+        for path in _parquet_paths(file):
+            try:
+                stat = os.stat(path)
+                parts += [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                parts += [0, 0]
+        if parts[1:] == [0, 0, 0, 0]:
+            return None
+        return parts
+
+    def years(self, file):
+        df = self.load(file, select=["Tanggal"])
+        if df.empty:
+            return []
+        year, _ = _year_month(df)
+        return sorted(int(y) for y in year.unique() if y)
+
+    def distinct(self, file, column):
+        df = self.load(file, select=[column])
+        if df.empty or column not in df.columns:
+            return []
+        return sorted(df[column].dropna().unique().tolist())
+
+# =========================
+# Storage partisi tahun/bulan
+# =========================
+# Baris tanpa tanggal valid disimpan di partisi 0000/00 (ikut dimuat tanpa filter tahun).
+PARTITION_UNDATED = "0000/00"
+
+def _partition_root(file):
+    return os.path.join(PARTITION_DIR, DATASETS[file]["table"])
+
+def _partition_path(file, part):
+    return os.path.join(_partition_root(file), part + ".csv")
+
+def _manifest_path(file):
+    return os.path.join(_partition_root(file), "manifest.json")
+
+def _partition_keys(df):
+    """Key partisi "YYYY/MM" per baris."""
+    year, month = _year_month(df)
+    code = year.astype("int32") * 100 + month.astype("int32")
+    return code.map({c: f"{c // 100:04d}/{c % 100:02d}" for c in code.unique().tolist()})
+
+def _partition_stats(df):
+    dates = df["Tanggal"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors="coerce")
+    dates = dates.dropna()
+    return {
+        "rows": len(df),
+        "min": dates.min().strftime("%Y-%m-%d") if len(dates) else None,
+        "max": dates.max().strftime("%Y-%m-%d") if len(dates) else None,
+    }
+
+def _merge_stats(old, new):
+    if not old:
+        return new
+    dates = [d for d in (old["min"], old["max"], new["min"], new["max"]) if d]
+    return {"rows": old["rows"] + new["rows"],
+            "min": min(dates) if dates else None, "max": max(dates) if dates else None}
+
+def _read_manifest(file):
+    try:
+        with open(_manifest_path(file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"partitions": {}}
+
+def _write_manifest(file, partitions):
+    root = _partition_root(file)
+    os.makedirs(root, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=root)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"partitions": dict(sorted(partitions.items()))}, f, indent=1)
+    os.replace(tmp_path, _manifest_path(file))
+
+class PartitionedStorage:
+    """
+    Satu CSV per dataset per bulan (data/<dataset>/<tahun>/<bulan>.csv) dengan manifest
+    jumlah baris & tanggal min/max per partisi. Filter tahun/bulan hanya membaca partisi
+    yang cocok; append hanya menyentuh partisi bulan barisnya.
+    """
+    name = "partitioned"
+
+    def _ensure(self, file):
+        """Migrasi sekali jalan dari CSV lama jika manifest belum ada."""
+        if os.path.exists(_manifest_path(file)):
+            return
+        with file_lock(file):
+            if not os.path.exists(_manifest_path(file)):
+                self.save(file, _csv_current(file))
+
+    def partitions(self, file, filters=None):
+        """Key partisi yang perlu dibaca untuk filter tahun/bulan (dari manifest saja)."""
+        parts = sorted(_read_manifest(file)["partitions"])
+        filters = filters or {}
+        if filters.get("year"):
+            parts = [p for p in parts if int(p[:4]) == int(filters["year"])]
+        if filters.get("month"):
+            parts = [p for p in parts if int(p[5:]) == int(filters["month"])]
+        return parts
+
+    def load(self, file, columns=None, filters=None, select=None):
+        self._ensure(file)
+        return shared_view(file, self.version(file), filters, select,
+                           lambda: self._read(file, columns, filters, select))
+
+    def _read(self, file, columns=None, filters=None, select=None):
+        frames = []
+        for part in self.partitions(file, filters):
+            df = _csv_frame(_partition_path(file, part))
+            if not df.empty:
+                frames.append(_project(_filter_frame(df, filters), select))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=select or columns or [])
+        if len(frames) == 1:
+            return frames[0]
+        return _compact_dtypes(_concat_typed(frames))
+
+    def save(self, file, df):
+        with file_lock(file):
+            partitions = {}
+            if not df.empty and "Tanggal" in df.columns:
+                for part, group in df.groupby(_partition_keys(df), sort=True):
+                    _write_csv_atomic(_partition_path(file, part), group)
+                    partitions[part] = _partition_stats(group)
+            for part in set(_read_manifest(file)["partitions"]) - set(partitions):
+                self._remove(file, part)
+            _write_manifest(file, partitions)
+
+    def _remove(self, file, part):
+        path = _partition_path(file, part)
+        if os.path.exists(path):
+            os.remove(path)
+        invalidate_cache(path)
+
+    def append(self, file, rows, columns):
+        self._ensure(file)
+        new = pd.DataFrame(rows, columns=columns)
+        with file_lock(file):
+            partitions = _read_manifest(file)["partitions"]
+            for part, group in new.groupby(_partition_keys(new), sort=True):
+                _csv_append(_partition_path(file, part), group.to_dict("records"), columns)
+                partitions[part] = _merge_stats(partitions.get(part), _partition_stats(group))
+            _write_manifest(file, partitions)
+
+    def upsert(self, file, key_col, row, columns, position=None):
+        # position tidak dipakai: key dicari di partisi tanggal baris dulu, lalu partisi lain
+        self._ensure(file)
+        with file_lock(file):
+            partitions = _read_manifest(file)["partitions"]
+            order = sorted(partitions)
+            if row.get("Tanggal"):
+                hint = _partition_keys(pd.DataFrame([row]))[0]
+                order = [hint] + [p for p in order if p != hint] if hint in partitions else order
+            found, old = None, None
+            for part in order:
+                df = _csv_frame(_partition_path(file, part))
+                if key_col in df.columns:
+                    pos = locate_row(df, key_col, row[key_col])
+                    if pos is not None:
+                        found, old = part, df.iloc[pos].drop(DERIVED_COLUMNS, errors="ignore").to_dict()
+                        break
+            full = dict(old or {}, **row)
+            target = _partition_keys(pd.DataFrame([full]))[0]
+            if found is not None:
+                df = _plain(_csv_frame(_partition_path(file, found)).drop(columns=DERIVED_COLUMNS, errors="ignore"))
+                if found == target:
+                    for c in columns:
+                        if c not in df.columns:
+                            df[c] = ""
+                        elif c not in NUMERIC_COLUMNS and c not in DATE_COLUMNS and df[c].dtype != object:
+                            df[c] = df[c].astype(object)  # kolom teks yang kosong semua terbaca float
+                    # nilai baru diberi tipe yang sama dengan kolom partisi (tanggal/angka)
+                    values = _coerce_types(pd.DataFrame([row])).iloc[0]
+                    for k in row:
+                        df.at[df.index[pos], k] = values[k]
+                else:
+                    # Tanggal berubah ke bulan lain: baris pindah partisi
+                    df = df.drop(index=df.index[pos])
+                if df.empty:
+                    self._remove(file, found)
+                    del partitions[found]
+                else:
+                    _write_csv_atomic(_partition_path(file, found), df)
+                    partitions[found] = _partition_stats(df)
+            if found != target:
+                _csv_append(_partition_path(file, target), [full], columns)
+                partitions[target] = _merge_stats(partitions.get(target), _partition_stats(pd.DataFrame([full])))
+            _write_manifest(file, partitions)
+        # posisi dalam urutan load (partisi terurut, lalu urutan baris di file); dihitung dari
+        # manifest tanpa memuat partisi lain. Baris yang pindah partisi menggeser baris lain -> None.
+        before_rows = sum(partitions[p]["rows"] for p in partitions if p < target)
+        if found == target:
+            return old, before_rows + pos
+        if found is None and target == max(partitions):
+            return old, before_rows + partitions[target]["rows"] - 1
+        return old, None
+
+    def version(self, file):
+        self._ensure(file)
+        try:
+            stat = os.stat(_manifest_path(file))
+        except OSError:
+            return None
+        return [self.name, stat.st_mtime_ns, stat.st_size]
+
+    def years(self, file):
+        self._ensure(file)
+        return sorted({int(p[:4]) for p in _read_manifest(file)["partitions"]} - {0})
+
+    def distinct(self, file, column):
+        df = self.load(file, select=[column])
+        if df.empty or column not in df.columns:
+            return []
+        return sorted(df[column].dropna().unique().tolist())
+
+@process_resource
+def get_storage(backend=STORAGE_BACKEND, path=SQLITE_PATH):
+    if backend == "sqlite":
+        return SqliteStorage(path)
+    if backend == "parquet":
+        if HAS_PARQUET:
+            return ParquetStorage()
+        warnings.warn("K3_STORAGE=parquet tetapi pyarrow tidak terpasang (pip install pyarrow); "
+                      "memakai backend CSV.", RuntimeWarning, stacklevel=2)
+    if backend == "partitioned":
+        return PartitionedStorage()
+    return CsvStorage()
+
+def compact_storage():
+    """Padatkan log ke snapshot/file utama untuk semua dataset (backend parquet dan csv)."""
+    storage = get_storage()
+    if not hasattr(storage, "compact"):
+        return []
+    for file in DATASETS:
+        storage.compact(file)
+    return list(DATASETS)
+
+def load_data(file, columns=None, filters=None, select=None):
+    """
+    Load dataset dari backend aktif. filters (opsional): {"year", "month", "proyek"}.
+    select (opsional): hanya kolom ini (+ _year/_month) yang dimuat.
+    Jika data belum ada -> DataFrame kosong dengan kolom (jika diberikan).
+    """
+    with profile_stage(f"load_data {os.path.basename(file)}"):
+        df = get_storage().load(file, columns, filters, select)
+    profile_count("rows", len(df))
+    return df
 
 def save_data(file, df):
-    # Pastikan folder ada jika file berada di subfolder
-    dirname = os.path.dirname(file)
-    if dirname:
-        os.makedirs(dirname, exist_ok=True)
-    df.to_csv(file, index=False)
+    with file_lock(file):
+        get_storage().save(file, df)
+        drop_views(file)
+        _rollup_reset(file, df)
+
+def append_rows(file, rows, columns):
+    with file_lock(file):
+        before = get_storage().version(file)
+        get_storage().append(file, rows, columns)
+        drop_views(file)
+        added = pd.DataFrame(rows, columns=columns)
+        _rollup_apply(file, before, added=added)
+        _search_index_apply(file, before, added)
+        _timeseries_apply(file, before, added)
+        if file == FILE_PATROL:
+            _patrol_history_apply(before, rows)
+
+def upsert_row(file, key_col, row, columns):
+    """
+    Mengembalikan True jika baris lama di-update, False jika baris baru. Data terbaru
+    dibaca ulang lewat load_data hanya jika dibutuhkan (cache/shared view per versi).
+    """
+    with file_lock(file):
+        before = get_storage().version(file)
+        position = patrol_row(row[key_col]) if file == FILE_PATROL else None
+        old, position = get_storage().upsert(file, key_col, row, columns, position)
+        drop_views(file)
+        new = dict(old or {}, **row)
+        removed = pd.DataFrame([old]) if old else None
+        _rollup_apply(file, before, added=pd.DataFrame([new]), removed=removed)
+        _search_index_apply(file, before, pd.DataFrame([new]), replace_ref=row[key_col] if old else None)
+        _timeseries_apply(file, before, pd.DataFrame([new]), removed=removed)
+        if file == FILE_PATROL:
+            _patrol_history_apply(before, [new])
+        if file == FILE_PATROL and position is not None:
+            # posisi None: baris lain bisa ikut bergeser (mis. pindah partisi)
+            # -> indeks dibangun ulang saat lookup berikutnya
+            _patrol_index_add(before, row[key_col], position)
+    return old is not None
+
+def available_years(file):
+    return get_storage().years(file)
+
+def distinct_values(file, column):
+    return get_storage().distinct(file, column)
+
+def import_csv_to_sqlite(path=SQLITE_PATH):
+    """Impor sekali jalan: salin isi semua CSV ke database SQLite (menimpa isi tabel)."""
+    target = SqliteStorage(path)
+    counts = {}
+    for file, meta in DATASETS.items():
+        df = _csv_load(file, meta["columns"])
+        for c in meta["columns"]:
+            if c not in df.columns:
+                df[c] = None
+        target.save(file, df)
+        counts[meta["table"]] = len(df)
+    return counts
+
+# =========================
+# Indeks Safety Patrol (Kode Temuan)
+# =========================
+# Indeks persisten Kode Temuan -> posisi baris, dan nomor urut harian yang atomik,
+# sehingga pembuatan kode, cek keberadaan, dan update tidak perlu memindai seluruh data.
+PATROL_INDEX_DB = "data_patrol_index.db"
+KODE_TEMUAN_RE = re.compile(r"^SP-(\d{8})-(\d+)$")
+
+@contextmanager
+def _patrol_index_db(immediate=True):
+    """immediate=False: transaksi baca (deferred), tidak mengantre di belakang penulis."""
+    conn = sqlite3.connect(PATROL_INDEX_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kode (kode TEXT PRIMARY KEY, row INTEGER)")
+        conn.execute("CREATE TABLE IF NOT EXISTS seq (day TEXT PRIMARY KEY, n INTEGER)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _patrol_index_version(conn):
+    row = conn.execute("SELECT v FROM meta WHERE k = 'version'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_patrol_index_version(conn, version):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (json.dumps(version),))
+
+def _ensure_patrol_index(conn):
+    """Bangun ulang indeks jika data patrol berubah di luar aplikasi (versi tidak cocok)."""
+    version = get_storage().version(FILE_PATROL)
+    if _patrol_index_version(conn) == version:
+        return
+    df = load_data(FILE_PATROL, COLUMNS_PATROL_FULL, select=["Kode Temuan"])
+    conn.execute("DELETE FROM kode")
+    if "Kode Temuan" in df.columns:
+        pairs = [(k, i) for i, k in enumerate(df["Kode Temuan"].tolist()) if isinstance(k, str) and k]
+        # baris pertama yang menang, sama seperti lookup sebelumnya
+        conn.executemany("INSERT OR IGNORE INTO kode VALUES (?, ?)", pairs)
+    _set_patrol_index_version(conn, version)
+
+def patrol_row(kode):
+    """Posisi baris Kode Temuan di data patrol, atau None jika belum ada."""
+    version = get_storage().version(FILE_PATROL)
+    with _patrol_index_db(immediate=False) as conn:
+        fresh = _patrol_index_version(conn) == version
+        row = conn.execute("SELECT row FROM kode WHERE kode = ?", (kode,)).fetchone() if fresh else None
+    if not fresh:
+        # indeks tertinggal: dibangun ulang dalam transaksi tulis
+        with _patrol_index_db() as conn:
+            _ensure_patrol_index(conn)
+            row = conn.execute("SELECT row FROM kode WHERE kode = ?", (kode,)).fetchone()
+    return row[0] if row else None
+
+def _patrol_index_add(before_version, kode, row):
+    with _patrol_index_db() as conn:
+        if _patrol_index_version(conn) != before_version:
+            return  # indeks sudah tidak sinkron, dibangun ulang saat lookup berikutnya
+        conn.execute("INSERT OR IGNORE INTO kode VALUES (?, ?)", (kode, row))
+        _set_patrol_index_version(conn, get_storage().version(FILE_PATROL))
+
+def next_kode_temuan(now=None):
+    """Kode baru SP-YYYYMMDD-NNN dari nomor urut harian (atomik antar sesi/proses)."""
+    return allocate_kode_temuan([now or datetime.now()])[0]
+
+def allocate_kode_temuan(dates, reserved=()):
+    """
+    Kode baru untuk banyak baris sekaligus (urutan sama dengan `dates`): rentang nomor
+    per hari dipesan dalam SATU transaksi, bukan satu transaksi per baris.
+    reserved: kode SP-YYYYMMDD-NNN yang sudah dipakai baris lain di batch yang sama (mis. impor);
+    nomor urut harinya dinaikkan dulu agar tidak diterbitkan lagi, di batch ini maupun sesudahnya.
+    """
+    days = [d.strftime("%Y%m%d") for d in dates]
+    counts = {}
+    for day in days:
+        counts[day] = counts.get(day, 0) + 1
+    floor = {}
+    for kode in reserved:
+        match = KODE_TEMUAN_RE.match(kode) if isinstance(kode, str) else None
+        if match:
+            day, nomor = match.group(1), int(match.group(2))
+            floor[day] = max(floor.get(day, 0), nomor)
+            counts.setdefault(day, 0)
+    start = {}
+    with _patrol_index_db() as conn:
+        for day, count in counts.items():
+            prefix = f"SP-{day}-"
+            current = conn.execute("SELECT n FROM seq WHERE day = ?", (day,)).fetchone()
+            if current is None:
+                # hari pertama dipakai: lanjutkan dari nomor terbesar yang sudah ada di data
+                _ensure_patrol_index(conn)
+                existing = conn.execute("SELECT kode FROM kode WHERE kode >= ? AND kode < ?",
+                                        (prefix, prefix + "\uffff")).fetchall()
+                numbers = [int(k[len(prefix):]) for (k,) in existing if k[len(prefix):].isdigit()]
+                current = (max(numbers, default=0),)
+            start[day] = max(current[0], floor.get(day, 0))
+            conn.execute("INSERT OR REPLACE INTO seq VALUES (?, ?)", (day, start[day] + count))
+    codes = []
+    for day in days:
+        start[day] += 1
+        codes.append(f"SP-{day}-{start[day]:03d}")
+    return codes
+
+# =========================
+# Rollup Bulanan (agregat untuk grafik dashboard)
+# =========================
+# Agregat (tahun, bulan) x dimensi disimpan sekali dan diperbarui per baris yang disimpan,
+# sehingga grafik & metric di dashboard() tidak perlu memuat data mentah.
+ROLLUP_FILE = "data_rollup.json"
+ROLLUP_TOTAL = "_total"
+# naikkan jika ROLLUP_SPECS berubah: rollup tersimpan dengan skema lama dibangun ulang
+ROLLUP_SCHEMA = 2
+
+# dataset -> [(dimensi, kolom nilai)]; kolom nilai None = hitung jumlah baris.
+# Dimensi berawalan "_" adalah total per bulan (tanpa key).
+ROLLUP_SPECS = {
+    FILE_MANHOURS: [(ROLLUP_TOTAL, "Total Manhours"), ("Tanggal", "Total Manhours")],
+    FILE_ACCIDENT: [(ROLLUP_TOTAL, None), ("Jenis", None)],
+    FILE_PATROL: [(ROLLUP_TOTAL, None), ("Status", None), ("Jenis Temuan", None),
+                  ("_close_days", "_close_days"), ("_closed", "_closed")],
+}
+
+def _patrol_close_columns(df):
+    """Lama penyelesaian temuan (hari, Tanggal -> Tanggal Close) untuk MTTC."""
+    if "Tanggal Close" not in df.columns:
+        return df
+    days = (pd.to_datetime(df["Tanggal Close"], errors="coerce") -
+            pd.to_datetime(df["Tanggal"], errors="coerce")).dt.days
+    valid = days.notna() & (days >= 0)
+    return df.assign(_close_days=days.where(valid, 0), _closed=valid.astype(int))
+
+# dimensi per hari: disimpan terpisah dari sel bulanan (tidak ikut rollup_frame, jumlah selnya
+# tumbuh per hari), dibaca per tanggal lewat rollup_daily()
+ROLLUP_DAILY = {"Tanggal"}
+
+# kolom turunan untuk rollup: dataset -> (kolom sumber tambahan, fungsi)
+ROLLUP_DERIVED = {
+    FILE_PATROL: (["Tanggal Close"], _patrol_close_columns),
+}
+
+@process_resource
+def get_rollup_store():
+    datasets = {}
+    if os.path.exists(ROLLUP_FILE):
+        try:
+            with open(ROLLUP_FILE) as f:
+                for file, entry in json.load(f).items():
+                    if entry.get("schema") != ROLLUP_SCHEMA:
+                        continue
+                    cells = {(d, y, m, k): v for d, y, m, k, v in entry["cells"]}
+                    datasets[file] = _rollup_entry(entry["version"], cells)
+        except (OSError, ValueError, KeyError):
+            datasets = {}
+    return {"lock": threading.RLock(), "datasets": datasets}
+
+def _rollup_cells(file, df, sign=1):
+    """Hitung sel rollup {(dimensi, tahun, bulan, key): nilai} dari DataFrame."""
+    cells = {}
+    if df is None or df.empty or "Tanggal" not in df.columns:
+        return cells
+    if file in ROLLUP_DERIVED:
+        df = ROLLUP_DERIVED[file][1](df)
+    year, month = _year_month(df)
+    base = pd.DataFrame({"year": year, "month": month}, index=df.index)
+    base = base[base["year"] > 0]
+    for dim, value_col in ROLLUP_SPECS.get(file, []):
+        frame = base.copy()
+        if dim.startswith("_"):
+            frame["key"] = ""
+        elif dim == "Tanggal":
+            frame["key"] = pd.to_datetime(df["Tanggal"], errors="coerce").dt.normalize()
+        elif dim in df.columns:
+            frame["key"] = df[dim]
+        else:
+            continue
+        if value_col is None:
+            frame["value"] = 1
+        elif value_col in df.columns:
+            frame["value"] = pd.to_numeric(df[value_col], errors="coerce").fillna(0)
+        else:
+            continue
+        grouped = frame.dropna(subset=["year", "month", "key"]).groupby(["year", "month", "key"], observed=True)["value"].sum()
+        for (y, m, k), v in zip(grouped.index, grouped.tolist()):
+            if not v:
+                continue
+            # tanggal diformat sekali per hari unik, bukan per baris
+            k = k.strftime("%Y-%m-%d") if dim == "Tanggal" else str(k)
+            key = (dim, int(y), int(m), k)
+            cells[key] = cells.get(key, 0) + sign * v
+    return cells
+
+def _rollup_entry(version, cells):
+    """Entry store: sel bulanan ("cells") dan sel harian ("daily") dipisah."""
+    entry = {"version": version, "cells": {}, "daily": {}}
+    _merge_cells(entry, cells)
+    return entry
+
+def _merge_cells(entry, delta):
+    for key, v in delta.items():
+        cells = entry["daily"] if key[0] in ROLLUP_DAILY else entry["cells"]
+        total = cells.get(key, 0) + v
+        if total:
+            cells[key] = total
+        else:
+            cells.pop(key, None)
+
+def _rollup_persist(store, file):
+    """
+    Simpan entry rollup satu dataset. Dibaca-ubah-tulis di bawah file_lock agar proses lain
+    yang menyimpan dataset lain tidak saling menimpa; file ditulis atomik (sementara + rename).
+    """
+    entry = store["datasets"].get(file)
+    with file_lock(ROLLUP_FILE):
+        try:
+            with open(ROLLUP_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if entry is None:
+            data.pop(file, None)
+        else:
+            data[file] = {"version": entry["version"], "schema": ROLLUP_SCHEMA,
+                          "cells": [list(k) + [v] for part in ("cells", "daily") for k, v in entry[part].items()]}
+        dirname = os.path.dirname(os.path.abspath(ROLLUP_FILE))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=dirname)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, ROLLUP_FILE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+def _rollup_reset(file, df):
+    if file not in ROLLUP_SPECS:
+        return
+    store = get_rollup_store()
+    with store["lock"]:
+        store["datasets"][file] = _rollup_entry(get_storage().version(file), _rollup_cells(file, df))
+        _rollup_persist(store, file)
+
+def _rollup_apply(file, before_version, added=None, removed=None):
+    """Perbarui rollup secara inkremental; jika versi tidak cocok, rollup dibangun ulang nanti."""
+    if file not in ROLLUP_SPECS:
+        return
+    store = get_rollup_store()
+    with store["lock"]:
+        entry = store["datasets"].get(file)
+        if entry is None or entry["version"] != before_version:
+            store["datasets"].pop(file, None)
+            return
+        _merge_cells(entry, _rollup_cells(file, added))
+        _merge_cells(entry, _rollup_cells(file, removed, sign=-1))
+        entry["version"] = get_storage().version(file)
+        _rollup_persist(store, file)
+
+def _current_rollup(file):
+    """Entry rollup untuk versi data saat ini; dibangun ulang jika data berubah di luar aplikasi."""
+    store = get_rollup_store()
+    with store["lock"]:
+        version = get_storage().version(file)
+        entry = store["datasets"].get(file)
+        if entry is None or entry["version"] != version:
+            columns = list(dict.fromkeys(
+                ["Tanggal"] + ROLLUP_DERIVED.get(file, ([], None))[0] +
+                [c for spec in ROLLUP_SPECS[file] for c in spec if c and not c.startswith("_")]))
+            entry = _rollup_entry(version, _rollup_cells(file, load_data(file, select=columns)))
+            store["datasets"][file] = entry
+            _rollup_persist(store, file)
+        return entry
+
+def rollup_frame(file, filters=None):
+    """
+    Sel rollup bulanan untuk dataset (difilter tahun/bulan) sebagai DataFrame
+    dengan kolom dim, year, month, key, value. Ukurannya per bulan, bukan per hari.
+    """
+    store = get_rollup_store()
+    with store["lock"], profile_stage(f"rollup {os.path.basename(file)}"):
+        rows = [k + (v,) for k, v in _current_rollup(file)["cells"].items()]
+    df = pd.DataFrame(rows, columns=["dim", "year", "month", "key", "value"])
+    filters = filters or {}
+    if filters.get("year"):
+        df = df[df["year"] == int(filters["year"])]
+    if filters.get("month"):
+        df = df[df["month"] == int(filters["month"])]
+    return df
+
+def rollup_daily(file, day, dim="Tanggal"):
+    """Nilai sel harian (mis. Total Manhours) untuk satu tanggal."""
+    store = get_rollup_store()
+    with store["lock"]:
+        return _current_rollup(file)["daily"].get((dim, day.year, day.month, day.isoformat()), 0)
+
+def rollup_per_month(cells, dim=ROLLUP_TOTAL):
+    """Total per bulan (urut kalender) -> DataFrame kolom Bulan, value."""
+    df = cells[cells["dim"] == dim].groupby("month")["value"].sum().sort_index().reset_index()
+    df["Bulan"] = df["month"].map(BULAN_NAMA)
+    return df[["Bulan", "value"]]
+
+def rollup_per_key(cells, dim):
+    """Total per nilai dimensi, urut menurun (seperti value_counts) -> DataFrame kolom key, value."""
+    df = cells[cells["dim"] == dim].groupby("key")["value"].sum()
+    return df.sort_values(ascending=False).reset_index()
+
+# =========================
+# KPI K3 (LTIFR, TRIR, patrol)
+# =========================
+# Dihitung dari rollup bulanan (yang sudah diperbarui per baris saat simpan): deret per
+# bulan -> jumlah kumulatif, lalu jendela 12 bulan = cum[t] - cum[t-12] dan YTD = cum[t]
+# - cum[Desember tahun lalu]. Menambah data harian tidak memicu hitung ulang dari data mentah.
+KPI_SCALE = 1_000_000
+LTI_JENIS = ["Fatality", "LTI"]
+RECORDABLE_JENIS = ["Fatality", "LTI", "MTC", "PAK"]
+
+@process_resource
+def get_kpi_cache():
+    return {"lock": threading.Lock(), "key": None, "frame": None}
+
+def _monthly(cells, dim, keys=None):
+    """Deret nilai per periode (tahun*12 + bulan-1) untuk satu dimensi rollup."""
+    sel = cells[cells["dim"] == dim]
+    if keys is not None:
+        sel = sel[sel["key"].isin(keys)]
+    period = sel["year"] * 12 + sel["month"] - 1
+    return sel["value"].groupby(period).sum()
+
+def kpi_frame():
+    """
+    KPI per bulan (index: periode) dengan kolom nilai bulanan, _12m (rolling 12 bulan),
+    dan _ytd, plus rate: LTIFR/TRIR per 1.000.000 manhours, close rate, dan MTTC (hari).
+    """
+    files = [FILE_MANHOURS, FILE_ACCIDENT, FILE_PATROL]
+    key = tuple(json.dumps(get_storage().version(f)) for f in files)
+    cache = get_kpi_cache()
+    with cache["lock"]:
+        if cache["key"] == key:
+            return cache["frame"]
+
+    man, acc, patrol = (rollup_frame(f) for f in files)
+    series = {
+        "manhours": _monthly(man, ROLLUP_TOTAL),
+        "lti": _monthly(acc, "Jenis", LTI_JENIS),
+        "recordable": _monthly(acc, "Jenis", RECORDABLE_JENIS),
+        "temuan": _monthly(patrol, ROLLUP_TOTAL),
+        "close": _monthly(patrol, "Status", ["Close"]),
+        "close_days": _monthly(patrol, "_close_days"),
+        "closed": _monthly(patrol, "_closed"),
+    }
+    periods = [p for s_ in series.values() for p in s_.index]
+    if not periods:
+        frame = pd.DataFrame()
+    else:
+        index = pd.RangeIndex(min(periods), max(periods) + 1, name="period")
+        frame = pd.DataFrame({name: s_.reindex(index, fill_value=0) for name, s_ in series.items()},
+                             index=index).astype(float)
+        frame["year"] = frame.index // 12
+        frame["month"] = frame.index % 12 + 1
+        for name in series:
+            cum = frame[name].cumsum()
+            frame[f"{name}_12m"] = cum - cum.shift(12, fill_value=0)
+            frame[f"{name}_ytd"] = frame.groupby("year")[name].cumsum()
+        for window in ("12m", "ytd"):
+            mh = frame[f"manhours_{window}"].where(frame[f"manhours_{window}"] > 0)
+            frame[f"ltifr_{window}"] = frame[f"lti_{window}"] * KPI_SCALE / mh
+            frame[f"trir_{window}"] = frame[f"recordable_{window}"] * KPI_SCALE / mh
+            temuan = frame[f"temuan_{window}"].where(frame[f"temuan_{window}"] > 0)
+            frame[f"close_rate_{window}"] = frame[f"close_{window}"] / temuan
+            closed = frame[f"closed_{window}"].where(frame[f"closed_{window}"] > 0)
+            frame[f"mttc_{window}"] = frame[f"close_days_{window}"] / closed
+
+    with cache["lock"]:
+        cache["key"], cache["frame"] = key, frame
+    return frame
+
+def kpi_at(frame, year=None, month=None):
+    """Baris KPI untuk akhir periode terpilih (bulan terakhir berdata jika tidak dipilih)."""
+    if frame.empty:
+        return None
+    rows = frame
+    if year:
+        rows = rows[rows["year"] == year]
+    if month:
+        rows = rows[rows["month"] == month]
+    return rows.iloc[-1] if not rows.empty else None
+
+def _kpi_text(value, fmt, suffix=""):
+    return "-" if value is None or pd.isna(value) else format(value, fmt) + suffix
+
+# =========================
+# Indeks Pencarian Teks (SQLite FTS5)
+# =========================
+# Kronologi accident, Deskripsi/Catatan Progress patrol, dan teks PDF diindeks di
+# data_search.db. Indeks diperbarui per baris saat save/upload; dataset dibangun ulang
+# hanya jika versinya berubah di luar aplikasi (sama seperti indeks Kode Temuan).
+SEARCH_DB = "data_search.db"
+SEARCH_SOURCES = {FILE_ACCIDENT: "accident", FILE_PATROL: "patrol"}
+SEARCH_COLUMNS = {
+    FILE_ACCIDENT: ["Tanggal", "Jenis", "Kronologi"],
+    FILE_PATROL: ["Kode Temuan", "Tanggal", "Jenis Temuan", "Status", "Deskripsi", "Catatan Progress"],
+}
+PDF_TEXT_LIMIT = 2 * 2**20
+# batas total hasil dekompresi content stream per PDF (operator + teks), agar stream
+# FlateDecode yang membengkak tidak dimuat utuh ke memori
+PDF_INFLATE_LIMIT = 4 * PDF_TEXT_LIMIT
+
+@contextmanager
+def _search_db(immediate=True):
+    """immediate=False: transaksi baca (deferred), tidak mengantre di belakang penulis."""
+    conn = sqlite3.connect(SEARCH_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5("
+                     "source UNINDEXED, ref UNINDEXED, tanggal UNINDEXED, title, body, "
+                     "tokenize = 'unicode61 remove_diacritics 2')")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS pdf_indexed (name TEXT PRIMARY KEY, sha256 TEXT)")
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _text(value):
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value)
+
+def _search_docs(file, df):
+    """Baris DataFrame -> tuple (source, ref, tanggal, title, body) untuk tabel docs."""
+    source = SEARCH_SOURCES[file]
+    docs = []
+    for row in df.to_dict("records"):
+        tanggal = row.get("Tanggal")
+        tanggal = tanggal.strftime("%Y-%m-%d") if hasattr(tanggal, "strftime") else _text(tanggal)
+        if source == "accident":
+            docs.append((source, "", tanggal, _text(row.get("Jenis")), _text(row.get("Kronologi"))))
+        else:
+            title = " - ".join(t for t in (_text(row.get("Jenis Temuan")), _text(row.get("Status"))) if t)
+            body = "\n".join(t for t in (_text(row.get("Deskripsi")), _text(row.get("Catatan Progress"))) if t)
+            docs.append((source, _text(row.get("Kode Temuan")), tanggal, title, body))
+    return docs
+
+def _search_version(conn, source):
+    row = conn.execute("SELECT v FROM meta WHERE k = ?", (source,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_search_version(conn, source, version):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (source, json.dumps(version)))
+
+def _ensure_search_index(conn, file):
+    version = get_storage().version(file)
+    source = SEARCH_SOURCES[file]
+    if _search_version(conn, source) == version:
+        return
+    conn.execute("DELETE FROM docs WHERE source = ?", (source,))
+    conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", _search_docs(file, load_data(file, select=SEARCH_COLUMNS[file])))
+    _set_search_version(conn, source, version)
+
+def _search_index_apply(file, before_version, added, replace_ref=None):
+    """Tambah baris baru ke indeks; baris patrol yang di-update diganti berdasarkan Kode Temuan."""
+    if file not in SEARCH_SOURCES:
+        return
+    source = SEARCH_SOURCES[file]
+    with _search_db() as conn:
+        if _search_version(conn, source) != before_version:
+            return  # indeks sudah tidak sinkron, dibangun ulang saat pencarian berikutnya
+        if replace_ref:
+            conn.execute("DELETE FROM docs WHERE source = ? AND ref = ?", (source, replace_ref))
+        conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", _search_docs(file, added))
+        _set_search_version(conn, source, get_storage().version(file))
+
+_PDF_STREAM_RE = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+_PDF_TEXT_RE = re.compile(rb"\[((?:[^\]\\]|\\.)*)\]\s*TJ|\(((?:[^()\\]|\\.)*)\)\s*(?:Tj|'|\")", re.S)
+# string, atau spasi antar kata (geser kerning besar) di dalam array TJ
+_PDF_TJ_PART_RE = re.compile(rb"\(((?:[^()\\]|\\.)*)\)|(-?\d+(?:\.\d+)?)", re.S)
+_PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"", b"f": b""}
+
+def _pdf_unescape(raw):
+    def repl(m):
+        esc = m.group(1)
+        if esc[:1].isdigit():
+            return bytes([int(esc, 8) & 0xFF])
+        return _PDF_ESCAPES.get(esc, esc)
+    return re.sub(rb"\\([0-7]{1,3}|.)", repl, raw, flags=re.S)
+
+def extract_pdf_text(path, limit=PDF_TEXT_LIMIT):
+    """
+    Ekstraksi teks sederhana tanpa library PDF: operator Tj/TJ di content stream
+    (FlateDecode atau tanpa kompresi). PDF hasil scan atau font CID tidak menghasilkan teks.
+    """
+    parts, size, inflate = [], 0, PDF_INFLATE_LIMIT
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in _PDF_STREAM_RE.finditer(mm):
+                data = m.group(1)
+                try:
+                    # hasil dekompresi dibatasi sisa jatah; sisa stream sesudahnya diabaikan
+                    data = zlib.decompressobj().decompress(data, inflate)
+                    inflate -= len(data)
+                except zlib.error:
+                    pass
+                for t in _PDF_TEXT_RE.finditer(data):
+                    if t.group(1) is None:
+                        chunks = [_pdf_unescape(t.group(2))]
+                    else:
+                        chunks = [_pdf_unescape(string) if num == b"" else (b" " if float(num) <= -150 else b"")
+                                  for string, num in _PDF_TJ_PART_RE.findall(t.group(1))]
+                    text = b"".join(chunks).decode("latin-1")
+                    parts.append(text)
+                    size += len(text)
+                if size >= limit or inflate <= 0:
+                    break
+    return " ".join(parts)[:limit]
+
+def sync_pdf_search(catalog):
+    """catalog: {nama: sha256}. Hanya PDF baru/berubah yang diekstrak; yang dihapus dibuang."""
+    with _search_db() as conn:
+        indexed = dict(conn.execute("SELECT name, sha256 FROM pdf_indexed"))
+        for name, sha in indexed.items():
+            if catalog.get(name) != sha:
+                conn.execute("DELETE FROM docs WHERE source = 'pdf' AND ref = ?", (name,))
+                conn.execute("DELETE FROM pdf_indexed WHERE name = ?", (name,))
+        for name, sha in catalog.items():
+            if indexed.get(name) == sha:
+                continue
+            try:
+                body = extract_pdf_text(os.path.join(PDF_DIR, name))
+            except OSError:
+                continue
+            conn.execute("INSERT INTO docs VALUES ('pdf', ?, '', ?, ?)", (name, name, body))
+            conn.execute("INSERT INTO pdf_indexed VALUES (?, ?)", (name, sha))
+
+def _fts_query(text):
+    """Kata kunci bebas -> query FTS5 (setiap kata wajib ada, kata terakhir boleh prefiks)."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = ['"' + w.replace('"', '') + '"' for w in words]
+    terms[-1] += "*"
+    return " AND ".join(terms)
+
+def search(text, sources=("accident", "patrol", "pdf"), limit=50):
+    """Hasil pencarian terurut relevansi (bm25) sebagai list dict."""
+    query = _fts_query(text)
+    if query is None:
+        return []
+    files = [file for file, source in SEARCH_SOURCES.items() if source in sources]
+    versions = {file: get_storage().version(file) for file in files}
+    marks = ",".join("?" * len(sources))
+    sql = (f"SELECT source, ref, tanggal, title, snippet(docs, 4, '**', '**', ' … ', 16) "
+           f"FROM docs WHERE docs MATCH ? AND source IN ({marks}) "
+           "ORDER BY bm25(docs, 0, 0, 0, 2.0, 1.0) LIMIT ?")
+    with _search_db(immediate=False) as conn:
+        stale = [file for file in files if _search_version(conn, SEARCH_SOURCES[file]) != versions[file]]
+        rows = None if stale else conn.execute(sql, [query, *sources, limit]).fetchall()
+    if stale:
+        # indeks tertinggal: dibangun ulang dalam transaksi tulis
+        with _search_db() as conn:
+            for file in stale:
+                _ensure_search_index(conn, file)
+            rows = conn.execute(sql, [query, *sources, limit]).fetchall()
+    keys = ["source", "ref", "tanggal", "title", "snippet"]
+    return [dict(zip(keys, row)) for row in rows]
+
+# =========================
+# Time-series Manpower per Proyek
+# =========================
+# Jumlah pekerja per (Proyek, tanggal) dan rata-rata jam kerja harian (dari data manhours)
+# di data_timeseries.db, berurutan menurut primary key (proyek, tanggal) sehingga query
+# rentang tanggal per proyek tidak memindai seluruh register. Diperbarui per baris yang
+# disimpan; dibangun ulang hanya jika data berubah di luar aplikasi.
+TIMESERIES_DB = "data_timeseries.db"
+TIMESERIES_SOURCES = {FILE_MANPOWER: "manpower", FILE_MANHOURS: "manhours"}
+# jam kerja per orang jika hari itu tidak ada data manhours
+JAM_KERJA_DEFAULT = 8
+TIMESERIES_FREQ = {"D": "D", "W": "W-SUN", "M": "MS"}
+
+@contextmanager
+def _timeseries_db(immediate=True):
+    """immediate=False: transaksi baca (deferred), tidak mengantre di belakang penulis."""
+    conn = sqlite3.connect(TIMESERIES_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS pekerja (proyek TEXT, tanggal TEXT, jumlah REAL, "
+                     "PRIMARY KEY (proyek, tanggal)) WITHOUT ROWID")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pekerja_tanggal ON pekerja (tanggal)")
+        conn.execute("CREATE TABLE IF NOT EXISTS jam (tanggal TEXT PRIMARY KEY, jam_total REAL, n INTEGER) "
+                     "WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _timeseries_deltas(file, df, sign=1):
+    """Baris delta untuk tabel pekerja (manpower) atau jam (manhours)."""
+    if df is None or df.empty:
+        return []
+    tanggal = pd.to_datetime(df["Tanggal"], errors="coerce").dt.strftime("%Y-%m-%d")
+    if file == FILE_MANPOWER:
+        frame = pd.DataFrame({"proyek": df["Proyek"].astype(object).fillna("").astype(str), "tanggal": tanggal,
+                              "jumlah": pd.to_numeric(df["Jumlah Pekerja"], errors="coerce").fillna(0)})
+        grouped = frame.dropna(subset=["tanggal"]).groupby(["proyek", "tanggal"])["jumlah"].sum()
+        return [(p, t, sign * v) for (p, t), v in zip(grouped.index, grouped.tolist())]
+    jam = pd.to_numeric(df["Jam Kerja"], errors="coerce")
+    frame = pd.DataFrame({"tanggal": tanggal, "jam": jam}).dropna()
+    grouped = frame.groupby("tanggal")["jam"].agg(["sum", "count"])
+    return [(t, sign * total, sign * int(n)) for t, total, n in
+            zip(grouped.index, grouped["sum"].tolist(), grouped["count"].tolist())]
+
+def _timeseries_write(conn, file, deltas):
+    if file == FILE_MANPOWER:
+        conn.executemany("INSERT INTO pekerja VALUES (?, ?, ?) ON CONFLICT(proyek, tanggal) "
+                         "DO UPDATE SET jumlah = jumlah + excluded.jumlah", deltas)
+        conn.execute("DELETE FROM pekerja WHERE jumlah = 0")
+    else:
+        conn.executemany("INSERT INTO jam VALUES (?, ?, ?) ON CONFLICT(tanggal) "
+                         "DO UPDATE SET jam_total = jam_total + excluded.jam_total, n = n + excluded.n", deltas)
+        conn.execute("DELETE FROM jam WHERE n <= 0")
+
+def _timeseries_version(conn, source):
+    row = conn.execute("SELECT v FROM meta WHERE k = ?", (source,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_timeseries_version(conn, source, version):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (source, json.dumps(version)))
+
+def _ensure_timeseries(conn, file):
+    version = get_storage().version(file)
+    source = TIMESERIES_SOURCES[file]
+    if _timeseries_version(conn, source) == version:
+        return
+    conn.execute("DELETE FROM pekerja" if file == FILE_MANPOWER else "DELETE FROM jam")
+    select = ["Tanggal", "Proyek", "Jumlah Pekerja"] if file == FILE_MANPOWER else ["Tanggal", "Jam Kerja"]
+    _timeseries_write(conn, file, _timeseries_deltas(file, load_data(file, select=select)))
+    _set_timeseries_version(conn, source, version)
+
+def _timeseries_apply(file, before_version, added, removed=None):
+    """Perbarui time-series dengan baris baru (dan baris lama yang diganti)."""
+    if file not in TIMESERIES_SOURCES:
+        return
+    source = TIMESERIES_SOURCES[file]
+    with _timeseries_db() as conn:
+        if _timeseries_version(conn, source) != before_version:
+            return  # sudah tidak sinkron, dibangun ulang saat query berikutnya
+        _timeseries_write(conn, file, _timeseries_deltas(file, removed, sign=-1) +
+                          _timeseries_deltas(file, added))
+        _set_timeseries_version(conn, source, get_storage().version(file))
+
+def manpower_timeseries(proyek=None, start=None, end=None, freq="D"):
+    """
+    Jumlah pekerja dan manhours (pekerja x rata-rata jam kerja hari itu) per Proyek per
+    periode. start/end: tanggal inklusif (opsional); freq: D (harian), W (mingguan), M (bulanan).
+    Kolom: Proyek, Tanggal, Jumlah Pekerja, Manhours.
+    """
+    where, params = [], []
+    if proyek:
+        where.append("p.proyek = ?")
+        params.append(proyek)
+    if start is not None:
+        where.append("p.tanggal >= ?")
+        params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+    if end is not None:
+        where.append("p.tanggal <= ?")
+        params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+    sql = ("SELECT p.proyek, p.tanggal, p.jumlah, p.jumlah * COALESCE(j.jam_total / j.n, ?) "
+           "FROM pekerja p LEFT JOIN jam j ON j.tanggal = p.tanggal")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY p.proyek, p.tanggal"
+    versions = {file: get_storage().version(file) for file in TIMESERIES_SOURCES}
+    with _timeseries_db(immediate=False) as conn:
+        stale = [file for file in TIMESERIES_SOURCES
+                 if _timeseries_version(conn, TIMESERIES_SOURCES[file]) != versions[file]]
+        rows = None if stale else conn.execute(sql, [JAM_KERJA_DEFAULT] + params).fetchall()
+    if stale:
+        # tertinggal: dibangun ulang dalam transaksi tulis
+        with _timeseries_db() as conn:
+            for file in stale:
+                _ensure_timeseries(conn, file)
+            rows = conn.execute(sql, [JAM_KERJA_DEFAULT] + params).fetchall()
+    df = pd.DataFrame(rows, columns=["Proyek", "Tanggal", "Jumlah Pekerja", "Manhours"])
+    df["Tanggal"] = pd.to_datetime(df["Tanggal"])
+    if freq != "D" and not df.empty:
+        df = (df.groupby(["Proyek", pd.Grouper(key="Tanggal", freq=TIMESERIES_FREQ[freq])])
+                [["Jumlah Pekerja", "Manhours"]].sum().reset_index())
+    return df
+
+# =========================
+# Riwayat Safety Patrol (event log)
+# =========================
+# Setiap perubahan temuan patrol dicatat sebagai delta per kolom di tabel events (append-only,
+# waktu tidak pernah mundur terhadap urutan seq). state = kondisi terkini hasil replay,
+# spans = rentang waktu per status. Checkpoint (state terkompresi) dibuat berkala sehingga
+# query "per tanggal X" cukup membaca checkpoint terdekat lalu me-replay sebagian kecil event.
+PATROL_HISTORY_DB = "data_patrol_history.db"
+# checkpoint baru setelah max(HISTORY_CHECKPOINT_MIN, jumlah temuan / 4) event
+HISTORY_CHECKPOINT_MIN = 1000
+HISTORY_DELETED = "_deleted"
+# waktu temuan lama yang tanggalnya tidak valid (diurutkan paling awal)
+HISTORY_EPOCH = "0001-01-01T00:00:00"
+
+@contextmanager
+def _history_db():
+    conn = sqlite3.connect(PATROL_HISTORY_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY, kode TEXT, ts TEXT, "
+                     "source TEXT, delta TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_kode ON events (kode, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state (kode TEXT PRIMARY KEY, row TEXT) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS spans (kode TEXT, status TEXT, start_ts TEXT, end_ts TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_kode ON spans (kode, end_ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_status ON spans (status, start_ts)")
+        conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (seq INTEGER PRIMARY KEY, ts TEXT, "
+                     "rows INTEGER, state BLOB)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_checkpoints_ts ON checkpoints (ts)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _history_rows(df):
+    """DataFrame patrol -> {Kode Temuan: dict teks (format seperti di CSV)}, diformat per kolom."""
+    if df.empty or "Kode Temuan" not in df.columns:
+        return {}
+    df = df[df["Kode Temuan"].map(lambda k: isinstance(k, str) and k != "").astype(bool)]
+    text = {}
+    for c in COLUMNS_PATROL_FULL:
+        if c == "Kode Temuan":
+            continue
+        col = df[c].astype(object) if c in df.columns else pd.Series("", index=df.index, dtype=object)
+        value = col.where(col.notna(), "").astype(str)
+        if c in ("Tanggal", "Tanggal Close"):
+            value = value.str.strip()
+            parsed = pd.to_datetime(col.where(value != ""), errors="coerce")
+            # Tanggal tidak valid terbaca NaT dari storage -> kosong; Tanggal Close tetap teks
+            value = parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), "" if c in DATE_COLUMNS else value)
+        text[c] = value.tolist()
+    columns = list(text)
+    return {kode: dict(zip(columns, values))
+            for kode, values in zip(df["Kode Temuan"].tolist(), zip(*text.values()))}
+
+def _history_delta(old, new):
+    """Kolom yang berubah (semua kolom untuk temuan baru)."""
+    if old is None:
+        return dict(new)
+    return {c: v for c, v in new.items() if old.get(c) != v}
+
+def _history_ts(when=None):
+    """Tanggal/datetime -> teks ISO; tanggal tanpa jam berarti akhir hari itu."""
+    if when is None:
+        return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    ts = pd.Timestamp(when)
+    if ts == ts.normalize():
+        ts += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S")
+
+def _history_now(conn):
+    """Waktu event baru, tidak pernah lebih awal dari event terakhir."""
+    last = conn.execute("SELECT MAX(ts) FROM events").fetchone()[0]
+    now = _history_ts()
+    return max(now, last) if last else now
+
+def _history_version(conn):
+    row = conn.execute("SELECT v FROM meta WHERE k = 'version'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_history_version(conn, version):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (json.dumps(version),))
+
+def _history_record(conn, events, source):
+    """Tulis event [(kode, ts, delta)] (urut waktu) dan perbarui state, spans, checkpoint."""
+    # jumlah temuan & event sejak checkpoint dihitung berjalan, bukan COUNT(*) per event
+    rows = conn.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+    last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM checkpoints").fetchone()[0]
+    for kode, ts, delta in events:
+        if not delta:
+            continue
+        seq = conn.execute("INSERT INTO events (kode, ts, source, delta) VALUES (?, ?, ?, ?)",
+                           (kode, ts, source, json.dumps(delta))).lastrowid
+        current = conn.execute("SELECT row FROM state WHERE kode = ?", (kode,)).fetchone()
+        if delta.get(HISTORY_DELETED):
+            conn.execute("DELETE FROM state WHERE kode = ?", (kode,))
+            conn.execute("UPDATE spans SET end_ts = ? WHERE kode = ? AND end_ts IS NULL", (ts, kode))
+            rows -= current is not None
+        else:
+            row = dict(json.loads(current[0]) if current else {}, **delta)
+            conn.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (kode, json.dumps(row)))
+            if current is None or "Status" in delta:
+                conn.execute("UPDATE spans SET end_ts = ? WHERE kode = ? AND end_ts IS NULL", (ts, kode))
+                conn.execute("INSERT INTO spans VALUES (?, ?, ?, NULL)", (kode, row.get("Status", ""), ts))
+            rows += current is None
+        if seq - last >= max(HISTORY_CHECKPOINT_MIN, rows // 4):
+            _write_checkpoint(conn, seq, ts, rows)
+            last = seq
+
+def _write_checkpoint(conn, seq, ts, rows):
+    # isi state sudah berupa JSON per baris: digabung langsung tanpa decode ulang
+    body = ",".join(f"{json.dumps(k)}:{r}" for k, r in conn.execute("SELECT kode, row FROM state"))
+    conn.execute("INSERT INTO checkpoints VALUES (?, ?, ?, ?)",
+                 (seq, ts, rows, zlib.compress(("{" + body + "}").encode())))
+
+def _seed_events(current, now):
+    """
+    Event awal dari data yang sudah ada: temuan tercatat pada Tanggal-nya; temuan Close
+    dengan Tanggal Close valid dicatat Open lalu Close pada Tanggal Close. Tanggal di masa
+    depan dicatat pada `now`, agar waktu event berikutnya tidak ikut terdorong ke sana.
+    """
+    if not current:
+        return []
+    frame = pd.DataFrame(list(current.values()), columns=["Tanggal", "Status", "Tanggal Close"])
+    found = pd.to_datetime(frame["Tanggal"].where(frame["Tanggal"] != ""), errors="coerce")
+    found = found.dt.strftime("%Y-%m-%dT00:00:00").fillna(HISTORY_EPOCH)
+    found = found.where(found <= now, now)
+    close = pd.to_datetime(frame["Tanggal Close"].where(frame["Tanggal Close"] != ""), errors="coerce")
+    close = close.dt.strftime("%Y-%m-%dT00:00:00").fillna("")
+    close = close.where(close <= now, now)
+    split = (frame["Status"] == "Close") & (close != "") & (close >= found)
+    events = []
+    for (kode, row), found_ts, close_ts, closed in zip(current.items(), found.tolist(), close.tolist(),
+                                                         split.tolist()):
+        if closed:
+            events.append((kode, found_ts, dict(row, Status="Open", **{"Tanggal Close": ""})))
+            events.append((kode, close_ts, {"Status": "Close", "Tanggal Close": row["Tanggal Close"]}))
+        else:
+            events.append((kode, found_ts, row))
+    events.sort(key=lambda e: e[1])
+    return events
+
+def _ensure_patrol_history(conn):
+    """Samakan log dengan data patrol jika data diubah tanpa lewat upsert/append aplikasi."""
+    version = get_storage().version(FILE_PATROL)
+    if _history_version(conn) == version:
+        return
+    current = _history_rows(load_data(FILE_PATROL))
+    known = {k: json.loads(r) for k, r in conn.execute("SELECT kode, row FROM state")}
+    now = _history_now(conn)
+    if not known and conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None:
+        _history_record(conn, _seed_events(current, now), "seed")
+    else:
+        events = [(k, now, _history_delta(known.get(k), row)) for k, row in current.items()]
+        events += [(k, now, {HISTORY_DELETED: True}) for k in known if k not in current]
+        _history_record(conn, events, "sync")
+    _set_history_version(conn, version)
+
+def _patrol_history_apply(before_version, rows):
+    """Catat baris patrol yang baru disimpan (upsert/append) sebagai event."""
+    with _history_db() as conn:
+        if _history_version(conn) != before_version:
+            _ensure_patrol_history(conn)  # log tertinggal: disamakan dari data (termasuk baris ini)
+            return
+        now = _history_now(conn)
+        events = []
+        for kode, row in _history_rows(pd.DataFrame(rows)).items():
+            current = conn.execute("SELECT row FROM state WHERE kode = ?", (kode,)).fetchone()
+            events.append((kode, now, _history_delta(json.loads(current[0]) if current else None, row)))
+        _history_record(conn, events, "app")
+        _set_history_version(conn, get_storage().version(FILE_PATROL))
+
+def patrol_history(kode):
+    """Riwayat satu temuan: list dict Waktu, Sumber, Perubahan ("Kolom: lama -> baru")."""
+    with _history_db() as conn:
+        _ensure_patrol_history(conn)
+        events = conn.execute("SELECT ts, source, delta FROM events WHERE kode = ? ORDER BY seq",
+                              (kode,)).fetchall()
+    history, row = [], {}
+    for ts, source, delta in events:
+        delta = json.loads(delta)
+        if delta.get(HISTORY_DELETED):
+            changes = ["dihapus"]
+            row = {}
+        else:
+            changes = [f"{c}: {row[c] or '-'} → {v or '-'}" if c in row else f"{c}: {v or '-'}"
+                       for c, v in delta.items()]
+            row.update(delta)
+        history.append({"Waktu": ts.replace("T", " "), "Sumber": source, "Perubahan": "; ".join(changes)})
+    return history
+
+def patrol_as_of(when):
+    """Kondisi semua temuan per akhir tanggal `when`: checkpoint terdekat + replay event sesudahnya."""
+    ts = _history_ts(when)
+    with _history_db() as conn:
+        _ensure_patrol_history(conn)
+        cp = conn.execute("SELECT seq, state FROM checkpoints WHERE ts <= ? ORDER BY seq DESC LIMIT 1",
+                          (ts,)).fetchone()
+        events = conn.execute("SELECT kode, delta FROM events WHERE seq > ? AND ts <= ? ORDER BY seq",
+                              (cp[0] if cp else 0, ts)).fetchall()
+    state = json.loads(zlib.decompress(cp[1])) if cp else {}
+    profile_count("rows", len(events))
+    for kode, delta in events:
+        delta = json.loads(delta)
+        if delta.get(HISTORY_DELETED):
+            state.pop(kode, None)
+        else:
+            state[kode] = dict(state.get(kode, {}), **delta)
+    df = pd.DataFrame([dict(row, **{"Kode Temuan": kode}) for kode, row in state.items()],
+                      columns=COLUMNS_PATROL_FULL)
+    return _compact_dtypes(_coerce_types(df))
+
+def status_durations(status="Progress", as_of=None):
+    """Lama (hari) tiap temuan berada di status tertentu sampai as_of (default: sekarang)."""
+    ts = _history_ts(as_of)
+    with _history_db() as conn:
+        _ensure_patrol_history(conn)
+        rows = conn.execute(
+            "SELECT kode, SUM(julianday(MIN(COALESCE(end_ts, ?), ?)) - julianday(start_ts)) "
+            "FROM spans WHERE status = ? AND start_ts <= ? GROUP BY kode", (ts, ts, status, ts)).fetchall()
+    return pd.DataFrame(rows, columns=["Kode Temuan", "Hari"])
 
 # =========================
 # Login Functions
@@ -64,10 +2331,134 @@ def logout():
         st.session_state["logged_in"] = False
         st.sidebar.success("Berhasil logout")
 
+# =========================
+# Cache Grafik Plotly
+# =========================
+# Figure Plotly disimpan per (nama grafik, versi data, filter) dengan eviksi LRU
+# dan batas memori (ukuran JSON figure). None juga di-cache untuk grafik kosong.
+FIGURE_CACHE_MAX_ENTRIES = 256
+FIGURE_CACHE_MAX_BYTES = 64 * 2**20
+
+@process_resource
+def get_figure_cache():
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "bytes": 0, "hits": 0, "misses": 0}
+
+def cached_figure(name, file, filter_key, build):
+    """
+    Ambil figure dari cache atau bangun dengan build() (yang melakukan groupby + px.*).
+    Figure hasil cache tidak boleh dimodifikasi oleh pemanggil.
+    """
+    version = get_storage().version(file)
+    key = (name, tuple(version) if version else None, tuple(filter_key))
+    cache = get_figure_cache()
+    with cache["lock"]:
+        if key in cache["entries"]:
+            cache["entries"].move_to_end(key)
+            cache["hits"] += 1
+            return cache["entries"][key][0]
+
+    fig = build()
+    size = len(fig.to_json()) if fig is not None else 0
+    with cache["lock"]:
+        cache["misses"] += 1
+        if key not in cache["entries"]:
+            cache["entries"][key] = (fig, size)
+            cache["bytes"] += size
+        while cache["entries"] and (len(cache["entries"]) > FIGURE_CACHE_MAX_ENTRIES or
+                                    cache["bytes"] > FIGURE_CACHE_MAX_BYTES):
+            _, (_, old_size) = cache["entries"].popitem(last=False)
+            cache["bytes"] -= old_size
+    return fig
+
+def _fig_manhours(cells):
+    monthly = rollup_per_month(cells).rename(columns={"value": "Total Manhours"})
+    if monthly.empty:
+        return None
+    max_row = monthly.loc[monthly['Total Manhours'].idxmax()]
+    fig = px.bar(monthly, x="Bulan", y="Total Manhours", color_discrete_sequence=["#800000"])
+    fig.update_traces(
+        texttemplate=['%{y}' if val==max_row['Total Manhours'] else '' for val in monthly['Total Manhours']],
+        textposition='outside'
+    )
+    fig.update_layout(xaxis_title=None, yaxis_title="Total Manhours", showlegend=False)
+    return fig
+
+def _fig_accident_jenis(cells):
+    acc_count = rollup_per_key(cells, "Jenis")
+    acc_count.columns = ["Jenis","Count"]
+    if acc_count.empty:
+        return None
+    max_row = acc_count.loc[acc_count['Count'].idxmax()]
+    fig_acc = px.bar(acc_count, y="Jenis", x="Count", orientation="h", color_discrete_sequence=["#800000"])
+    fig_acc.update_traces(
+        texttemplate=['%{x}' if val==max_row['Count'] else '' for val in acc_count['Count']],
+        textposition='outside'
+    )
+    fig_acc.update_layout(xaxis_title=None, yaxis_title=None, showlegend=False)
+    return fig_acc
+
+def _fig_accident_bulan(cells):
+    acc_per_bulan = rollup_per_month(cells).rename(columns={"value": "Jumlah"})
+    if acc_per_bulan.empty:
+        return None
+    max_idx = acc_per_bulan["Jumlah"].idxmax()
+    fig_line = px.line(acc_per_bulan, x="Bulan", y="Jumlah", color_discrete_sequence=["#800000"])
+    fig_line.add_annotation(
+        x=acc_per_bulan.loc[max_idx,"Bulan"],
+        y=acc_per_bulan.loc[max_idx,"Jumlah"],
+        text=str(acc_per_bulan.loc[max_idx,"Jumlah"]),
+        showarrow=True, arrowhead=2
+    )
+    return fig_line
+
+def _fig_patrol_status(cells):
+    status_count = rollup_per_key(cells, "Status")
+    if status_count.empty:
+        return None
+    status_count.columns = ["Status","Count"]
+    fig_pat = px.pie(status_count, names="Status", values="Count", color_discrete_sequence=["#800000","#DEB887"])
+    fig_pat.update_traces(textinfo="percent+label")
+    return fig_pat
+
+def _fig_patrol_temuan(cells):
+    temuan_count = rollup_per_key(cells, "Jenis Temuan")
+    if temuan_count.empty:
+        return None
+    temuan_count.columns = ["Temuan","Count"]
+    fig_tem = px.pie(temuan_count, names="Temuan", values="Count",
+                     color_discrete_sequence=["#800000","#FFFDD0","#DEB887"])
+    fig_tem.update_traces(textinfo="percent+value")
+    return fig_tem
+
+def _fig_manpower(df_filtered, selected_bulan):
+    if selected_bulan != "All":
+        chart = df_filtered.groupby("Tanggal")["Jumlah Pekerja"].sum().reset_index()
+        if chart.empty:
+            return None
+        return px.bar(chart, x="Tanggal", y="Jumlah Pekerja", color_discrete_sequence=["#800000"])
+    # group per bulan (integer) agar urutan kalender, bukan alfabet
+    _, month = _year_month(df_filtered)
+    chart = df_filtered.groupby(month.rename("month"))["Jumlah Pekerja"].sum()
+    chart = chart[chart.index > 0].reset_index()
+    chart.insert(0, "Bulan", chart["month"].map(BULAN_NAMA))
+    if chart.empty:
+        return None
+    return px.bar(chart, x="Bulan", y="Jumlah Pekerja", color_discrete_sequence=["#800000"])
+
+def _fig_manpower_trend(df, freq, value):
+    if df.empty:
+        return None
+    if freq != "D":
+        df = (df.groupby(["Proyek", pd.Grouper(key="Tanggal", freq=TIMESERIES_FREQ[freq])])
+                [["Jumlah Pekerja", "Manhours"]].sum().reset_index())
+    fig = px.line(df, x="Tanggal", y=value, color="Proyek", markers=freq != "D")
+    fig.update_layout(xaxis_title=None, legend_title=None)
+    return fig
+
 # =========================
 # Dashboard utama
 # =========================
-def dashboard(df_man, df_acc, df_patrol):
+def dashboard():
     st.markdown(
         """
         <style>
@@ -87,101 +2478,516 @@ def dashboard(df_man, df_acc, df_patrol):
     st.title("HSE Dashboard")
 
     # ---------------- FILTER ----------------
-    all_bulan = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-    filter_bulan = st.selectbox("Filter Bulan", ["All"] + all_bulan)
-    # kumpulkan tahun dari semua dataset (jika kolom Tanggal ada)
+    filter_bulan = st.selectbox("Filter Bulan", ["All"] + list(BULAN_NUM))
+    # kumpulkan tahun dari rollup semua dataset (tanpa memuat data mentah)
     years = set()
-    for df in [df_man, df_acc, df_patrol]:
-        if df is not None and not df.empty and "Tanggal" in df.columns:
-            years.update(list(df["Tanggal"].dropna().astype(str).str[:4]))
-    filter_tahun = st.selectbox("Filter Tahun", ["All"] + sorted(years))
-
-    def apply_filter(df):
-        if df is not None and not df.empty and "Tanggal" in df.columns:
-            df = df.copy()
-            df["Tanggal"] = pd.to_datetime(df["Tanggal"], errors="coerce")
-            df["Bulan"] = df["Tanggal"].dt.strftime("%b")
-            df["Tahun"] = df["Tanggal"].dt.strftime("%Y")
-            if filter_bulan != "All":
-                df = df[df["Bulan"] == filter_bulan]
-            if filter_tahun != "All":
-                df = df[df["Tahun"] == filter_tahun]
-        return df
-
-    df_man = apply_filter(df_man)
-    df_acc = apply_filter(df_acc)
-    df_patrol = apply_filter(df_patrol)
+    for file in [FILE_MANHOURS, FILE_ACCIDENT, FILE_PATROL]:
+        years.update(int(y) for y in rollup_frame(file)["year"].unique())
+    filter_tahun = st.selectbox("Filter Tahun", ["All"] + [str(y) for y in sorted(years)])
+
+    # grafik & metric hanya membaca rollup bulanan
+    filters = {
+        "year": int(filter_tahun) if filter_tahun != "All" else None,
+        "month": BULAN_NUM.get(filter_bulan),
+    }
+    man_cells = rollup_frame(FILE_MANHOURS, filters)
+    acc_cells = rollup_frame(FILE_ACCIDENT, filters)
+    patrol_cells = rollup_frame(FILE_PATROL, filters)
+
+    # figure di-cache per (versi data, filter): rerun tanpa perubahan cukup lookup dict
+    filter_key = (filters["year"], filters["month"])
+
+    # ---------------- KPI ----------------
+    with profile_stage("dashboard: kpi"):
+        kpi = kpi_at(kpi_frame(), filters["year"], filters["month"])
+        if kpi is not None:
+            st.subheader(f"KPI K3 s/d {BULAN_NAMA[int(kpi['month'])]} {int(kpi['year'])}")
+            col1, col2, col3 = st.columns(3)
+            with col1: st.metric("LTIFR (12 bln)", _kpi_text(kpi["ltifr_12m"], ".2f"),
+                                 help="(Fatality + LTI) x 1.000.000 / manhours, 12 bulan terakhir")
+            with col2: st.metric("TRIR (12 bln)", _kpi_text(kpi["trir_12m"], ".2f"),
+                                 help="(Fatality + LTI + MTC + PAK) x 1.000.000 / manhours, 12 bulan terakhir")
+            with col3: st.metric("Close Rate Patrol (12 bln)", _kpi_text(kpi["close_rate_12m"], ".0%"))
+            col1, col2, col3 = st.columns(3)
+            with col1: st.metric("LTIFR (YTD)", _kpi_text(kpi["ltifr_ytd"], ".2f"))
+            with col2: st.metric("TRIR (YTD)", _kpi_text(kpi["trir_ytd"], ".2f"))
+            with col3: st.metric("MTTC Patrol (12 bln)", _kpi_text(kpi["mttc_12m"], ".1f", " hari"),
+                                 help="Rata-rata hari dari Tanggal temuan ke Tanggal Close")
 
     # ---------------- MANHOURS ----------------
-    if df_man is not None and not df_man.empty and "Total Manhours" in df_man.columns:
-        today = datetime.now().date()
-        total_today = df_man[df_man['Tanggal'].dt.date == today]['Total Manhours'].sum()
-        total_all = df_man['Total Manhours'].sum()
-        col1, col2 = st.columns(2)
-        with col1: st.metric("Harian", total_today)
-        with col2: st.metric("Total", total_all)
-
-        monthly = df_man.groupby("Bulan")["Total Manhours"].sum().reset_index()
-        if not monthly.empty:
-            max_row = monthly.loc[monthly['Total Manhours'].idxmax()]
-            fig = px.bar(monthly, x="Bulan", y="Total Manhours", color_discrete_sequence=["#800000"])
-            fig.update_traces(
-                texttemplate=['%{y}' if val==max_row['Total Manhours'] else '' for val in monthly['Total Manhours']],
-                textposition='outside'
-            )
-            fig.update_layout(xaxis_title=None, yaxis_title="Total Manhours", showlegend=False)
-            st.subheader("Manhours per Bulan")
-            st.plotly_chart(fig, use_container_width=True)
+    with profile_stage("dashboard: grafik manhours"):
+        if not man_cells.empty:
+            today = datetime.now().date()
+            in_filter = filters["year"] in (None, today.year) and filters["month"] in (None, today.month)
+            total_today = rollup_daily(FILE_MANHOURS, today) if in_filter else 0
+            total_all = man_cells[man_cells["dim"] == ROLLUP_TOTAL]["value"].sum()
+            col1, col2 = st.columns(2)
+            with col1: st.metric("Harian", total_today)
+            with col2: st.metric("Total", total_all)
+
+            fig = cached_figure("manhours_bulan", FILE_MANHOURS, filter_key, lambda: _fig_manhours(man_cells))
+            if fig is not None:
+                st.subheader("Manhours per Bulan")
+                st.plotly_chart(fig, use_container_width=True)
 
     # ---------------- ACCIDENT ----------------
-    if df_acc is not None and not df_acc.empty and "Jenis" in df_acc.columns:
-        st.subheader("Accident per Jenis")
-        acc_count = df_acc["Jenis"].value_counts().reset_index()
-        acc_count.columns = ["Jenis","Count"]
-        if not acc_count.empty:
-            max_row = acc_count.loc[acc_count['Count'].idxmax()]
-            fig_acc = px.bar(acc_count, y="Jenis", x="Count", orientation="h", color_discrete_sequence=["#800000"])
-            fig_acc.update_traces(
-                texttemplate=['%{x}' if val==max_row['Count'] else '' for val in acc_count['Count']],
-                textposition='outside'
-            )
-            fig_acc.update_layout(xaxis_title=None, yaxis_title=None, showlegend=False)
-            st.plotly_chart(fig_acc, use_container_width=True)
-
-        # Line chart accident per bulan
-        if "Tanggal" in df_acc.columns:
-            df_acc = df_acc.copy()
-            df_acc["Bulan"] = df_acc["Tanggal"].dt.strftime("%b")
-            acc_per_bulan = df_acc.groupby("Bulan").size().reset_index(name="Jumlah")
-            if not acc_per_bulan.empty:
-                max_idx = acc_per_bulan["Jumlah"].idxmax()
-                fig_line = px.line(acc_per_bulan, x="Bulan", y="Jumlah", color_discrete_sequence=["#800000"])
-                fig_line.add_annotation(
-                    x=acc_per_bulan.loc[max_idx,"Bulan"],
-                    y=acc_per_bulan.loc[max_idx,"Jumlah"],
-                    text=str(acc_per_bulan.loc[max_idx,"Jumlah"]),
-                    showarrow=True, arrowhead=2
-                )
+    with profile_stage("dashboard: grafik accident"):
+        if not acc_cells.empty:
+            st.subheader("Accident per Jenis")
+            fig_acc = cached_figure("accident_jenis", FILE_ACCIDENT, filter_key, lambda: _fig_accident_jenis(acc_cells))
+            if fig_acc is not None:
+                st.plotly_chart(fig_acc, use_container_width=True)
+
+            # Line chart accident per bulan
+            fig_line = cached_figure("accident_bulan", FILE_ACCIDENT, filter_key, lambda: _fig_accident_bulan(acc_cells))
+            if fig_line is not None:
                 st.subheader("Accident per Bulan")
                 st.plotly_chart(fig_line, use_container_width=True)
 
     # ---------------- SAFETY PATROL ----------------
-    if df_patrol is not None and not df_patrol.empty and "Status" in df_patrol.columns:
-        st.subheader("Safety Patrol - Status")
-        status_count = df_patrol["Status"].value_counts().reset_index()
-        status_count.columns = ["Status","Count"]
-        fig_pat = px.pie(status_count, names="Status", values="Count", color_discrete_sequence=["#800000","#DEB887"])
-        fig_pat.update_traces(textinfo="percent+label")
-        st.plotly_chart(fig_pat, use_container_width=True)
-
-        if "Jenis Temuan" in df_patrol.columns:
-            st.subheader("Safety Patrol - Jenis Temuan")
-            temuan_count = df_patrol["Jenis Temuan"].value_counts().reset_index()
-            temuan_count.columns = ["Temuan","Count"]
-            fig_tem = px.pie(temuan_count, names="Temuan", values="Count",
-                             color_discrete_sequence=["#800000","#FFFDD0","#DEB887"])
-            fig_tem.update_traces(textinfo="percent+value")
-            st.plotly_chart(fig_tem, use_container_width=True)
+    with profile_stage("dashboard: grafik patrol"):
+        fig_pat = cached_figure("patrol_status", FILE_PATROL, filter_key, lambda: _fig_patrol_status(patrol_cells))
+        if fig_pat is not None:
+            st.subheader("Safety Patrol - Status")
+            st.plotly_chart(fig_pat, use_container_width=True)
+
+            fig_tem = cached_figure("patrol_temuan", FILE_PATROL, filter_key, lambda: _fig_patrol_temuan(patrol_cells))
+            if fig_tem is not None:
+                st.subheader("Safety Patrol - Jenis Temuan")
+                st.plotly_chart(fig_tem, use_container_width=True)
+
+# =========================
+# Foto Safety Patrol
+# =========================
+# Foto dinormalisasi sekali saat upload (rotasi EXIF, resolusi maksimum) dan disimpan
+# berdasarkan hash isi file, sehingga upload yang sama memakai file yang sama.
+# Varian preview & thumbnail dibuat sekali di samping file utama.
+PHOTO_DIR = "uploads/safety_patrol"
+PHOTO_MAX_SIZE = (1920, 1920)
+PREVIEW_SIZE = (800, 800)
+THUMB_SIZE = (150, 150)
+PHOTO_VARIANTS = {"preview": PREVIEW_SIZE, "thumb": THUMB_SIZE}
+
+def _save_jpeg_atomic(img, dst, quality):
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".jpg", dir=os.path.dirname(dst))
+    with os.fdopen(fd, "wb") as f:
+        img.save(f, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp_path, dst)
+
+def _variant_path(path, variant):
+    root, ext = os.path.splitext(path)
+    return f"{root}_{variant}{ext}"
+
+def photo_variant(path, variant):
+    """Path varian (preview/thumb) jika sudah dibuat saat upload, selain itu path aslinya."""
+    if isinstance(path, str) and path:
+        candidate = _variant_path(path, variant)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+def ingest_photo(data, name=""):
+    """
+    Simpan foto upload (bytes) secara content-addressed: uploads/safety_patrol/ab/<sha256>.jpg.
+    Mengembalikan path file utama.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    folder = os.path.join(PHOTO_DIR, digest[:2])
+    os.makedirs(folder, exist_ok=True)
+
+    if not HAS_IMG_TO_EXCEL:
+        # tanpa Pillow: simpan apa adanya (tetap content-addressed)
+        path = os.path.join(folder, digest + (os.path.splitext(name)[1].lower() or ".jpg"))
+        if not os.path.exists(path):
+            with open(path + ".part", "wb") as f:
+                f.write(data)
+            os.replace(path + ".part", path)
+        return path
+
+    path = os.path.join(folder, f"{digest}.jpg")
+    if os.path.exists(path) and all(os.path.exists(_variant_path(path, v)) for v in PHOTO_VARIANTS):
+        return path  # duplikat: file & varian sudah ada
+
+    img = ImageOps.exif_transpose(PILImage.open(io.BytesIO(data)))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.thumbnail(PHOTO_MAX_SIZE)
+    _save_jpeg_atomic(img, path, quality=85)
+    for variant, size in PHOTO_VARIANTS.items():
+        small = img.copy()
+        small.thumbnail(size)
+        _save_jpeg_atomic(small, _variant_path(path, variant), quality=75 if variant == "preview" else 70)
+    return path
+
+# =========================
+# Upload Queue (background)
+# =========================
+# File upload divalidasi (ukuran & isi) di thread script, lalu penulisannya diserahkan ke
+# thread pool sehingga rerun tidak menunggu disk. Job dikunci dengan sha256 isi file:
+# upload yang sama (termasuk rerun selama uploader masih memegang file) ditulis sekali.
+UPLOAD_WORKERS = 2
+UPLOAD_MAX_BYTES = {"photo": 15 * 2**20, "pdf": 50 * 2**20}
+UPLOAD_SIGNATURES = {
+    "photo": (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n"),
+    "pdf": (b"%PDF-",),
+}
+UPLOAD_CHUNK = 2**20
+# job selesai yang disimpan untuk ditampilkan statusnya
+UPLOAD_KEEP_JOBS = 200
+
+@process_resource
+def get_upload_queue():
+    return {
+        "pool": ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="k3-upload"),
+        "lock": threading.Lock(),
+        "jobs": OrderedDict(),
+    }
+
+def validate_upload(kind, data, name=""):
+    """Pesan kesalahan jika file tidak boleh diupload, selain itu None."""
+    limit = UPLOAD_MAX_BYTES[kind]
+    if not data:
+        return f"{name}: file kosong"
+    if len(data) > limit:
+        return f"{name}: ukuran {_format_size(len(data))} melebihi batas {_format_size(limit)}"
+    if not data.startswith(UPLOAD_SIGNATURES[kind]):
+        return f"{name}: isi file bukan {'JPG/PNG' if kind == 'photo' else 'PDF'}"
+    if kind == "photo" and HAS_IMG_TO_EXCEL:
+        # decode dulu (JPEG cukup skala 1/8 lewat draft): file rusak/terpotong ditolak sebelum
+        # baris disimpan, bukan gagal di thread upload setelah Foto sudah menunjuk ke path-nya
+        try:
+            with PILImage.open(io.BytesIO(data)) as img:
+                img.draft("RGB", (max(1, img.width // 8), max(1, img.height // 8)))
+                img.load()
+        except Exception:
+            return f"{name}: file gambar rusak atau tidak bisa dibaca"
+    return None
+
+def photo_upload_path(digest, name=""):
+    """Path tujuan ingest_photo untuk hash tertentu (diketahui sebelum file selesai ditulis)."""
+    ext = ".jpg" if HAS_IMG_TO_EXCEL else (os.path.splitext(name)[1].lower() or ".jpg")
+    return os.path.join(PHOTO_DIR, digest[:2], digest + ext)
+
+def _write_pdf_upload(job, data):
+    """Tulis PDF per chunk ke file sementara lalu rename; dilewati jika isinya sudah sama."""
+    path = job["path"]
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() == job["digest"]:
+                return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".part", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            view = memoryview(data)
+            for start in range(0, len(data), UPLOAD_CHUNK):
+                f.write(view[start:start + UPLOAD_CHUNK])
+                job["progress"] = min(start + UPLOAD_CHUNK, len(data)) / len(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _run_upload(job, data):
+    job["status"] = "running"
+    try:
+        if job["kind"] == "photo":
+            job["path"] = ingest_photo(data, job["name"])
+        else:
+            _write_pdf_upload(job, data)
+        job.update(status="done", progress=1.0, finished=time.time())
+    except Exception as e:
+        job.update(status="failed", error=str(e), finished=time.time())
+
+def submit_upload(kind, data, name):
+    """
+    Jadwalkan penulisan upload dan kembalikan job (dict: status, progress, path, error).
+    Foto disimpan content-addressed (path sudah pasti saat submit); PDF disimpan dengan
+    nama filenya di PDF_DIR. Validasi dilakukan dulu, file yang ditolak tidak dijadwalkan.
+    """
+    error = validate_upload(kind, data, name)
+    digest = hashlib.sha256(data).hexdigest()
+    name = os.path.basename(name)
+    key = (kind, digest, name if kind == "pdf" else "")
+    queue = get_upload_queue()
+    with queue["lock"]:
+        job = queue["jobs"].get(key)
+        if job is not None and job["status"] != "failed":
+            queue["jobs"].move_to_end(key)
+            return job
+        job = {
+            "kind": kind, "name": name, "digest": digest, "size": len(data),
+            "path": photo_upload_path(digest, name) if kind == "photo" else os.path.join(PDF_DIR, name),
+            "status": "failed" if error else "queued", "progress": 0.0, "error": error,
+            "created": time.time(), "finished": time.time() if error else None,
+        }
+        queue["jobs"][key] = job
+        finished = [k for k, j in queue["jobs"].items() if j["status"] in ("done", "failed")]
+        for k in finished[:max(0, len(queue["jobs"]) - UPLOAD_KEEP_JOBS)]:
+            del queue["jobs"][k]
+        if not error:
+            queue["pool"].submit(_run_upload, job, data)
+    return job
+
+def wait_uploads(timeout=None):
+    """Tunggu semua upload yang sedang antri/berjalan (dipakai bench_k3; False jika timeout)."""
+    deadline = None if timeout is None else time.time() + timeout
+    queue = get_upload_queue()
+    while any(j["status"] in ("queued", "running") for j in list(queue["jobs"].values())):
+        if deadline is not None and time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+def upload_status_ui(jobs, key):
+    """Progress upload milik sesi ini; tombol cek status selama masih ada yang berjalan."""
+    jobs = [j for j in jobs if j is not None]
+    if not jobs:
+        return
+    pending = [j for j in jobs if j["status"] in ("queued", "running")]
+    for job in jobs:
+        if job["status"] == "failed":
+            st.error(f"Upload gagal: {job['error']}")
+    if pending:
+        total = sum(j["size"] for j in pending)
+        done = sum(j["size"] * (j["progress"] or 0.0) for j in pending)
+        st.progress(min(done / total, 1.0) if total else 0.0,
+                    text=f"Menyimpan {len(pending)} file upload...")
+        st.button("🔄 Cek Status Upload", key=f"upload_refresh_{key}")
+
+# =========================
+# Export Excel Safety Patrol
+# =========================
+THUMB_DIR = "uploads/.thumbs"
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+def _thumbnail_path(src):
+    """Path thumbnail di cache disk, key: path sumber + mtime + ukuran file."""
+    stat = os.stat(src)
+    key = hashlib.sha1(f"{os.path.abspath(src)}|{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()
+    return os.path.join(THUMB_DIR, f"{key}.jpg")
+
+def _make_thumbnail(src, dst):
+    if os.path.exists(dst):
+        return dst
+    try:
+        img = PILImage.open(src)
+        img.thumbnail(THUMB_SIZE)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        # tulis ke file unik lalu rename, aman untuk beberapa sesi sekaligus
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".jpg", dir=THUMB_DIR)
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, "JPEG", quality=70)
+        os.replace(tmp_path, dst)
+        return dst
+    except Exception:
+        # skip image on failure
+        return None
+
+def build_thumbnails(paths):
+    """
+    Buat thumbnail untuk semua foto (paralel, thread pool: decode/resize PIL melepas GIL).
+    Mengembalikan dict path sumber -> path thumbnail.
+    """
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    jobs = {}
+    thumbs = {}
+    for src in set(paths):
+        if src and os.path.exists(src):
+            premade = photo_variant(src, "thumb")
+            if premade != src:
+                thumbs[src] = premade  # sudah dibuat saat upload
+            else:
+                jobs[src] = _thumbnail_path(src)
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as pool:
+        results = pool.map(_make_thumbnail, jobs.keys(), jobs.values())
+        thumbs.update({src: thumb for src, thumb in zip(jobs.keys(), results) if thumb})
+    return thumbs
+
+def _cell_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+def build_patrol_excel(df_patrol, progress=None):
+    """
+    Workbook Safety Patrol (write-only / streaming) dengan foto di kolom G, sebagai bytes.
+    progress (opsional): callback dengan nilai 0..1.
+    """
+    headers = COLUMNS_PATROL_FULL
+    df = df_patrol.reindex(columns=headers)
+    fotos = df["Foto"].fillna("").astype(str).str.strip()
+    thumbs = build_thumbnails(fotos.tolist())
+    if progress:
+        progress(0.5)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Safety Patrol")
+    ws.append(headers)
+    foto_idx = headers.index("Foto")
+    for row_num, (values, foto) in enumerate(zip(df.itertuples(index=False, name=None), fotos), start=2):
+        cells = [_cell_text(v) for v in values]
+        cells[foto_idx] = ""  # placeholder untuk gambar
+        ws.append(cells)
+        if foto in thumbs:
+            # insert image into column G (7th col = 'G')
+            ws.add_image(XLImage(thumbs[foto]), f"G{row_num}")
+        if progress and row_num % 500 == 0:
+            progress(0.5 + 0.4 * row_num / (len(df) + 1))
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+# =========================
+# Export Job Queue (background)
+# =========================
+# Export besar dijalankan di thread pool, status disimpan di tabel jobs (SQLite),
+# file hasil disimpan di EXPORT_DIR dan dihapus setelah EXPORT_TTL detik.
+EXPORT_DIR = "exports"
+EXPORT_TTL = 60 * 60
+EXPORT_JOB_WORKERS = 2
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+@contextmanager
+def _jobs_db(queue):
+    conn = sqlite3.connect(queue["db"], timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+@process_resource
+def get_job_queue():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    queue = {
+        "pool": ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="k3-export"),
+        "lock": threading.Lock(),
+        "db": os.path.join(EXPORT_DIR, "jobs.db"),
+    }
+    with _jobs_db(queue) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, params TEXT, "
+                     "status TEXT, progress REAL, path TEXT, error TEXT, created REAL, finished REAL)")
+        # job yang terputus karena server restart tidak akan pernah selesai
+        conn.execute("UPDATE jobs SET status = 'failed', error = 'interrupted' "
+                     "WHERE status IN ('queued', 'running')")
+    return queue
+
+def _update_job(job_id, **fields):
+    queue = get_job_queue()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    with _jobs_db(queue) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+
+def job_status(job_id):
+    queue = get_job_queue()
+    with _jobs_db(queue) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def export_job_id(kind, params, version):
+    """Permintaan identik (jenis, filter, versi data) menghasilkan id job yang sama."""
+    raw = json.dumps([kind, params, version], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def _run_export(job_id, path, build):
+    _update_job(job_id, status="running")
+    try:
+        data = build(lambda p: _update_job(job_id, progress=p))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=EXPORT_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        _update_job(job_id, status="done", progress=1.0, finished=time.time())
+    except Exception as e:
+        _update_job(job_id, status="failed", error=str(e), finished=time.time())
+
+def evict_exports(ttl=EXPORT_TTL):
+    """Hapus file export (dan baris job) yang lebih tua dari ttl detik."""
+    queue = get_job_queue()
+    cutoff = time.time() - ttl
+    with _jobs_db(queue) as conn:
+        old = conn.execute("SELECT id, path FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                           (cutoff,)).fetchall()
+        for job_id, path in old:
+            if path and os.path.exists(path):
+                os.remove(path)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+def submit_export(kind, params, version, build, suffix=".xlsx"):
+    """
+    Jadwalkan export di background dan kembalikan id job.
+    build(progress) -> bytes dijalankan di thread pool (tanpa memanggil st.*).
+    """
+    queue = get_job_queue()
+    evict_exports()
+    job_id = export_job_id(kind, params, version)
+    with queue["lock"]:
+        job = job_status(job_id)
+        if job and (job["status"] in ("queued", "running") or
+                    (job["status"] == "done" and os.path.exists(job["path"]))):
+            return job_id
+        path = os.path.join(EXPORT_DIR, f"{kind}_{job_id}{suffix}")
+        with _jobs_db(queue) as conn:
+            conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, json.dumps(params, default=str), "queued", 0.0,
+                          path, None, time.time(), None))
+        queue["pool"].submit(_run_export, job_id, path, build)
+    return job_id
+
+def export_job_ui(kind, params, version, build, button_label, download_label, file_prefix):
+    """Tombol submit, progress, dan tombol download untuk satu jenis export."""
+    with profile_stage(f"export {kind}"):
+        _export_job_ui(kind, params, version, build, button_label, download_label, file_prefix)
+
+def _export_job_ui(kind, params, version, build, button_label, download_label, file_prefix):
+    job = job_status(export_job_id(kind, params, version))
+    if job and job["status"] == "done" and not os.path.exists(job["path"]):
+        job = None
+    if job is None or job["status"] == "failed":
+        if job is not None:
+            st.error(f"Export gagal: {job['error']}")
+        if st.button(button_label, key=f"export_{kind}"):
+            job = job_status(submit_export(kind, params, version, build))
+
+    if job is None:
+        return
+    if job["status"] in ("queued", "running"):
+        st.progress(min(max(job["progress"] or 0.0, 0.0), 1.0),
+                    text="Menunggu antrian export..." if job["status"] == "queued" else "Membuat file export...")
+        st.button("🔄 Cek Status Export", key=f"export_refresh_{kind}")
+    elif job["status"] == "done":
+        finished = datetime.fromtimestamp(job["finished"]).strftime("%Y%m%d_%H%M%S")
+        with open(job["path"], "rb") as f:
+            st.download_button(
+                label=download_label,
+                data=f.read(),
+                file_name=f"{file_prefix}_{finished}.xlsx",
+                mime=XLSX_MIME,
+                key=f"export_download_{kind}"
+            )
+
+def _plain_excel(df, sheet_name):
+    output = io.BytesIO()
+    df.drop(columns=DERIVED_COLUMNS, errors="ignore").to_excel(output, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+def _patrol_export_builder(df_patrol):
+    def build(progress):
+        if HAS_IMG_TO_EXCEL:
+            try:
+                return build_patrol_excel(df_patrol, progress)
+            except Exception:
+                # fallback ke simple excel
+                pass
+        return _plain_excel(df_patrol, "Safety Patrol")
+    return build
 
 # =========================
 # Input Data (Admin Only)
@@ -209,9 +3015,8 @@ def input_data(df_man, df_acc, df_patrol):
         total = manpower * jam_kerja
 
         if st.button("Simpan Manhours"):
-            new = pd.DataFrame([[tanggal, manpower, jam_kerja, total]], columns=df_man.columns)
-            df_man = pd.concat([df_man, new], ignore_index=True)
-            save_data(FILE_MANHOURS, df_man)
+            append_rows(FILE_MANHOURS, [dict(zip(COLUMNS_MANHOURS, [tanggal, manpower, jam_kerja, total]))], COLUMNS_MANHOURS)
+            df_man = load_data(FILE_MANHOURS, COLUMNS_MANHOURS)
             st.success("✅ Data Manhours tersimpan")
 
     # --- TAB 2: ACCIDENT ---
@@ -222,13 +3027,12 @@ def input_data(df_man, df_acc, df_patrol):
             df_acc = pd.DataFrame(columns=["Tanggal", "Jenis", "Kronologi"])
 
         tanggal = st.date_input("Tanggal Accident", key="acc_tgl")
-        jenis = st.selectbox("Jenis Accident", ["Fatality", "LTI", "MTC", "FAC", "Near Miss", "Property Damage", "PAK"])
+        jenis = st.selectbox("Jenis Accident", JENIS_ACCIDENT)
         kronologi = st.text_area("Kronologi Singkat", key="acc_kron")
 
         if st.button("Simpan Accident"):
-            new = pd.DataFrame([[tanggal, jenis, kronologi]], columns=df_acc.columns)
-            df_acc = pd.concat([df_acc, new], ignore_index=True)
-            save_data(FILE_ACCIDENT, df_acc)
+            append_rows(FILE_ACCIDENT, [dict(zip(COLUMNS_ACCIDENT, [tanggal, jenis, kronologi]))], COLUMNS_ACCIDENT)
+            df_acc = load_data(FILE_ACCIDENT, COLUMNS_ACCIDENT)
             st.success("✅ Data Accident tersimpan")
 
     # --- TAB 3: SAFETY PATROL ---
@@ -236,11 +3040,10 @@ def input_data(df_man, df_acc, df_patrol):
         st.subheader("📋 Input / Update Data Safety Patrol")
 
         FILE_SAFETY_PATROL = FILE_PATROL
-        os.makedirs("uploads/safety_patrol", exist_ok=True)
+        os.makedirs(PHOTO_DIR, exist_ok=True)
 
         # Pastikan kolom ada (tambahkan kolom Tanggal Close & Catatan Progress bila belum ada)
-        required_cols = ["Kode Temuan", "Tanggal", "Jenis Temuan", "Ditemukan Oleh",
-                         "Status", "Deskripsi", "Foto", "Tanggal Close", "Catatan Progress"]
+        required_cols = COLUMNS_PATROL_FULL
         if df_patrol is None or df_patrol.empty:
             df_patrol = pd.DataFrame(columns=required_cols)
         else:
@@ -254,15 +3057,15 @@ def input_data(df_man, df_acc, df_patrol):
         selected_kode = st.selectbox("Pilih Kode Temuan (untuk update data lama):", kode_options)
 
         if selected_kode != "Tambah Data Baru":
-            # ambil baris pertama yang cocok
-            data_lama = df_patrol[df_patrol["Kode Temuan"] == selected_kode].iloc[0]
+            # ambil baris pertama yang cocok (lewat indeks patrol)
+            data_lama = df_patrol.iloc[locate_row(df_patrol, "Kode Temuan", selected_kode, patrol_row(selected_kode))]
             kode_temuan = data_lama["Kode Temuan"]
             tanggal = st.date_input("Tanggal", value=pd.to_datetime(data_lama["Tanggal"]))
-            jenis_temuan = st.selectbox("Jenis Temuan", ["Cara Kerja", "Environment", "Manpower"],
-                                        index=["Cara Kerja", "Environment", "Manpower"].index(data_lama["Jenis Temuan"]) if data_lama["Jenis Temuan"] in ["Cara Kerja", "Environment", "Manpower"] else 0)
+            jenis_temuan = st.selectbox("Jenis Temuan", JENIS_TEMUAN,
+                                        index=JENIS_TEMUAN.index(data_lama["Jenis Temuan"]) if data_lama["Jenis Temuan"] in JENIS_TEMUAN else 0)
             ditemukan_oleh = st.text_input("Ditemukan Oleh", value=data_lama["Ditemukan Oleh"])
-            status = st.selectbox("Status", ["Open", "Progress", "Close"],
-                                  index=["Open", "Progress", "Close"].index(data_lama["Status"]) if data_lama["Status"] in ["Open", "Progress", "Close"] else 0)
+            status = st.selectbox("Status", STATUS_PATROL,
+                                  index=STATUS_PATROL.index(data_lama["Status"]) if data_lama["Status"] in STATUS_PATROL else 0)
             deskripsi = st.text_area("Deskripsi Temuan", value=data_lama["Deskripsi"])
             # tanggal close & catatan progress
             tanggal_close_val = data_lama.get("Tanggal Close", "")
@@ -285,19 +3088,26 @@ def input_data(df_man, df_acc, df_patrol):
                 catatan_progress = st.text_area("Catatan Progress (opsional)", value=catatan_progress_val)
             foto = st.file_uploader("Upload Foto Temuan (opsional)", type=["jpg", "jpeg", "png"], key="foto_update")
 
+            with st.expander("🕒 Riwayat Perubahan"):
+                history = patrol_history(kode_temuan)
+                if history:
+                    st.dataframe(pd.DataFrame(history), use_container_width=True, hide_index=True)
+                else:
+                    st.caption("Belum ada riwayat.")
+
             # tampilkan foto lama bila ada path valid
             try:
                 if data_lama["Foto"] and isinstance(data_lama["Foto"], str) and os.path.exists(data_lama["Foto"]):
-                    st.image(data_lama["Foto"], caption="Foto Lama", width=250)
+                    st.image(photo_variant(data_lama["Foto"], "preview"), caption="Foto Lama", width=250)
             except Exception:
                 pass
 
         else:
             kode_temuan = None
             tanggal = st.date_input("Tanggal", format="DD-MM-YYYY")
-            jenis_temuan = st.selectbox("Jenis Temuan", ["Cara Kerja", "Environment", "Manpower"])
+            jenis_temuan = st.selectbox("Jenis Temuan", JENIS_TEMUAN)
             ditemukan_oleh = st.text_input("Ditemukan Oleh")
-            status = st.selectbox("Status", ["Open", "Progress", "Close"])
+            status = st.selectbox("Status", STATUS_PATROL)
             deskripsi = st.text_area("Deskripsi Temuan")
             tanggal_close = None
             catatan_progress = ""
@@ -307,19 +3117,17 @@ def input_data(df_man, df_acc, df_patrol):
         if st.button("💾 Simpan / Update Data Patrol"):
             # buat kode otomatis bila baru
             if not kode_temuan:
-                nomor = len(df_patrol) + 1
-                kode_temuan = f"SP-{datetime.now().strftime('%Y%m%d')}-{nomor:03d}"
+                kode_temuan = next_kode_temuan()
 
             foto_path = ""
             if foto is not None:
-                # simpan file ke uploads/safety_patrol dan beri nama berdasarkan kode
-                foto_dir = "uploads/safety_patrol"
-                os.makedirs(foto_dir, exist_ok=True)
-                ext = os.path.splitext(foto.name)[1]
-                foto_name = f"{kode_temuan}{ext}"
-                foto_path = os.path.join(foto_dir, foto_name)
-                with open(foto_path, "wb") as f:
-                    f.write(foto.getbuffer())
+                # normalisasi & simpan di background; path (hash isi) sudah pasti sekarang
+                job = submit_upload("photo", foto.getvalue(), foto.name)
+                if job["status"] == "failed":
+                    st.warning(f"{job['error']}. Data disimpan tanpa foto baru.")
+                else:
+                    foto_path = job["path"]
+                    st.session_state["patrol_uploads"] = st.session_state.get("patrol_uploads", [])[-9:] + [job]
 
             # jika update tapi tidak upload foto baru, gunakan foto lama (jika ada)
             if selected_kode != "Tambah Data Baru" and not foto_path:
@@ -345,100 +3153,44 @@ def input_data(df_man, df_acc, df_patrol):
                 "Catatan Progress": catatan_progress if catatan_progress else ""
             }
 
-            if kode_temuan in df_patrol["Kode Temuan"].values:
-                # update existing row
-                idx = df_patrol[df_patrol["Kode Temuan"] == kode_temuan].index[0]
-                for k, v in new_row.items():
-                    df_patrol.at[idx, k] = v
+            updated = upsert_row(FILE_SAFETY_PATROL, "Kode Temuan", new_row, required_cols)
+            df_patrol = load_data(FILE_SAFETY_PATROL, required_cols)
+            if updated:
                 st.success(f"✅ Data {kode_temuan} berhasil diperbarui!")
             else:
-                # append new
-                df_patrol = pd.concat([df_patrol, pd.DataFrame([new_row])], ignore_index=True)
                 st.success(f"✅ Data baru {kode_temuan} berhasil disimpan!")
+        upload_status_ui(st.session_state.get("patrol_uploads", []), "patrol")
 
-            save_data(FILE_SAFETY_PATROL, df_patrol)
+        # Status semua temuan pada tanggal tertentu (dari riwayat, bukan data terkini)
+        st.markdown("---")
+        st.subheader("🕒 Status Temuan per Tanggal")
+        per_tanggal = st.date_input("Per tanggal", value=datetime.today().date(), key="patrol_as_of")
+        with profile_stage("patrol: riwayat per tanggal"):
+            snapshot = patrol_as_of(per_tanggal)
+            progress_days = status_durations("Progress", per_tanggal)
+        col1, col2, col3, col4 = st.columns(4)
+        counts = snapshot["Status"].value_counts() if not snapshot.empty else {}
+        with col1: st.metric("Open", int(counts.get("Open", 0)))
+        with col2: st.metric("Progress", int(counts.get("Progress", 0)))
+        with col3: st.metric("Close", int(counts.get("Close", 0)))
+        with col4: st.metric("Rata-rata hari di Progress",
+                             f"{progress_days['Hari'].mean():.1f}" if not progress_days.empty else "-")
 
         # Download Excel (dengan gambar jika tersedia)
         st.markdown("---")
         st.subheader("📥 Unduh Data Safety Patrol (Excel)")
 
         if not df_patrol.empty:
-            if HAS_IMG_TO_EXCEL:
-                try:
-                    wb = Workbook()
-                    ws = wb.active
-                    ws.title = "Safety Patrol"
-
-                    headers = ["Kode Temuan", "Tanggal", "Jenis Temuan", "Ditemukan Oleh",
-                               "Status", "Deskripsi", "Foto", "Tanggal Close", "Catatan Progress"]
-                    ws.append(headers)
-
-                    for _, row in df_patrol.iterrows():
-                        # tulis teks (kosong di kolom foto, gambar akan dimasukkan next)
-                        ws.append([
-                            row.get("Kode Temuan", ""),
-                            str(row.get("Tanggal", "")),
-                            row.get("Jenis Temuan", ""),
-                            row.get("Ditemukan Oleh", ""),
-                            row.get("Status", ""),
-                            row.get("Deskripsi", ""),
-                            "",  # placeholder untuk gambar
-                            row.get("Tanggal Close", ""),
-                            row.get("Catatan Progress", "")
-                        ])
-
-                        current_row = ws.max_row
-                        foto_path = str(row.get("Foto", "")).strip()
-                        if foto_path and os.path.exists(foto_path):
-                            try:
-                                # resize image sementara
-                                img = PILImage.open(foto_path)
-                                img.thumbnail((150, 150))
-                                temp_path = os.path.join("uploads", "temp_resized.jpg")
-                                img.save(temp_path, "JPEG", quality=70)
-
-                                img_xl = XLImage(temp_path)
-                                # insert image into column G (7th col = 'G')
-                                img_cell = f"G{current_row}"
-                                ws.add_image(img_xl, img_cell)
-                            except Exception:
-                                # skip image on failure
-                                pass
-
-                    output = io.BytesIO()
-                    wb.save(output)
-                    output.seek(0)
-
-                    st.download_button(
-                        label="💾 Download Data Safety Patrol (Excel dengan Foto)",
-                        data=output,
-                        file_name=f"data_safety_patrol_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                except Exception as e:
-                    # fallback ke simple excel
-                    output = io.BytesIO()
-                    df_patrol.to_excel(output, index=False, sheet_name="Safety Patrol")
-                    output.seek(0)
-                    st.warning("Gagal membuat Excel dengan gambar (library mungkin tidak lengkap). Mengunduh data tanpa gambar.")
-                    st.download_button(
-                        label="💾 Download Data Safety Patrol (Excel, tanpa gambar)",
-                        data=output,
-                        file_name=f"data_safety_patrol_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            else:
-                # tidak ada openpyxl / pillow -> fallback
-                output = io.BytesIO()
-                df_patrol.to_excel(output, index=False, sheet_name="Safety Patrol")
-                output.seek(0)
-                st.info("Fitur embedding foto ke Excel memerlukan 'openpyxl' dan 'Pillow'. Mengunduh Excel tanpa gambar.")
-                st.download_button(
-                    label="💾 Download Data Safety Patrol (Excel, tanpa gambar)",
-                    data=output,
-                    file_name=f"data_safety_patrol_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+            if not HAS_IMG_TO_EXCEL:
+                st.info("Fitur embedding foto ke Excel memerlukan 'openpyxl' dan 'Pillow'. Excel dibuat tanpa gambar.")
+            # workbook dibuat di background job, hanya saat diminta
+            export_job_ui(
+                "patrol", {}, get_storage().version(FILE_SAFETY_PATROL),
+                _patrol_export_builder(df_patrol),
+                button_label="📦 Siapkan File Excel Safety Patrol",
+                download_label="💾 Download Data Safety Patrol (Excel)",
+                file_prefix="data_safety_patrol",
+            )
         else:
             st.info("Belum ada data Safety Patrol untuk diunduh.")
 
@@ -447,15 +3199,12 @@ def input_data(df_man, df_acc, df_patrol):
 # =========================
 # Input Data Manpower (Admin Only)
 # =========================
-def input_data_manpower(df_manpower):
+def input_data_manpower():
     st.header("📋 Input Data Manpower")
 
     if not st.session_state.get("logged_in", False):
         st.warning("Hanya admin yang bisa input data")
-        return df_manpower
-
-    if df_manpower is None or df_manpower.empty:
-        df_manpower = pd.DataFrame(columns=["Tanggal","Proyek","Jumlah Pekerja","Nama Pekerja"])
+        return
 
     tanggal = st.date_input("Tanggal", format="DD-MM-YYYY")
 
@@ -473,111 +3222,429 @@ def input_data_manpower(df_manpower):
         if proyek.strip() == "":
             st.error("Nama proyek tidak boleh kosong!")
         else:
-            new_row = pd.DataFrame(
-                [[tanggal, proyek, jumlah, nama_pekerja]],
-                columns=["Tanggal","Proyek","Jumlah Pekerja","Nama Pekerja"]
-            )
-            df_manpower = pd.concat([df_manpower, new_row], ignore_index=True)
-            save_data(FILE_MANPOWER, df_manpower)
+            new_row = dict(zip(COLUMNS_MANPOWER, [tanggal, proyek, jumlah, nama_pekerja]))
+            append_rows(FILE_MANPOWER, [new_row], COLUMNS_MANPOWER)
             st.success("✅ Data Manpower berhasil disimpan!")
 
-    return df_manpower
-
 # =========================
 # Dashboard Manpower
 # =========================
-def dashboard_manpower(df_manpower):
+def dashboard_manpower():
     st.header("📊 Dashboard Manpower")
 
-    if df_manpower is None or df_manpower.empty:
+    proyek_values = distinct_values(FILE_MANPOWER, "Proyek")
+    if not proyek_values:
         st.info("Belum ada data manpower.")
         return
 
-    df_manpower["Tanggal"] = pd.to_datetime(df_manpower["Tanggal"], errors="coerce")
-    df_manpower["Bulan"] = df_manpower["Tanggal"].dt.strftime("%b")
-    df_manpower["Tahun"] = df_manpower["Tanggal"].dt.strftime("%Y")
-
-    proyek_list = ["All"] + sorted(df_manpower["Proyek"].dropna().unique().tolist())
+    proyek_list = ["All"] + proyek_values
     selected_proyek = st.selectbox("Filter Proyek / Lokasi", proyek_list)
-    tahun_list = ["All"] + sorted(df_manpower["Tahun"].dropna().unique().tolist())
+    tahun_list = ["All"] + [str(y) for y in available_years(FILE_MANPOWER)]
     selected_tahun = st.selectbox("Filter Tahun", tahun_list)
-    bulan_list = ["All"] + sorted(df_manpower["Bulan"].dropna().unique().tolist())
+    bulan_list = ["All"] + list(BULAN_NUM)
     selected_bulan = st.selectbox("Filter Bulan", bulan_list)
 
-    df_filtered = df_manpower.copy()
-    if selected_proyek != "All":
-        df_filtered = df_filtered[df_filtered["Proyek"] == selected_proyek]
-    if selected_tahun != "All":
-        df_filtered = df_filtered[df_filtered["Tahun"] == selected_tahun]
-    if selected_bulan != "All":
-        df_filtered = df_filtered[df_filtered["Bulan"] == selected_bulan]
+    filters = {
+        "proyek": selected_proyek if selected_proyek != "All" else None,
+        "year": int(selected_tahun) if selected_tahun != "All" else None,
+        "month": BULAN_NUM.get(selected_bulan),
+    }
+    # grafik dari time-series (Proyek, tanggal): query rentang, bukan memindai register
+    start = end = None
+    if filters["year"]:
+        start = pd.Timestamp(filters["year"], filters["month"] or 1, 1)
+        end = start + (pd.offsets.MonthEnd(1) if filters["month"] else pd.offsets.YearEnd(1))
+    series = {}
+
+    def timeseries():
+        # di-query hanya jika salah satu grafik belum ada di cache, paling banyak sekali per rerun
+        if "df" not in series:
+            df = manpower_timeseries(filters["proyek"], start, end)
+            if filters["month"] and not filters["year"]:
+                df = df[df["Tanggal"].dt.month == filters["month"]]
+            series["df"] = df
+        return series["df"]
 
     # Grafik
-    if selected_bulan != "All":
-        chart = df_filtered.groupby("Tanggal")["Jumlah Pekerja"].sum().reset_index()
-        if chart.empty:
-            st.warning("Tidak ada data untuk grafik harian dengan filter saat ini.")
-        else:
-            fig = px.bar(chart, x="Tanggal", y="Jumlah Pekerja", color_discrete_sequence=["#800000"])
-            st.subheader("Jumlah Pekerja per Hari")
-            st.plotly_chart(fig, use_container_width=True)
-    else:
-        chart = df_filtered.groupby("Bulan")["Jumlah Pekerja"].sum().reset_index()
-        if chart.empty:
-            st.warning("Tidak ada data untuk grafik bulanan dengan filter saat ini.")
+    with profile_stage("manpower: grafik"):
+        filter_key = (selected_proyek, selected_tahun, selected_bulan)
+        fig = cached_figure("manpower", FILE_MANPOWER, filter_key,
+                            lambda: _fig_manpower(timeseries(), selected_bulan))
+        kind = "bulanan" if selected_bulan == "All" else "harian"
+        if fig is None:
+            st.warning(f"Tidak ada data untuk grafik {kind} dengan filter saat ini.")
         else:
-            fig = px.bar(chart, x="Bulan", y="Jumlah Pekerja", color_discrete_sequence=["#800000"])
-            st.subheader("Jumlah Pekerja per Bulan")
+            st.subheader("Jumlah Pekerja per Hari" if kind == "harian" else "Jumlah Pekerja per Bulan")
             st.plotly_chart(fig, use_container_width=True)
 
+    # Tren per proyek (manhours = pekerja x jam kerja harian dari data manhours)
+    with profile_stage("manpower: tren proyek"):
+        st.subheader("Tren per Proyek")
+        col1, col2 = st.columns(2)
+        with col1: resolusi = st.selectbox("Resolusi", ["Harian", "Mingguan", "Bulanan"], index=2)
+        with col2: nilai = st.selectbox("Nilai", ["Manhours", "Jumlah Pekerja"])
+        freq = {"Harian": "D", "Mingguan": "W", "Bulanan": "M"}[resolusi]
+        trend_key = filter_key + (freq, nilai, json.dumps(get_storage().version(FILE_MANHOURS)))
+        fig_trend = cached_figure("manpower_tren", FILE_MANPOWER, trend_key,
+                                  lambda: _fig_manpower_trend(timeseries(), freq, nilai))
+        if fig_trend is not None:
+            st.plotly_chart(fig_trend, use_container_width=True)
+
     # Download
     st.markdown("---")
     st.subheader("📥 Unduh Laporan Manpower")
-    output = io.BytesIO()
-    df_filtered.to_excel(output, index=False, sheet_name="Data Manpower")
-    output.seek(0)
-    st.download_button(
-        label="💾 Download Data Manpower (Excel)",
-        data=output,
-        file_name=f"laporan_manpower_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    export_job_ui(
+        "manpower", [selected_proyek, selected_tahun, selected_bulan], get_storage().version(FILE_MANPOWER),
+        # semua kolom baru dimuat saat laporan benar-benar dibuat
+        lambda progress: _plain_excel(load_data(FILE_MANPOWER, COLUMNS_MANPOWER, filters), "Data Manpower"),
+        button_label="📦 Siapkan Laporan Manpower (Excel)",
+        download_label="💾 Download Data Manpower (Excel)",
+        file_prefix="laporan_manpower",
     )
 
 # =========================
 # Dokumen PDF
 # =========================
+PDF_DIR = os.path.join("uploads", "pdf")
+PDF_CATALOG_DB = "data_pdf_catalog.db"
+PDF_PAGE_SIZE = 20
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+@contextmanager
+def _pdf_catalog_db():
+    conn = sqlite3.connect(PDF_CATALOG_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS pdf (name TEXT PRIMARY KEY, size INTEGER, "
+                     "mtime_ns INTEGER, sha256 TEXT, pages INTEGER)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def _pdf_fingerprint(path):
+    """(sha256, jumlah halaman) dibaca lewat mmap, tanpa memuat file ke memori Python."""
+    digest = hashlib.sha256()
+    pages = 0
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest(), None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(0, len(mm), 2**20):
+                digest.update(mm[start:start + 2**20])
+            # hitungan objek /Type /Page; PDF dengan object stream terkompresi tidak terbaca
+            pages = sum(1 for _ in _PDF_PAGE_RE.finditer(mm))
+    return digest.hexdigest(), pages or None
+
+@process_resource
+def _pdf_sync_state():
+    return {"dir_mtime": None}
+
+def sync_pdf_catalog(force=False):
+    """
+    Samakan katalog (dan indeks pencarian PDF) dengan isi folder PDF. Hanya stat() per file;
+    hash, jumlah halaman, dan teks dihitung ulang hanya untuk file baru atau yang berubah.
+    Dilewati jika mtime folder sama dengan saat sinkron terakhir di proses ini: upload ditulis
+    lewat file sementara + rename, jadi file baru/diganti/dihapus selalu mengubah mtime folder.
+    """
+    os.makedirs(PDF_DIR, exist_ok=True)
+    state = _pdf_sync_state()
+    dir_mtime = os.stat(PDF_DIR).st_mtime_ns  # sebelum scan: perubahan selama scan ikut terdeteksi
+    if not force and state["dir_mtime"] == dir_mtime:
+        return
+    on_disk = {}
+    with os.scandir(PDF_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                st_ = entry.stat()
+                on_disk[entry.name] = (st_.st_size, st_.st_mtime_ns)
+    with _pdf_catalog_db() as conn:
+        known = {name: (size, mtime) for name, size, mtime in
+                 conn.execute("SELECT name, size, mtime_ns FROM pdf")}
+        removed = [(name,) for name in known if name not in on_disk]
+        conn.executemany("DELETE FROM pdf WHERE name = ?", removed)
+        for name, stat in on_disk.items():
+            if known.get(name) == stat:
+                continue
+            sha, pages = _pdf_fingerprint(os.path.join(PDF_DIR, name))
+            conn.execute("INSERT OR REPLACE INTO pdf VALUES (?, ?, ?, ?, ?)",
+                         (name, stat[0], stat[1], sha, pages))
+        catalog = dict(conn.execute("SELECT name, sha256 FROM pdf"))
+    sync_pdf_search(catalog)
+    state["dir_mtime"] = dir_mtime
+
+def pdf_catalog_page(query="", page=0, page_size=PDF_PAGE_SIZE):
+    """(total, baris) hasil pencarian nama file, terurut terbaru, satu halaman saja."""
+    where, params = "", []
+    if query:
+        where = "WHERE name LIKE ? ESCAPE '\\'"
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    with _pdf_catalog_db() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM pdf {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT name, size, mtime_ns, sha256, pages FROM pdf {where} "
+            "ORDER BY mtime_ns DESC, name LIMIT ? OFFSET ?",
+            params + [page_size, page * page_size]).fetchall()
+    keys = ["name", "size", "mtime_ns", "sha256", "pages"]
+    return total, [dict(zip(keys, row)) for row in rows]
+
+def read_pdf(name):
+    """Isi satu PDF untuk st.download_button (butuh bytes utuh, jadi dibaca biasa)."""
+    path = os.path.join(PDF_DIR, os.path.basename(name))
+    with open(path, "rb") as f:
+        return f.read()
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
 def dokumen_pdf():
     st.header("📂 Dokumen PDF")
 
     # Pastikan folder PDF ada
-    pdf_dir = "uploads/pdf"
-    os.makedirs(pdf_dir, exist_ok=True)
+    os.makedirs(PDF_DIR, exist_ok=True)
 
     # Hanya admin yang boleh upload PDF
     if st.session_state.get("logged_in", False):
         uploaded_file = st.file_uploader("Upload file PDF", type=["pdf"])
         if uploaded_file is not None:
-            save_path = os.path.join(pdf_dir, uploaded_file.name)
-            with open(save_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            st.success(f"✅ File berhasil diupload: {uploaded_file.name}")
-
-    # Tampilkan hanya file PDF di folder khusus
-    files = [f for f in os.listdir(pdf_dir) if f.lower().endswith(".pdf")]
-
-    if files:
-        st.subheader("📥 Unduh File PDF")
-        for file in files:
-            file_path = os.path.join(pdf_dir, file)
-            with open(file_path, "rb") as f:
-                st.download_button(
-                    label=f"📄 Download {file}",
-                    data=f.read(),
-                    file_name=file,
-                    mime="application/pdf"
-                )
-    else:
-        st.info("Belum ada file PDF yang diupload.")
+            # ditulis sekali di background; rerun berikutnya mendapat job yang sama
+            job = submit_upload("pdf", uploaded_file.getvalue(), uploaded_file.name)
+            if job["status"] == "done":
+                st.success(f"✅ File berhasil diupload: {job['name']}")
+            upload_status_ui([job], "pdf")
+
+    with profile_stage("pdf: sinkron katalog"):
+        sync_pdf_catalog()
+
+    # Daftar dari katalog: dipaginasi & dicari tanpa membuka file PDF
+    query = st.text_input("Cari dokumen", key="pdf_query").strip()
+    total, docs = pdf_catalog_page(query)
+    if total == 0:
+        st.info("Belum ada file PDF yang diupload." if not query else "Tidak ada dokumen yang cocok.")
+        return
+
+    pages = (total + PDF_PAGE_SIZE - 1) // PDF_PAGE_SIZE
+    if pages > 1:
+        page = st.number_input(f"Halaman (1-{pages})", min_value=1, max_value=pages, value=1, step=1)
+        if page > 1:
+            total, docs = pdf_catalog_page(query, page=int(page) - 1)
+
+    st.subheader("📥 Unduh File PDF")
+    st.caption(f"{total} dokumen")
+    for doc in docs:
+        name = doc["name"]
+        col1, col2 = st.columns([4, 1])
+        info = _format_size(doc["size"])
+        if doc["pages"]:
+            info += f", {doc['pages']} halaman"
+        col1.write(f"📄 {name} ({info})")
+        # file baru dibaca saat diminta, bukan untuk setiap dokumen di setiap rerun
+        if st.session_state.get("pdf_ready") == name:
+            try:
+                data = read_pdf(name)
+            except FileNotFoundError:
+                st.session_state.pop("pdf_ready", None)
+                col2.warning("File tidak ditemukan")
+                continue
+            col2.download_button("Download", data=data, file_name=name,
+                                 mime="application/pdf", key=f"pdf_dl_{name}")
+        elif col2.button("Siapkan", key=f"pdf_prep_{name}"):
+            st.session_state["pdf_ready"] = name
+            st.experimental_rerun()
+
+# =========================
+# Pencarian
+# =========================
+SEARCH_LABELS = {"accident": "Accident", "patrol": "Safety Patrol", "pdf": "Dokumen PDF"}
+
+def halaman_pencarian():
+    st.header("🔎 Pencarian")
+    # data accident & patrol hanya untuk admin, dokumen PDF untuk semua
+    sources = ("accident", "patrol", "pdf") if st.session_state.get("logged_in", False) else ("pdf",)
+    text = st.text_input("Kata kunci", key="search_text",
+                         help="Semua kata harus muncul, contoh: las ketinggian")
+    if not text.strip():
+        return
+
+    sync_pdf_catalog()
+    start = time.perf_counter()
+    with profile_stage("pencarian"):
+        hits = search(text, sources)
+    elapsed = time.perf_counter() - start
+    st.caption(f"{len(hits)} hasil ({elapsed * 1000:.0f} ms)")
+    if not hits:
+        st.info("Tidak ada hasil.")
+        return
+
+    for hit in hits:
+        label = SEARCH_LABELS[hit["source"]]
+        header = " · ".join(t for t in (label, hit["ref"] if hit["source"] != "pdf" else "",
+                                        hit["tanggal"], hit["title"]) if t)
+        st.markdown(f"**{header}**")
+        if hit["snippet"]:
+            st.markdown(hit["snippet"])
+        st.markdown("---")
+
+# =========================
+# Live Refresh (file watcher)
+# =========================
+# Watcher proses (inotify lewat watchdog; polling stat jika tidak tersedia) menaikkan versi
+# per bagian saat file datanya berubah. Sesi dengan live refresh (opt-in) menunggu di akhir
+# rerun dan baru rerun jika bagian yang ditampilkan halamannya berubah, paling sering sekali
+# per LIVE_REFRESH_SECONDS; bagian lain dilayani ulang dari cache data, rollup, dan grafik.
+# Penantian memegang thread script, jadi dibatasi LIVE_MAX_WAIT_SECONDS tanpa perubahan.
+LIVE_REFRESH_SECONDS = float(os.environ.get("K3_REFRESH_SECONDS", "10"))
+LIVE_MAX_WAIT_SECONDS = float(os.environ.get("K3_LIVE_MAX_WAIT", "900"))
+# K3_LIVE_REFRESH=1: live refresh aktif default (mis. layar monitor); selain itu opt-in per sesi
+LIVE_REFRESH_DEFAULT = os.environ.get("K3_LIVE_REFRESH") == "1"
+WATCH_POLL_SECONDS = 2
+LIVE_SECTIONS = {FILE_MANHOURS: "manhours", FILE_ACCIDENT: "accident",
+                 FILE_PATROL: "patrol", FILE_MANPOWER: "manpower"}
+# bagian yang ditampilkan tiap menu (halaman input admin tidak di-refresh otomatis)
+PAGE_SECTIONS = {
+    "Dashboard": ("manhours", "accident", "patrol"),
+    "Data Manpower": ("manpower",),
+    "Dokumen PDF": ("pdf",),
+    "Pencarian": ("accident", "patrol", "pdf"),
+}
+
+def _watch_sections(path):
+    """Bagian yang terpengaruh perubahan file ini (kosong jika tidak relevan)."""
+    rel = os.path.relpath(os.path.abspath(path))
+    name = os.path.basename(rel)
+    if name.startswith(".tmp_") or name.endswith((".lock", ".part")):
+        return ()
+    parts = rel.split(os.sep)
+    if rel.startswith(PDF_DIR + os.sep):
+        return ("pdf",) if name.lower().endswith(".pdf") else ()
+    # foto tidak dipantau: baris patrol yang merujuk foto baru ikut menaikkan versi data patrol
+    if parts[0] == PARTITION_DIR and len(parts) > 2:
+        return tuple(section for file, section in LIVE_SECTIONS.items() if DATASETS[file]["table"] == parts[1])
+    if len(parts) == 1:
+        if name.startswith(os.path.basename(SQLITE_PATH)):
+            return tuple(LIVE_SECTIONS.values())  # tabel mana pun bisa berubah
+        for file, section in LIVE_SECTIONS.items():
+            # data_x.csv, data_x.updates.csv, data_x.parquet, data_x.log.csv
+            if name.startswith(os.path.splitext(file)[0] + "."):
+                return (section,)
+    return ()
+
+def _watch_bump(watcher, path):
+    sections = _watch_sections(path)
+    if not sections:
+        return
+    # dipanggil dari thread watcher: hanya menaikkan versi, tanpa st.* / cache resource
+    with watcher["lock"]:
+        for section in sections:
+            watcher["versions"][section] += 1
+
+def _poll_signature():
+    """
+    (path, mtime_ns, size) yang dipantau, untuk mode polling: file data di folder kerja,
+    PDF di PDF_DIR, dan file partisi di PARTITION_DIR.
+    """
+    signature = set()
+
+    def add(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        signature.add((path, stat.st_mtime_ns, stat.st_size))
+
+    for entry in os.scandir("."):
+        if entry.is_file() and _watch_sections(entry.path):
+            add(entry.path)
+    for root in (PDF_DIR, PARTITION_DIR):
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if _watch_sections(os.path.join(dirpath, name)):
+                    add(os.path.join(dirpath, name))
+    return signature
+
+def _poll_loop(watcher):
+    previous = _poll_signature()
+    while True:
+        time.sleep(WATCH_POLL_SECONDS)
+        current = _poll_signature()
+        for path, _, _ in previous ^ current:
+            _watch_bump(watcher, path)
+        previous = current
+
+@process_resource
+def get_watcher():
+    """Satu watcher per proses: versi per bagian (manhours, accident, patrol, manpower, pdf)."""
+    watcher = {"lock": threading.Lock(), "mode": None,
+               "versions": dict.fromkeys(list(LIVE_SECTIONS.values()) + ["pdf"], 0)}
+    os.makedirs(PDF_DIR, exist_ok=True)
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    # rename atomik (file sementara -> file data) tercatat di dest_path
+                    _watch_bump(watcher, getattr(event, "dest_path", "") or event.src_path)
+
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(Handler(), ".", recursive=False)
+        observer.schedule(Handler(), PDF_DIR, recursive=False)
+        if os.path.isdir(PARTITION_DIR):
+            observer.schedule(Handler(), PARTITION_DIR, recursive=True)
+        observer.start()
+        watcher["mode"] = "inotify"
+    except Exception:
+        threading.Thread(target=_poll_loop, args=(watcher,), daemon=True, name="k3-watch").start()
+        watcher["mode"] = "polling"
+    return watcher
+
+def live_versions(menu):
+    """Versi bagian halaman ini sebelum dirender (perubahan selama render tidak terlewat)."""
+    sections = PAGE_SECTIONS.get(menu, ())
+    if not sections or not st_runtime.exists():
+        return {}
+    watcher = get_watcher()
+    with watcher["lock"]:
+        return {section: watcher["versions"][section] for section in sections}
+
+def live_refresh(seen):
+    """
+    Tunggu sampai salah satu bagian di seen berubah, lalu rerun (throttled). Caption status
+    diperbarui tiap detik sehingga interaksi pengguna tetap menghentikan penantian ini.
+    Tanpa perubahan selama LIVE_MAX_WAIT_SECONDS, run selesai (thread dilepas) dan
+    penantian dilanjutkan hanya jika pengguna menekan tombol atau berinteraksi lagi.
+    """
+    if not seen:
+        return
+    watcher = get_watcher()
+    status = st.sidebar.empty()
+    deadline = time.time() + LIVE_MAX_WAIT_SECONDS
+    while True:
+        with watcher["lock"]:
+            changed = [s for s, v in seen.items() if watcher["versions"][s] != v]
+        wait = st.session_state.get("live_last", 0.0) + LIVE_REFRESH_SECONDS - time.time()
+        if changed and wait <= 0:
+            st.session_state["live_last"] = time.time()
+            st.experimental_rerun()
+        if not changed and time.time() > deadline:
+            break
+        note = f"perubahan {', '.join(changed)}, refresh {wait:.0f} s lagi" if changed else "menunggu perubahan"
+        status.caption(f"🔴 Live ({watcher['mode']}): {note} · {datetime.now():%H:%M:%S}")
+        time.sleep(1)
+    with status.container():
+        st.caption(f"⏸️ Live dijeda: tidak ada perubahan selama {LIVE_MAX_WAIT_SECONDS / 60:.0f} menit")
+        st.button("🔄 Lanjutkan live refresh", key="live_resume")
 
 # =========================
 # MAIN
@@ -590,7 +3657,8 @@ def main():
         "Dashboard",
         "Input Data",
         "Data Manpower",
-        "Dokumen PDF"
+        "Dokumen PDF",
+        "Pencarian"
     ])
 
     if st.session_state["logged_in"]:
@@ -599,20 +3667,70 @@ def main():
     else:
         login()
 
-    df_man = load_data(FILE_MANHOURS, ["Tanggal","Manpower","Jam Kerja","Total Manhours"])
-    df_acc = load_data(FILE_ACCIDENT, ["Tanggal","Jenis","Kronologi"])
-    df_patrol = load_data(FILE_PATROL, ["Tanggal","Jenis Temuan","Ditemukan Oleh","Status","Deskripsi","Foto"])
-    df_manpower = load_data(FILE_MANPOWER, ["Tanggal","Proyek","Jumlah Pekerja","Nama Pekerja"])
-
-    if menu == "Dashboard":
-        dashboard(df_man, df_acc, df_patrol)
-    elif menu == "Input Data":
-        df_man, df_acc, df_patrol = input_data(df_man, df_acc, df_patrol)
-    elif menu == "Data Manpower":
-        df_manpower = input_data_manpower(df_manpower)
-        dashboard_manpower(df_manpower)
-    elif menu == "Dokumen PDF":
-        dokumen_pdf()
+    # Profil performa per rerun (opt-in)
+    profiling = PROFILE_ENV
+    if st.session_state["logged_in"]:
+        profiling = st.sidebar.checkbox("Profil performa", key="profiling") or profiling
+    if profiling:
+        profile_begin(menu)
+
+    # opt-in per sesi (default dari K3_LIVE_REFRESH untuk layar monitor)
+    live = st.sidebar.checkbox("Live refresh", value=LIVE_REFRESH_DEFAULT, key="live_refresh")
+    seen = live_versions(menu) if live else {}
+
+    # Hanya load dataset yang dibutuhkan menu terpilih
+    with profile_stage(f"halaman {menu}"):
+        if menu == "Dashboard":
+            dashboard()
+        elif menu == "Input Data":
+            df_man = load_data(FILE_MANHOURS, COLUMNS_MANHOURS)
+            df_acc = load_data(FILE_ACCIDENT, COLUMNS_ACCIDENT)
+            df_patrol = load_data(FILE_PATROL, COLUMNS_PATROL)
+            df_man, df_acc, df_patrol = input_data(df_man, df_acc, df_patrol)
+        elif menu == "Data Manpower":
+            input_data_manpower()
+            dashboard_manpower()
+        elif menu == "Dokumen PDF":
+            dokumen_pdf()
+        elif menu == "Pencarian":
+            halaman_pencarian()
+
+    run = profile_end()
+    write_metrics_log(run)
+    if run is not None and st.session_state["logged_in"]:
+        profile_panel(run)
+
+    if st.session_state["logged_in"] and get_storage().name in ("csv", "partitioned"):
+        stats = cache_stats()
+        st.sidebar.caption(
+            f"Cache data: {stats['hits']} hit / {stats['misses']} miss "
+            f"({stats['hit_rate']:.0%}), parsing {stats['parse_time']:.2f} s"
+        )
+    if st.session_state["logged_in"]:
+        figs = get_figure_cache()
+        st.sidebar.caption(
+            f"Cache grafik: {figs['hits']} hit / {figs['misses']} miss, "
+            f"{len(figs['entries'])} figure ({figs['bytes'] / 2**20:.1f} MB)"
+        )
+        # dihitung hanya jika diminta (memory_usage deep memindai kolom teks)
+        if st.sidebar.checkbox("Memori data", key="memory_report"):
+            for item in memory_report():
+                detail = ", ".join(f"{c}: {dtype}" for c, (dtype, _) in item["columns"].items()
+                                   if c not in DERIVED_COLUMNS)
+                st.sidebar.caption(f"{item['dataset']}: {item['rows']:,} baris, "
+                                   f"{item['bytes'] / 2**20:.1f} MB ({detail})")
+
+    live_refresh(seen)
 
 if __name__ == "__main__":
-    main()
+    if "--import-sqlite" in sys.argv:
+        # python dashboard_k3.py --import-sqlite  -> salin CSV ke SQLite sekali jalan
+        for table, n in import_csv_to_sqlite().items():
+            print(f"{table}: {n} baris")
+    elif "--compact" in sys.argv:
+        # python dashboard_k3.py --compact  -> lipat log ke snapshot (parquet) / file CSV utama
+        for file in compact_storage():
+            print(f"{file}: dipadatkan")
+    else:
+        enable_copy_on_write()
+        main()
@@ -0,0 +1,234 @@
+"""
+Impor massal data historis (CSV / XLSX) ke dataset dashboard_k3 tanpa lewat form.
+
+Contoh:
+    python ingest_k3.py manpower:rekap_2021.xlsx manpower:rekap_2022.xlsx
+    python ingest_k3.py accident_lama.csv patrol_2023.csv     # dataset dideteksi dari header
+    python ingest_k3.py manhours:mh.csv --dry-run --rejects ditolak.csv
+
+File dibaca per chunk, divalidasi terhadap kolom dataset (COLUMNS_* di dashboard_k3),
+baris duplikat (di file input maupun yang sudah tersimpan) dilewati, lalu semua baris
+baru per dataset ditulis dalam SATU append (rollup & indeks pencarian ikut diperbarui).
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+import dashboard_k3 as k3
+
+DATASET_NAMES = {meta["table"]: file for file, meta in k3.DATASETS.items()}
+# kolom yang boleh tidak ada di file input (diisi kosong / dihitung)
+OPTIONAL_COLUMNS = {
+    k3.FILE_MANHOURS: {"Total Manhours"},
+    k3.FILE_ACCIDENT: set(),
+    k3.FILE_PATROL: {"Kode Temuan", "Foto", "Tanggal Close", "Catatan Progress"},
+    k3.FILE_MANPOWER: {"Nama Pekerja"},
+}
+DEFAULT_CHUNK = 50_000
+
+
+# =========================
+# Membaca file input
+# =========================
+def _normalize_header(columns):
+    return [str(c).strip() if c is not None else "" for c in columns]
+
+def read_header(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return next(iter_chunks(path, 1), pd.DataFrame()).columns.tolist()
+    return _normalize_header(pd.read_csv(path, nrows=0).columns)
+
+def iter_chunks(path, chunksize):
+    """DataFrame per chunk (semua nilai sebagai teks/objek apa adanya)."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        if not k3.HAS_IMG_TO_EXCEL:
+            raise SystemExit("openpyxl belum terpasang, tidak bisa membaca XLSX")
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = _normalize_header(next(rows, ()))
+            batch = []
+            for row in rows:
+                if all(v is None or v == "" for v in row):
+                    continue
+                batch.append(row[:len(header)])
+                if len(batch) >= chunksize:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            wb.close()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+            chunk.columns = _normalize_header(chunk.columns)
+            yield chunk
+
+def detect_dataset(header):
+    """Dataset yang semua kolom wajibnya ada di header (paling banyak kolom cocok)."""
+    best, best_score = None, 0
+    for file, meta in k3.DATASETS.items():
+        required = set(meta["columns"]) - OPTIONAL_COLUMNS[file]
+        if required <= set(header):
+            score = len(set(meta["columns"]) & set(header))
+            if score > best_score:
+                best, best_score = file, score
+    return best
+
+
+# =========================
+# Validasi & deduplikasi
+# =========================
+def validate(file, chunk):
+    """(baris valid bertipe, baris ditolak + kolom Alasan)."""
+    columns = k3.DATASETS[file]["columns"]
+    missing = set(columns) - set(chunk.columns) - OPTIONAL_COLUMNS[file]
+    if missing:
+        raise ValueError(f"kolom wajib tidak ada: {', '.join(sorted(missing))}")
+    raw = chunk.reindex(columns=columns)
+    typed = k3._coerce_types(raw.copy())
+
+    reason = k3.schema_problems(file, typed, optional=OPTIONAL_COLUMNS[file])
+    if file == k3.FILE_MANHOURS:
+        total = typed["Total Manhours"]
+        typed["Total Manhours"] = total.where(total.notna(), typed["Manpower"] * typed["Jam Kerja"])
+    for c in columns:
+        # angka bulat tetap ditulis tanpa ".0", sama seperti input dari form
+        if c in k3.NUMERIC_COLUMNS and (typed[c].dropna() % 1 == 0).all():
+            typed[c] = typed[c].astype("Int64")
+
+    for c in columns:
+        if c not in k3.DATE_COLUMNS and c not in k3.NUMERIC_COLUMNS:
+            typed[c] = typed[c].fillna("").astype(str).str.strip()
+    ok = reason == ""
+    rejected = raw[~ok].assign(Alasan=reason[~ok])
+    return typed.loc[ok, columns], rejected
+
+def dedupe_keys(file, df, by_kode=True):
+    """Kunci deduplikasi per baris: Kode Temuan untuk patrol (jika ada), selain itu isi baris."""
+    columns = [c for c in k3.DATASETS[file]["columns"] if c != "Kode Temuan"]
+    norm = pd.DataFrame(index=df.index)
+    for c in columns:
+        if c in k3.DATE_COLUMNS:
+            norm[c] = pd.to_datetime(df[c], errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+        elif c in k3.NUMERIC_COLUMNS:
+            norm[c] = pd.to_numeric(df[c], errors="coerce").map(lambda v: "" if pd.isna(v) else f"{v:g}")
+        else:
+            norm[c] = df[c].astype(object).fillna("").astype(str).str.strip()
+    keys = pd.Series(list(norm.itertuples(index=False, name=None)), index=df.index)
+    if by_kode and file == k3.FILE_PATROL and "Kode Temuan" in df.columns:
+        kode = df["Kode Temuan"].fillna("").astype(str).str.strip()
+        keys = keys.where(kode == "", kode)
+    return keys
+
+
+# =========================
+# Impor per dataset
+# =========================
+def ingest(file, paths, chunksize=DEFAULT_CHUNK, dry_run=False, dedupe=True):
+    """Impor semua file untuk satu dataset; mengembalikan (ringkasan, DataFrame ditolak)."""
+    start = time.perf_counter()
+    existing = k3.load_data(file).reindex(columns=k3.DATASETS[file]["columns"])
+    seen = set()
+    # Kode Temuan yang sudah terpakai (tersimpan + baris batch ini): kode tidak boleh dobel
+    codes = set()
+    if file == k3.FILE_PATROL and not existing.empty:
+        codes.update(k for k in existing["Kode Temuan"].astype(object).fillna("").astype(str) if k)
+    if dedupe and not existing.empty:
+        # baris tersimpan dikenali dari isinya, dan (patrol) juga dari Kode Temuan
+        seen.update(dedupe_keys(file, existing, by_kode=False))
+        seen.update(codes)
+
+    stats = {"dataset": k3.DATASETS[file]["table"], "read": 0, "rejected": 0, "duplicate": 0, "written": 0}
+    batches, rejects = [], []
+    for path in paths:
+        for chunk in iter_chunks(path, chunksize):
+            stats["read"] += len(chunk)
+            valid, rejected = validate(file, chunk)
+            if not rejected.empty:
+                rejects.append(rejected.assign(File=os.path.basename(path)))
+            if dedupe:
+                keys = dedupe_keys(file, valid)
+                fresh = ~keys.isin(seen) & ~keys.duplicated()
+                stats["duplicate"] += int((~fresh).sum())
+                seen.update(keys[fresh])
+                valid = valid[fresh]
+            if file == k3.FILE_PATROL:
+                # tanpa dedupe, baris dengan kode yang sudah terpakai tetap tidak boleh masuk
+                kode = valid["Kode Temuan"]
+                taken = (kode != "") & (kode.isin(codes) | kode.duplicated())
+                if taken.any():
+                    rejects.append(chunk.reindex(columns=k3.DATASETS[file]["columns"]).loc[taken[taken].index]
+                                   .assign(Alasan="Kode Temuan sudah dipakai", File=os.path.basename(path)))
+                    valid = valid[~taken]
+                codes.update(k for k in valid["Kode Temuan"] if k)
+            batches.append(valid)
+    stats["rejected"] = sum(len(r) for r in rejects)
+
+    new = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+    if file == k3.FILE_PATROL and not new.empty:
+        # Kode Temuan kosong -> nomor urut harian berdasarkan Tanggal temuan, setelah nomor
+        # kode eksplisit di batch ini (yang juga menaikkan nomor urut untuk input berikutnya)
+        blank = new["Kode Temuan"] == ""
+        if not dry_run:
+            new.loc[blank, "Kode Temuan"] = k3.allocate_kode_temuan(
+                new.loc[blank, "Tanggal"].tolist(), reserved=new.loc[~blank, "Kode Temuan"].tolist())
+    if not new.empty and not dry_run:
+        # satu penulisan per dataset
+        k3.append_rows(file, new.to_dict("records"), k3.DATASETS[file]["columns"])
+    stats["written"] = 0 if dry_run else len(new)
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_s"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats, (pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Impor massal CSV/XLSX ke dataset dashboard_k3")
+    parser.add_argument("files", nargs="+",
+                        help=f"FILE atau DATASET:FILE, DATASET salah satu dari {', '.join(DATASET_NAMES)}")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK)
+    parser.add_argument("--dry-run", action="store_true", help="validasi & hitung saja, tanpa menulis")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="jangan lewati baris yang isinya sama persis dengan baris lain")
+    parser.add_argument("--rejects", help="tulis baris yang ditolak (dengan alasan) ke CSV ini")
+    args = parser.parse_args(argv)
+
+    groups = {}
+    for arg in args.files:
+        name, sep, path = arg.partition(":")
+        if sep and name in DATASET_NAMES:
+            file = DATASET_NAMES[name]
+        else:
+            path = arg
+            file = detect_dataset(read_header(path))
+            if file is None:
+                parser.error(f"{path}: header tidak cocok dengan dataset mana pun, gunakan DATASET:FILE")
+        if not os.path.exists(path):
+            parser.error(f"{path}: file tidak ditemukan")
+        groups.setdefault(file, []).append(path)
+
+    all_rejects = []
+    print(f"{'dataset':<10} {'dibaca':>9} {'ditolak':>8} {'duplikat':>9} {'ditulis':>9} {'detik':>8} {'baris/s':>10}")
+    for file, paths in groups.items():
+        try:
+            stats, rejects = ingest(file, paths, args.chunksize, args.dry_run, not args.no_dedupe)
+        except ValueError as e:
+            print(f"{k3.DATASETS[file]['table']}: {e}", file=sys.stderr)
+            return 1
+        all_rejects.append(rejects.assign(Dataset=stats["dataset"]) if not rejects.empty else rejects)
+        print(f"{stats['dataset']:<10} {stats['read']:>9} {stats['rejected']:>8} {stats['duplicate']:>9} "
+              f"{stats['written']:>9} {stats['seconds']:>8.2f} {stats['rows_per_s']:>10.0f}")
+
+    rejected = pd.concat(all_rejects, ignore_index=True) if all_rejects else pd.DataFrame()
+    if args.rejects and not rejected.empty:
+        rejected.to_csv(args.rejects, index=False, date_format="%Y-%m-%d")
+        print(f"{len(rejected)} baris ditolak ditulis ke {args.rejects}")
+    if args.dry_run:
+        print("Dry run: tidak ada data yang ditulis.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
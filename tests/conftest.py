@@ -0,0 +1,20 @@
+import pytest
+
+import dashboard_k3 as k3
+
+
+def patrol_row(kode, **values):
+    row = {"Kode Temuan": kode, "Tanggal": "2024-05-02", "Jenis Temuan": "Manpower",
+           "Ditemukan Oleh": "Petugas 1", "Status": "Open", "Deskripsi": "Pekerja tanpa helm",
+           "Foto": "", "Tanggal Close": "", "Catatan Progress": ""}
+    row.update(values)
+    return row
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Folder kerja kosong (semua file data & sidecar relatif ke cwd) dan cache proses bersih."""
+    monkeypatch.chdir(tmp_path)
+    k3._LOCAL_RESOURCES.clear()
+    yield tmp_path
+    k3._LOCAL_RESOURCES.clear()
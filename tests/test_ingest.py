@@ -0,0 +1,72 @@
+import pandas as pd
+
+import dashboard_k3 as k3
+import ingest_k3
+from conftest import patrol_row
+
+
+def _write_input(path, rows):
+    pd.DataFrame(rows, columns=k3.COLUMNS_PATROL_FULL).to_csv(path, index=False)
+    return str(path)
+
+
+def _stored_codes():
+    return k3.load_data(k3.FILE_PATROL)["Kode Temuan"].astype(str).tolist()
+
+
+def test_blank_codes_are_numbered_after_explicit_codes_in_batch(workdir):
+    path = _write_input(workdir / "in.csv", [
+        patrol_row("SP-20240502-001"),
+        patrol_row("", Deskripsi="APAR terhalang material"),
+    ])
+    stats, rejects = ingest_k3.ingest(k3.FILE_PATROL, [path])
+
+    assert stats["written"] == 2 and rejects.empty
+    assert sorted(_stored_codes()) == ["SP-20240502-001", "SP-20240502-002"]
+    # kode eksplisit juga menaikkan nomor urut harian untuk input berikutnya
+    assert k3.next_kode_temuan(pd.Timestamp("2024-05-02")) == "SP-20240502-003"
+
+
+def test_explicit_codes_advance_daily_sequence(workdir):
+    path = _write_input(workdir / "in.csv", [patrol_row("SP-20240502-007")])
+    ingest_k3.ingest(k3.FILE_PATROL, [path])
+
+    assert k3.next_kode_temuan(pd.Timestamp("2024-05-02")) == "SP-20240502-008"
+    assert k3.next_kode_temuan(pd.Timestamp("2024-05-03")) == "SP-20240503-001"
+
+
+def test_duplicate_codes_rejected_without_dedupe(workdir):
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame([patrol_row("SP-20240502-001")]))
+    path = _write_input(workdir / "in.csv", [
+        patrol_row("SP-20240502-001", Deskripsi="kode sudah tersimpan"),
+        patrol_row("SP-20240502-005"),
+        patrol_row("SP-20240502-005", Deskripsi="kode dobel di file"),
+    ])
+    stats, rejects = ingest_k3.ingest(k3.FILE_PATROL, [path], dedupe=False)
+
+    assert stats["written"] == 1
+    assert sorted(rejects["Deskripsi"]) == ["kode dobel di file", "kode sudah tersimpan"]
+    assert (rejects["Alasan"] == "Kode Temuan sudah dipakai").all()
+    assert sorted(_stored_codes()) == ["SP-20240502-001", "SP-20240502-005"]
+
+
+def test_duplicate_rows_skipped_with_dedupe(workdir):
+    path = _write_input(workdir / "in.csv", [
+        patrol_row(""), patrol_row(""), patrol_row("", Deskripsi="lain"),
+    ])
+    stats, _ = ingest_k3.ingest(k3.FILE_PATROL, [path])
+
+    assert stats["duplicate"] == 1 and stats["written"] == 2
+    assert sorted(_stored_codes()) == ["SP-20240502-001", "SP-20240502-002"]
+
+
+def test_invalid_rows_rejected_with_reason(workdir):
+    path = _write_input(workdir / "in.csv", [
+        patrol_row(""),
+        patrol_row("", Tanggal="bukan tanggal"),
+        patrol_row("", Status="Selesai"),
+    ])
+    stats, rejects = ingest_k3.ingest(k3.FILE_PATROL, [path])
+
+    assert stats["written"] == 1 and len(rejects) == 2
+    assert (rejects["Alasan"] != "").all()
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import dashboard_k3 as k3
+from conftest import patrol_row
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Waktu event riwayat dikendalikan test (bukan datetime.now())."""
+    now = [pd.Timestamp("2024-05-02 12:00")]
+    history_ts = k3._history_ts
+    monkeypatch.setattr(k3, "_history_ts",
+                        lambda when=None: now[0].strftime("%Y-%m-%dT%H:%M:%S") if when is None else history_ts(when))
+    return now
+
+
+def _update(clock, when, kode, **values):
+    clock[0] = pd.Timestamp(when)
+    row = k3.load_data(k3.FILE_PATROL).set_index("Kode Temuan").loc[kode]
+    row = {c: row[c] for c in k3.COLUMNS_PATROL_FULL if c != "Kode Temuan"}
+    row["Tanggal"] = row["Tanggal"].strftime("%Y-%m-%d")
+    k3.upsert_row(k3.FILE_PATROL, "Kode Temuan", patrol_row(kode, **dict(row, **values)),
+                  k3.COLUMNS_PATROL_FULL)
+
+
+def _statuses(when):
+    df = k3.patrol_as_of(when)
+    return dict(zip(df["Kode Temuan"].astype(str), df["Status"].astype(str)))
+
+
+@pytest.fixture
+def history(workdir, clock, monkeypatch):
+    monkeypatch.setattr(k3, "HISTORY_CHECKPOINT_MIN", 2)
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame(
+        [patrol_row("SP-20240502-001"), patrol_row("SP-20240502-002")], columns=k3.COLUMNS_PATROL_FULL))
+    k3.patrol_as_of("2024-05-02")  # riwayat awal diisi dari data yang sudah ada
+    _update(clock, "2024-05-03 08:00", "SP-20240502-001", Status="Progress")
+    _update(clock, "2024-05-05 08:00", "SP-20240502-002", Status="Progress")
+    _update(clock, "2024-05-06 08:00", "SP-20240502-001", Status="Close",
+            **{"Tanggal Close": "2024-05-06"})
+
+
+def test_patrol_as_of_replays_status_per_date(history):
+    assert _statuses("2024-05-01") == {}
+    assert _statuses("2024-05-02") == {"SP-20240502-001": "Open", "SP-20240502-002": "Open"}
+    assert _statuses("2024-05-04") == {"SP-20240502-001": "Progress", "SP-20240502-002": "Open"}
+    assert _statuses("2024-05-06") == {"SP-20240502-001": "Close", "SP-20240502-002": "Progress"}
+
+
+def test_patrol_as_of_matches_full_replay_without_checkpoints(history):
+    days = ["2024-05-02", "2024-05-03", "2024-05-05", "2024-05-06"]
+    with_checkpoints = [_statuses(day) for day in days]
+    with sqlite3.connect(k3.PATROL_HISTORY_DB) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] >= 2
+        conn.execute("DELETE FROM checkpoints")
+    assert [_statuses(day) for day in days] == with_checkpoints
+
+
+def test_status_durations_sums_progress_spans(history):
+    durations = k3.status_durations("Progress", "2024-05-07 08:00")
+    days = dict(zip(durations["Kode Temuan"], durations["Hari"]))
+    assert days == {"SP-20240502-001": pytest.approx(3.0), "SP-20240502-002": pytest.approx(2.0)}
+    assert k3.status_durations("Progress", "2024-05-02").empty
+
+
+def test_patrol_history_lists_changes(history):
+    changes = [h["Perubahan"] for h in k3.patrol_history("SP-20240502-001")]
+    assert changes[1:] == ["Status: Open → Progress",
+                           "Status: Progress → Close; Tanggal Close: - → 2024-05-06"]
+
+
+def test_allocate_kode_temuan_continues_after_existing_codes(workdir):
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame(
+        [patrol_row("SP-20240502-004"), patrol_row("SP-20240502-002")], columns=k3.COLUMNS_PATROL_FULL))
+    days = [pd.Timestamp("2024-05-02"), pd.Timestamp("2024-05-03"), pd.Timestamp("2024-05-02")]
+    assert k3.allocate_kode_temuan(days) == ["SP-20240502-005", "SP-20240503-001", "SP-20240502-006"]
+    assert k3.next_kode_temuan(pd.Timestamp("2024-05-02")) == "SP-20240502-007"
@@ -0,0 +1,59 @@
+import os
+import zlib
+
+import pandas as pd
+
+import dashboard_k3 as k3
+from conftest import patrol_row
+
+
+def _write_pdf(name, text):
+    os.makedirs(k3.PDF_DIR, exist_ok=True)
+    body = f"BT ({text}) Tj ET".encode()
+    with open(os.path.join(k3.PDF_DIR, name), "wb") as f:
+        f.write(b"%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n2 0 obj << >>\nstream\n"
+                + body + b"\nendstream\nendobj\n%%EOF\n")
+
+
+def test_sync_pdf_catalog_skips_unchanged_folder(workdir, monkeypatch):
+    _write_pdf("a.pdf", "inspeksi perancah")
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(k3.os, "scandir", lambda path: scans.append(path) or scandir(path))
+
+    k3.sync_pdf_catalog()
+    k3.sync_pdf_catalog()
+    assert len(scans) == 1
+    assert k3.pdf_catalog_page()[0] == 1
+
+    _write_pdf("b.pdf", "toolbox meeting")
+    k3.sync_pdf_catalog()
+    assert len(scans) == 2
+    assert k3.pdf_catalog_page()[0] == 2
+    assert [hit["ref"] for hit in k3.search("toolbox", ("pdf",))] == ["b.pdf"]
+
+
+def test_read_pdf_returns_bytes(workdir):
+    _write_pdf("a.pdf", "inspeksi perancah")
+    data = k3.read_pdf("a.pdf")
+    assert isinstance(data, bytes) and data.startswith(b"%PDF")
+
+
+def test_extract_pdf_text_bounds_inflated_streams(workdir, monkeypatch):
+    os.makedirs(k3.PDF_DIR, exist_ok=True)
+    path = os.path.join(k3.PDF_DIR, "bom.pdf")
+    content = b" " * 50000 + b"BT (tersembunyi) Tj ET"
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\nstream\n" + zlib.compress(content) + b"\nendstream\n")
+
+    assert k3.extract_pdf_text(path) == "tersembunyi"
+    monkeypatch.setattr(k3, "PDF_INFLATE_LIMIT", 1000)
+    assert k3.extract_pdf_text(path) == ""
+
+
+def test_search_rebuilds_stale_index(workdir):
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame([patrol_row("SP-20240502-001", Deskripsi="kabel terkelupas")]))
+    assert [hit["ref"] for hit in k3.search("kabel", ("patrol",))] == ["SP-20240502-001"]
+    # data diganti di luar upsert/append: indeks dibangun ulang saat pencarian berikutnya
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame([patrol_row("SP-20240502-002", Deskripsi="kabel listrik")]))
+    assert [hit["ref"] for hit in k3.search("kabel", ("patrol",))] == ["SP-20240502-002"]
@@ -0,0 +1,51 @@
+import json
+
+import pandas as pd
+
+import dashboard_k3 as k3
+from conftest import patrol_row
+
+
+def _cells(file):
+    df = k3.rollup_frame(file)
+    return df.sort_values(["dim", "year", "month", "key"]).reset_index(drop=True)
+
+
+def _rebuilt(file):
+    k3._LOCAL_RESOURCES.clear()
+    k3.get_rollup_store()["datasets"].pop(file, None)
+    return _cells(file)
+
+
+def test_patrol_rollup_deltas_match_rebuild(workdir):
+    columns = k3.COLUMNS_PATROL_FULL
+    k3.save_data(k3.FILE_PATROL, pd.DataFrame([patrol_row("SP-20240502-001")], columns=columns))
+    _cells(k3.FILE_PATROL)
+    k3.append_rows(k3.FILE_PATROL, [patrol_row("SP-20240601-001", Tanggal="2024-06-01")], columns)
+    k3.upsert_row(k3.FILE_PATROL, "Kode Temuan", patrol_row(
+        "SP-20240502-001", Status="Close", **{"Tanggal Close": "2024-05-09"}), columns)
+    k3.upsert_row(k3.FILE_PATROL, "Kode Temuan", patrol_row("SP-20240603-001", Tanggal="2024-06-03"), columns)
+
+    incremental = _cells(k3.FILE_PATROL)
+    status = incremental[incremental["dim"] == "Status"].set_index(["month", "key"])["value"]
+    assert status.to_dict() == {(5, "Close"): 1, (6, "Open"): 2}
+    pd.testing.assert_frame_equal(incremental, _rebuilt(k3.FILE_PATROL), check_dtype=False)
+
+
+def test_manhours_daily_cells_follow_appends(workdir):
+    rows = [{"Tanggal": "2024-05-02", "Manpower": 10, "Jam Kerja": 8, "Total Manhours": 80}]
+    k3.save_data(k3.FILE_MANHOURS, pd.DataFrame(rows, columns=k3.COLUMNS_MANHOURS))
+    k3.append_rows(k3.FILE_MANHOURS, [dict(rows[0], Manpower=5, **{"Total Manhours": 40})],
+                   k3.COLUMNS_MANHOURS)
+    assert k3.rollup_daily(k3.FILE_MANHOURS, pd.Timestamp("2024-05-02").date()) == 120
+    pd.testing.assert_frame_equal(_cells(k3.FILE_MANHOURS), _rebuilt(k3.FILE_MANHOURS), check_dtype=False)
+
+
+def test_rollup_persist_keeps_other_datasets(workdir):
+    # dua proses dengan store masing-masing: menyimpan satu dataset tidak menimpa dataset lain
+    first = {"datasets": {k3.FILE_ACCIDENT: k3._rollup_entry(["csv", 1, 1], {(k3.ROLLUP_TOTAL, 2024, 5, ""): 1})}}
+    second = {"datasets": {k3.FILE_PATROL: k3._rollup_entry(["csv", 2, 2], {(k3.ROLLUP_TOTAL, 2024, 5, ""): 3})}}
+    k3._rollup_persist(first, k3.FILE_ACCIDENT)
+    k3._rollup_persist(second, k3.FILE_PATROL)
+    with open(k3.ROLLUP_FILE) as f:
+        assert set(json.load(f)) == {k3.FILE_ACCIDENT, k3.FILE_PATROL}
@@ -0,0 +1,115 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dashboard_k3 as k3
+from conftest import patrol_row
+
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_parquet_upsert_fills_empty_text_columns(workdir):
+    storage = k3.ParquetStorage()
+    columns = k3.COLUMNS_PATROL_FULL
+    # snapshot dimigrasi dari CSV lama: kolom teks yang kosong semua terbaca float64
+    rows = [patrol_row("SP-20240502-001"), patrol_row("SP-20240502-002")]
+    pd.DataFrame(rows, columns=columns).to_csv(k3.FILE_PATROL, index=False)
+
+    update = patrol_row("SP-20240502-001", Status="Close", **{
+        "Tanggal Close": "2024-05-10", "Catatan Progress": "APD sudah dibagikan"})
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan", update, columns)
+
+    assert old is not None and old["Status"] == "Open"
+    assert position == 0
+
+    k3._LOCAL_RESOURCES.clear()
+    stored = k3._plain(storage.load(k3.FILE_PATROL)).set_index("Kode Temuan")
+    assert len(stored) == 2
+    assert stored.loc["SP-20240502-001", "Status"] == "Close"
+    assert stored.loc["SP-20240502-001", "Catatan Progress"] == "APD sudah dibagikan"
+    assert pd.to_datetime(stored.loc["SP-20240502-001", "Tanggal Close"]) == pd.Timestamp("2024-05-10")
+    assert stored.loc["SP-20240502-002", "Status"] == "Open"
+
+
+def test_partitioned_upsert_moves_row_between_months(workdir):
+    storage = k3.PartitionedStorage()
+    columns = k3.COLUMNS_PATROL_FULL
+    rows = [patrol_row("SP-20240502-001"), patrol_row("SP-20240502-002"),
+            patrol_row("SP-20240601-001", Tanggal="2024-06-01")]
+    storage.save(k3.FILE_PATROL, pd.DataFrame(rows, columns=columns))
+
+    # update di bulan yang sama: posisi dari manifest, tanggal tetap bertipe datetime
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan",
+                                   patrol_row("SP-20240502-002", Tanggal="2024-05-20", Status="Close"), columns)
+    assert old["Status"] == "Open" and position == 1
+    part = k3._csv_frame(k3._partition_path(k3.FILE_PATROL, "2024/05"))
+    assert pd.api.types.is_datetime64_any_dtype(part["Tanggal"])
+
+    # Tanggal pindah bulan: baris pindah partisi, baris lain bergeser -> posisi tidak diketahui
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan",
+                                   patrol_row("SP-20240502-001", Tanggal="2024-07-03"), columns)
+    assert old is not None and position is None
+    manifest = k3._read_manifest(k3.FILE_PATROL)["partitions"]
+    assert {p: s["rows"] for p, s in manifest.items()} == {"2024/05": 1, "2024/06": 1, "2024/07": 1}
+
+    # baris baru di partisi terakhir: posisinya di akhir data
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan",
+                                   patrol_row("SP-20240704-001", Tanggal="2024-07-04"), columns)
+    assert old is None and position == 3
+    df = storage.load(k3.FILE_PATROL)
+    assert df["Kode Temuan"].tolist() == ["SP-20240502-002", "SP-20240601-001",
+                                          "SP-20240502-001", "SP-20240704-001"]
+
+
+def test_csv_updates_go_to_log_until_compaction(workdir, monkeypatch):
+    monkeypatch.setattr(k3, "CSV_UPDATE_LOG_MAX_ROWS", 2)
+    storage = k3.CsvStorage()
+    columns = k3.COLUMNS_PATROL_FULL
+    storage.save(k3.FILE_PATROL, pd.DataFrame(
+        [patrol_row("SP-20240502-001"), patrol_row("SP-20240502-002")], columns=columns))
+    with open(k3.FILE_PATROL) as f:
+        base = f.read()
+    log_path = k3._csv_updates_path(k3.FILE_PATROL)
+
+    # update: file utama tidak ditulis ulang, baris utuh masuk ke log
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan",
+                                   {"Kode Temuan": "SP-20240502-002", "Status": "Progress"}, columns)
+    assert old["Status"] == "Open" and position == 1
+    with open(k3.FILE_PATROL) as f:
+        assert f.read() == base
+    assert len(k3._csv_frame(log_path)) == 1
+    stored = storage.load(k3.FILE_PATROL).set_index("Kode Temuan")
+    assert stored.loc["SP-20240502-002", "Status"] == "Progress"
+    assert stored.loc["SP-20240502-002", "Deskripsi"] == "Pekerja tanpa helm"
+
+    # baris baru di-append ke file utama
+    old, position = storage.upsert(k3.FILE_PATROL, "Kode Temuan", patrol_row("SP-20240502-003"), columns)
+    assert old is None and position == 2
+
+    # log melewati batas -> dilipat ke file utama
+    for status in ("Close", "Open"):
+        storage.upsert(k3.FILE_PATROL, "Kode Temuan", {"Kode Temuan": "SP-20240502-001", "Status": status}, columns)
+    assert not os.path.exists(log_path)
+    stored = k3._csv_frame(k3.FILE_PATROL).set_index("Kode Temuan")
+    assert stored["Status"].astype(str).to_dict() == {
+        "SP-20240502-001": "Open", "SP-20240502-002": "Progress", "SP-20240502-003": "Open"}
+
+
+def test_parquet_projected_read_applies_log_updates(workdir):
+    storage = k3.ParquetStorage()
+    columns = k3.COLUMNS_PATROL_FULL
+    storage.save(k3.FILE_PATROL, pd.DataFrame(
+        [patrol_row("SP-20240502-001"), patrol_row("SP-20240502-002")], columns=columns))
+    # update di log memindahkan temuan ke bulan Juni
+    storage.upsert(k3.FILE_PATROL, "Kode Temuan",
+                   patrol_row("SP-20240502-002", Tanggal="2024-06-03", Status="Close"), columns)
+    k3._LOCAL_RESOURCES.clear()
+
+    may = storage.load(k3.FILE_PATROL, filters={"month": 5}, select=["Status"])
+    june = storage.load(k3.FILE_PATROL, filters={"month": 6}, select=["Status"])
+    assert list(may.columns) == ["Status", "_year", "_month"]
+    assert may["Status"].tolist() == ["Open"] and june["Status"].tolist() == ["Close"]
+
+    df = storage.load(k3.FILE_PATROL)
+    assert (df["_year"].dtype, df["_month"].dtype) == ("int16", "int8")
+    assert df["Catatan Progress"].dtype == object